@@ -1,7 +1,8 @@
+import argparse
 import logging
 
 from dotenv import find_dotenv, load_dotenv
-from preprocessor import create_vector_dbs, create_embeddings
+from preprocessor import create_vector_dbs, create_embeddings, update_vector_dbs
 
 load_dotenv(find_dotenv())
 
@@ -11,6 +12,14 @@ logging.basicConfig(
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only embed new or changed files and update the saved indices in place",
+    )
+    args = parser.parse_args()
+
     pdf_directory = "minutes_agendas_directory"
     cj_json_directory = "json_cj_directory"
     fc_json_directory = "json_fc_directory"
@@ -20,7 +29,8 @@ def main():
     general_embeddings, in_depth_embeddings = create_embeddings()
 
     # create_db_from_fc_youtube_urls(FC_INPUT_VIDEO_URLS)
-    create_vector_dbs(
+    build = update_vector_dbs if args.incremental else create_vector_dbs
+    build(
         fc_json_directory,
         cj_json_directory,
         pdf_directory,
@@ -0,0 +1,242 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_experimental.text_splitter import SemanticChunker, combine_sentences
+
+logger = logging.getLogger(__name__)
+
+# Sentences embedded per request batch, across as many messages as fit
+CHUNK_BATCH_SENTENCES = int(os.environ.get("CHUNK_BATCH_SENTENCES", 4096))
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", 4))
+# "embed" sends every chunk to the embedding model, "derive" averages the sentence
+# vectors already computed while chunking
+CHUNK_VECTORS = os.environ.get("CHUNK_VECTORS", "embed")
+# Only derive vectors of chunks up to this many characters, 0 for no limit
+DERIVED_CHUNK_MAX_CHARS = int(os.environ.get("DERIVED_CHUNK_MAX_CHARS", 0))
+
+
+def mean_vector(vectors, weights):
+    """Weighted mean of vectors, scaled to unit length like the model's own."""
+    mean = np.average(vectors, axis=0, weights=weights)
+    return (mean / max(np.linalg.norm(mean), 1e-12)).astype(np.float32)
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """Serves vectors embedded ahead of time, embedding any others on demand."""
+
+    def __init__(self, vectors, embeddings):
+        self.vectors = vectors
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        missing = [text for text in dict.fromkeys(texts) if text not in self.vectors]
+        if missing:
+            self.vectors.update(zip(missing, self.embeddings.embed_documents(missing)))
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+class ChunkingService:
+    """
+    Semantic chunking shared by all sources.
+
+    `SemanticChunker` embeds the sentences of one text per call. Here the
+    sentences of many messages, from many files, are embedded together in large
+    batches and the chunker then splits each message with the precomputed
+    vectors, so the chunks are the same as splitting one message at a time.
+    Sentence vectors go through the given embeddings, which cache them.
+
+    With `derive_vectors`, each chunk's vector is also derived from the vectors of
+    its sentences and kept until `ChunkEmbeddings` asks for it or
+    `clear_chunk_vectors` is called.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        batch_sentences=CHUNK_BATCH_SENTENCES,
+        max_workers=CHUNK_WORKERS,
+        derive_vectors=CHUNK_VECTORS == "derive",
+        derive_max_chars=DERIVED_CHUNK_MAX_CHARS,
+        **chunker_kwargs,
+    ):
+        self.embeddings = embeddings
+        self.batch_sentences = batch_sentences
+        self.derive_vectors = derive_vectors
+        self.derive_max_chars = derive_max_chars
+        self.chunk_vectors = {}
+        self.lock = threading.Lock()
+        self.chunker_kwargs = chunker_kwargs
+        self.splitter = SemanticChunker(embeddings, **chunker_kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def combined_sentences(self, text):
+        """The sentence windows `SemanticChunker` embeds for a text, if any."""
+        sentences = self.splitter._get_single_sentences_list(text)
+        if len(sentences) == 1 or (
+            self.splitter.breakpoint_threshold_type == "gradient" and len(sentences) == 2
+        ):
+            return []
+        windows = combine_sentences(
+            [{"sentence": sentence} for sentence in sentences],
+            self.splitter.buffer_size,
+        )
+        return [window["combined_sentence"] for window in windows]
+
+    def _split_batch(self, texts):
+        windows = list(
+            dict.fromkeys(
+                window for text in texts for window in self.combined_sentences(text)
+            )
+        )
+        vectors = {}
+        if windows:
+            embedded = self.embeddings.embed_documents(windows)
+            vectors = dict(zip(windows, np.asarray(embedded, dtype=np.float32)))
+        splitter = SemanticChunker(
+            PrecomputedEmbeddings(vectors, self.embeddings), **self.chunker_kwargs
+        )
+        chunks = [splitter.split_text(text) for text in texts]
+        if self.derive_vectors:
+            for text, text_chunks in zip(texts, chunks):
+                self._derive_chunk_vectors(text, text_chunks, vectors)
+        return chunks, len(windows)
+
+    def _derive_chunk_vectors(self, text, chunks, vectors):
+        """
+        Derive the vector of each chunk as the mean of the vectors of its
+        sentences' windows, weighted by sentence length.
+        """
+        windows = self.combined_sentences(text)
+        if not windows:
+            return
+        sentences = self.splitter._get_single_sentences_list(text)
+        derived = {}
+        start = 0
+        for chunk in chunks:
+            # Chunks are consecutive runs of sentences joined by single spaces
+            end, length = start, -1
+            while end < len(sentences) and length < len(chunk):
+                length += len(sentences[end]) + 1
+                end += 1
+            if " ".join(sentences[start:end]) != chunk:
+                # Not a plain join of sentences, leave the chunk to the model
+                return
+            if not self.derive_max_chars or len(chunk) <= self.derive_max_chars:
+                derived[chunk] = mean_vector(
+                    [vectors[window] for window in windows[start:end]],
+                    [max(len(sentence), 1) for sentence in sentences[start:end]],
+                )
+            start = end
+        with self.lock:
+            self.chunk_vectors.update(derived)
+
+    def take_chunk_vector(self, chunk):
+        """Pop the derived vector of a chunk, None if there is none."""
+        with self.lock:
+            return self.chunk_vectors.pop(chunk, None)
+
+    def clear_chunk_vectors(self):
+        """
+        Drop derived vectors that were never taken, e.g. of chunks that were
+        deduplicated, once the chunks they were derived for have been embedded.
+        """
+        with self.lock:
+            dropped = len(self.chunk_vectors)
+            self.chunk_vectors.clear()
+        if dropped:
+            logger.info(f"Dropped {dropped} derived chunk vectors that were not used")
+        return dropped
+
+    def _batches(self, texts):
+        batch, size = [], 0
+        for i, text in enumerate(texts):
+            count = len(self.splitter._get_single_sentences_list(text))
+            if batch and size + count > self.batch_sentences:
+                yield batch
+                batch, size = [], 0
+            batch.append(i)
+            size += count
+        if batch:
+            yield batch
+
+    def split_texts(self, texts):
+        """
+        :return: List of the chunks of each text.
+        """
+        start = time.time()
+        futures = [
+            self.executor.submit(self._split_batch, [texts[i] for i in batch])
+            for batch in self._batches(texts)
+        ]
+        chunks, sentences = [], 0
+        for future in futures:
+            batch_chunks, batch_sentences = future.result()
+            chunks.extend(batch_chunks)
+            sentences += batch_sentences
+
+        seconds = max(time.time() - start, 1e-9)
+        logger.info(
+            f"Chunked {len(texts)} texts into {sum(map(len, chunks))} chunks in "
+            f"{len(futures)} batches in {seconds:.1f}s: {len(texts) / seconds:.0f} "
+            f"texts/s, {sentences / seconds:.0f} sentences/s"
+        )
+        return chunks
+
+    def split_documents(self, docs):
+        """Split documents into chunks, each sharing its document's metadata."""
+        chunks = self.split_texts([doc.page_content for doc in docs])
+        return [
+            Document(page_content=chunk, metadata=doc.metadata)
+            for doc, doc_chunks in zip(docs, chunks)
+            for chunk in doc_chunks
+        ]
+
+    def chunk_files(self, paths, load_file):
+        """
+        Load files concurrently and chunk all their documents in shared batches.
+
+        :param load_file: Function loading the Documents of one file.
+        :return: List of chunk Documents, in file order.
+        """
+        loaded = list(self.executor.map(load_file, paths))
+        return self.split_documents([doc for docs in loaded for doc in docs])
+
+
+class ChunkEmbeddings(Embeddings):
+    """
+    Embeddings for chunks that use the vectors a `ChunkingService` derived while
+    chunking and only send the other chunks to the model.
+    """
+
+    def __init__(self, embeddings, chunking_service):
+        self.embeddings = embeddings
+        self.chunking_service = chunking_service
+
+    def embed_documents(self, texts):
+        """
+        :return: len(texts) x d float32 array.
+        """
+        vectors = [self.chunking_service.take_chunk_vector(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        if len(missing) < len(texts):
+            logger.info(
+                f"Derived {len(texts) - len(missing)} of {len(texts)} chunk vectors "
+                f"from sentence vectors"
+            )
+        return np.asarray(vectors, dtype=np.float32)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
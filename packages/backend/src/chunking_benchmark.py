@@ -0,0 +1,104 @@
+"""
+Benchmark semantic chunking throughput offline on a synthetic corpus, comparing
+one SemanticChunker call per message with the shared chunking service.
+
+    python src/chunking_benchmark.py --messages 500 --sentences 40
+"""
+import argparse
+import logging
+import random
+import tempfile
+import time
+
+from langchain_experimental.text_splitter import SemanticChunker
+
+from chunking import ChunkEmbeddings, ChunkingService
+from embedding_benchmark import WORDS, LocalFakeEmbeddings
+from embedding_cache import CachedEmbeddings
+from embedding_executor import ParallelEmbeddings
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_messages(count, sentences_per_message, seed=0):
+    rng = random.Random(seed)
+
+    def sentence():
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 24))]
+        return " ".join(words).capitalize() + rng.choice(".?!")
+
+    return [
+        " ".join(sentence() for _ in range(sentences_per_message))
+        for _ in range(count)
+    ]
+
+
+def report(name, texts, sentences, requests, seconds):
+    print(
+        f"{name:>16}: {len(texts) / seconds:8.1f} messages/s "
+        f"{sentences / seconds:9.0f} sentences/s {seconds:7.2f}s, "
+        f"{requests} embedding requests"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--sentences", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per request")
+    parser.add_argument(
+        "--derive-max-chars",
+        type=int,
+        default=0,
+        help="Largest chunk whose vector is derived from its sentences, 0 for all",
+    )
+    args = parser.parse_args()
+
+    texts = synthetic_messages(args.messages, args.sentences)
+    sentences = args.messages * args.sentences
+
+    # Every message embedded in its own request, as with a chunker per file
+    fake = LocalFakeEmbeddings(size=256, latency=args.latency)
+    chunker = SemanticChunker(ParallelEmbeddings(fake, max_concurrency=1))
+    start = time.time()
+    expected = [chunker.split_text(text) for text in texts]
+    report("per message", texts, sentences, fake.requests, time.time() - start)
+
+    with tempfile.TemporaryDirectory() as folder:
+        fake = LocalFakeEmbeddings(size=256, latency=args.latency)
+        service = ChunkingService(CachedEmbeddings(ParallelEmbeddings(fake), folder))
+        for name in ("shared service", "sentence cache"):
+            requests = fake.requests
+            start = time.time()
+            chunks = service.split_texts(texts)
+            report(name, texts, sentences, fake.requests - requests, time.time() - start)
+            if chunks != expected:
+                raise AssertionError(f"{name} chunks differ from SemanticChunker")
+
+    # Vectors for the chunks themselves, embedded again or derived from the
+    # sentence vectors computed while chunking
+    chunk_texts = [chunk for text_chunks in expected for chunk in text_chunks]
+    for derive in (False, True):
+        fake = LocalFakeEmbeddings(size=256, latency=args.latency)
+        counting = ParallelEmbeddings(fake)
+        service = ChunkingService(
+            counting, derive_vectors=derive, derive_max_chars=args.derive_max_chars
+        )
+        start = time.time()
+        service.split_texts(texts)
+        sentence_texts = counting.last_report["chunks"]
+        counting.last_report = None
+        ChunkEmbeddings(counting, service).embed_documents(chunk_texts)
+        chunk_embedded = counting.last_report["chunks"] if counting.last_report else 0
+        print(
+            f"{'derived' if derive else 'embedded':>16}: {time.time() - start:7.2f}s, "
+            f"{sentence_texts} sentence and {chunk_embedded} of {len(chunk_texts)} "
+            f"chunk texts sent to the model"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s - %(message)s", level=logging.WARNING
+    )
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark the embedding pipeline offline against a fake embedder that simulates
+request latency and rate limiting.
+
+    python src/embedding_benchmark.py --chunks 20000 --rate-limit 4
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import random
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_executor import (
+    EMBED_BATCH_SIZE,
+    EMBED_CONCURRENCY,
+    ParallelEmbeddings,
+)
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "council motion ordinance budget police surveillance zoning permit hearing "
+    "public comment resolution district vote amendment contract housing drainage "
+    "street lights cameras committee member president agenda minutes item"
+).split()
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+
+class LocalFakeEmbeddings(Embeddings):
+    """
+    Deterministic embeddings computed locally from a hash of the text.
+
+    Each call to `aembed_documents` is treated as one API request: it sleeps for a
+    fixed latency plus a per text cost, and fails with a 429 when more than
+    `rate_limit` requests are in flight.
+    """
+
+    model = "local-fake"
+
+    def __init__(self, size=1536, latency=0.2, per_text=0.0002, rate_limit=None):
+        self.size = size
+        self.latency = latency
+        self.per_text = per_text
+        self.rate_limit = rate_limit
+        self.in_flight = 0
+        self.requests = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size, dtype=np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    async def aembed_documents(self, texts):
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+            if self.rate_limit is not None and self.in_flight > self.rate_limit:
+                raise FakeRateLimitError(f"{self.in_flight} concurrent requests")
+            await asyncio.sleep(self.per_text * len(texts))
+            return self.embed_documents(texts)
+        finally:
+            self.in_flight -= 1
+
+
+def synthetic_chunks(count, words_per_chunk=120, seed=0):
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(words_per_chunk)) + f" {i}"
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per request")
+    parser.add_argument(
+        "--rate-limit", type=int, default=None, help="Concurrent requests before a 429"
+    )
+    args = parser.parse_args()
+
+    texts = synthetic_chunks(args.chunks)
+    fake = LocalFakeEmbeddings(size=256, latency=args.latency, rate_limit=args.rate_limit)
+
+    # One request after another, as when sources are embedded in sequence
+    serial = ParallelEmbeddings(
+        fake, batch_size=args.batch_size, max_concurrency=1, retry_delay=0.1
+    )
+    serial.embed_documents(texts)
+
+    parallel = ParallelEmbeddings(
+        fake,
+        batch_size=args.batch_size,
+        max_concurrency=args.concurrency,
+        retry_delay=0.1,
+    )
+    parallel.embed_documents(texts)
+
+    for name, embeddings in (("serial", serial), ("parallel", parallel)):
+        report = embeddings.last_report
+        print(
+            f"{name:>8}: {report['chunks_per_second']:8.0f} chunks/s "
+            f"{report['tokens_per_second']:10.0f} tokens/s "
+            f"{report['seconds']:6.2f}s, {report['rate_limited']} rate limited, "
+            f"concurrency down to {report['lowest_concurrency']}"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s - %(message)s", level=logging.WARNING
+    )
+    main()
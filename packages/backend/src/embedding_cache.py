@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_executor import ParallelEmbeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_DIR = os.environ.get(
+    "EMBEDDING_CACHE_DIR", Path(__file__).parent.joinpath("cache", "embeddings")
+)
+
+KEYS_FILE = "keys.bin"
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.json"
+KEY_SIZE = hashlib.sha256().digest_size
+
+
+def embedding_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """
+    Append-only store of embeddings on disk, keyed by SHA-256 digest.
+
+    Row i of the float32 matrix in vectors.f32 holds the vector whose 32 byte key
+    is at offset 32 * i of keys.bin. The matrix is memory-mapped, so only the rows
+    looked up are read.
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.keys_path = self.folder.joinpath(KEYS_FILE)
+        self.vectors_path = self.folder.joinpath(VECTORS_FILE)
+        self.meta_path = self.folder.joinpath(META_FILE)
+        self.lock = threading.Lock()
+        self.dimension = None
+        self.rows = {}
+        self.vectors = None
+        if self.meta_path.exists():
+            with open(self.meta_path) as f:
+                self.dimension = json.load(f)["dimension"]
+            self._load()
+
+    def _load(self):
+        key_rows = os.path.getsize(self.keys_path) // KEY_SIZE
+        vector_rows = os.path.getsize(self.vectors_path) // (4 * self.dimension)
+        count = min(key_rows, vector_rows)
+        if key_rows != vector_rows:
+            # An interrupted append, drop the incomplete rows so files stay aligned
+            logger.warning(
+                f"Embedding store {self.folder} has {key_rows} keys and {vector_rows} "
+                f"vectors, truncating to {count}"
+            )
+        os.truncate(self.keys_path, count * KEY_SIZE)
+        os.truncate(self.vectors_path, count * 4 * self.dimension)
+
+        keys = np.fromfile(self.keys_path, dtype=f"S{KEY_SIZE}")
+        self.rows = {key: row for row, key in enumerate(keys.tolist())}
+        self._map(count)
+
+    def _map(self, count):
+        self.vectors = (
+            np.memmap(
+                self.vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(count, self.dimension),
+            )
+            if count
+            else None
+        )
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get_many(self, keys):
+        """:return: Dictionary of key to vector for the keys found."""
+        with self.lock:
+            found = [(key, self.rows[key]) for key in keys if key in self.rows]
+            if not found:
+                return {}
+            rows = np.array([row for _, row in found])
+            vectors = np.asarray(self.vectors[rows])
+        return {key: vector for (key, _), vector in zip(found, vectors)}
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock:
+            new = [i for i, key in enumerate(keys) if key not in self.rows]
+            # The same text can appear twice in one batch
+            new = list({keys[i]: i for i in new}.values())
+            if not new:
+                return
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dimension": self.dimension}, f)
+                self.keys_path.touch()
+                self.vectors_path.touch()
+
+            # Vectors are written before keys, so a key on disk always has its row
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors[new].tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(keys[i] for i in new))
+
+            for i in new:
+                self.rows[keys[i]] = len(self.rows)
+            self._map(len(self.rows))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings that look up document chunks in an `EmbeddingStore` by the SHA-256
+    of (model, text) and only send the texts not seen before to the model.
+
+    With `ParallelEmbeddings`, each batch is stored as soon as it is embedded, so
+    a run that fails part way keeps the vectors it already paid for.
+    """
+
+    def __init__(self, embeddings, folder=EMBEDDING_CACHE_DIR, model=None):
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+        # One store per model, as models differ in dimension
+        self.store = EmbeddingStore(
+            Path(folder).joinpath(re.sub(r"[^\w.-]", "_", self.model))
+        )
+
+    def embed_documents(self, texts):
+        """
+        :return: len(texts) x d float32 array.
+        """
+        keys = [embedding_key(self.model, text) for text in texts]
+        cached = self.store.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            missing_keys = list(missing)
+
+            def store(offset, vectors):
+                batch_keys = missing_keys[offset : offset + len(vectors)]
+                self.store.put_many(batch_keys, vectors)
+                cached.update(zip(batch_keys, np.asarray(vectors, dtype=np.float32)))
+
+            if isinstance(self.embeddings, ParallelEmbeddings):
+                self.embeddings.embed_documents(list(missing.values()), on_batch=store)
+            else:
+                store(0, self.embeddings.embed_documents(list(missing.values())))
+
+        hits = sum(key not in missing for key in keys)
+        logger.info(
+            f"Embedded {len(texts)} texts: {hits} from cache, {len(missing)} with "
+            f"{self.model}"
+        )
+        if not keys:
+            return np.empty((0, self.store.dimension or 0), dtype=np.float32)
+        return np.stack([cached[key] for key in keys])
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
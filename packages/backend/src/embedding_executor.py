@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Texts per embedding request, OpenAI accepts up to 2048
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 512))
+# Upper bound on requests in flight, lowered while the API rate limits us
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", 8))
+EMBED_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", 6))
+EMBED_RETRY_DELAY = float(os.environ.get("EMBED_RETRY_DELAY", 1.0))
+
+CHARS_PER_TOKEN = 4
+
+
+def is_rate_limit(error):
+    """True for 429 responses, e.g. openai.RateLimitError."""
+    return (
+        getattr(error, "status_code", None) == 429
+        or "RateLimit" in type(error).__name__
+    )
+
+
+def token_counter(model):
+    """Token counting function for a model, estimated from characters if tiktoken can't load."""
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer for {model}, estimating tokens: {e}")
+        return lambda text: len(text) // CHARS_PER_TOKEN + 1
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit that halves when requests are rate limited and grows by one
+    after a limit's worth of successful requests (AIMD).
+
+    Requests in flight together tend to be rate limited together, so the limit
+    halves at most once per window: a 429 only lowers it if the request started
+    after the last decrease.
+    """
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = maximum
+        self.lowest = maximum
+        self.in_flight = 0
+        self.successes = 0
+        self.decreases = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        """:return: Token to pass back to `release`."""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+            return self.decreases
+
+    async def release(self, token, rate_limited=False):
+        async with self.condition:
+            self.in_flight -= 1
+            if rate_limited:
+                if token == self.decreases:
+                    self.limit = max(1, self.limit // 2)
+                    self.lowest = min(self.lowest, self.limit)
+                    self.decreases += 1
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+
+class ParallelEmbeddings(Embeddings):
+    """
+    Embeddings that split documents into large batches and embed them with a
+    bounded pool of concurrent requests, backing off when rate limited.
+
+    The wrapped embeddings should not retry rate limits themselves, otherwise the
+    pool can't see them and adapt.
+
+    Synchronous calls, from any thread, run on one long-lived event loop in a
+    background thread. The wrapped async client binds its connections to the
+    loop it first runs on, so a new `asyncio.run` loop per call would leave it
+    with connections on a closed loop.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        batch_size=EMBED_BATCH_SIZE,
+        max_concurrency=EMBED_CONCURRENCY,
+        max_retries=EMBED_MAX_RETRIES,
+        retry_delay=EMBED_RETRY_DELAY,
+    ):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.count_tokens = None
+        self.last_report = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _run(self, coro):
+        """Run a coroutine on the embedding loop and block until it finishes."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="embedding-loop", daemon=True
+                ).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _embed_batch(self, batch, limit, stats):
+        for attempt in range(self.max_retries + 1):
+            token = await limit.acquire()
+            try:
+                vectors = await self.embeddings.aembed_documents(batch)
+            except Exception as e:
+                rate_limited = is_rate_limit(e)
+                await limit.release(token, rate_limited)
+                stats["rate_limited" if rate_limited else "errors"] += 1
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_delay * 2**attempt * (1 + random.random())
+                logger.warning(
+                    f"Embedding batch of {len(batch)} failed ({type(e).__name__}), "
+                    f"retrying in {delay:.1f}s with concurrency {limit.limit}"
+                )
+                await asyncio.sleep(delay)
+            else:
+                await limit.release(token)
+                return np.asarray(vectors, dtype=np.float32)
+
+    async def aembed_documents(self, texts, on_batch=None):
+        """
+        :param on_batch: Optional function called with (offset of the batch in
+            texts, its vectors) as each batch completes, e.g. to store them.
+        :return: len(texts) x d float32 array.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        start = time.time()
+        limit = AdaptiveLimit(self.max_concurrency)
+        stats = {"rate_limited": 0, "errors": 0}
+
+        async def embed(offset):
+            vectors = await self._embed_batch(
+                texts[offset : offset + self.batch_size], limit, stats
+            )
+            if on_batch is not None:
+                on_batch(offset, vectors)
+            return vectors
+
+        batches = range(0, len(texts), self.batch_size)
+        results = await asyncio.gather(*(embed(offset) for offset in batches))
+
+        if self.count_tokens is None:
+            self.count_tokens = token_counter(self.model)
+        tokens = sum(self.count_tokens(text) for text in texts)
+        seconds = max(time.time() - start, 1e-9)
+        self.last_report = {
+            "chunks": len(texts),
+            "tokens": tokens,
+            "batches": len(batches),
+            "seconds": seconds,
+            "chunks_per_second": len(texts) / seconds,
+            "tokens_per_second": tokens / seconds,
+            "lowest_concurrency": limit.lowest,
+            **stats,
+        }
+        logger.info(
+            f"Embedded {len(texts)} chunks ({tokens} tokens) in {len(batches)} batches "
+            f"in {seconds:.1f}s: {len(texts) / seconds:.0f} chunks/s, "
+            f"{tokens / seconds:.0f} tokens/s, {stats['rate_limited']} rate limited, "
+            f"concurrency down to {limit.lowest}"
+        )
+        return np.concatenate(results)
+
+    def embed_documents(self, texts, on_batch=None):
+        return self._run(self.aembed_documents(texts, on_batch))
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text):
+        return await self.embeddings.aembed_query(text)
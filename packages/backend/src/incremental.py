@@ -0,0 +1,168 @@
+import logging
+import os
+import shutil
+from pathlib import Path
+
+from langchain_community.vectorstores.faiss import FAISS
+
+from sharding import (
+    INGEST_MANIFEST_FILE,
+    SHARD_MANIFEST_FILE,
+    SHARDS_DIR,
+    file_hashes,
+    new_ids,
+    read_json,
+    record_files,
+    save_shard,
+    save_sharded_faiss,
+    shard_name,
+    write_json,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def changed_files(json_paths, ingested):
+    """
+    Compare source files against the ingest manifest.
+
+    :param json_paths: Paths of the source files currently on disk.
+    :param ingested: The "files" section of the ingest manifest.
+    :return: Tuple of (dictionary of path to sha256 of new or modified files, keys of files to remove from the index).
+    """
+    current = {os.path.basename(path): path for path in json_paths}
+    hashes = file_hashes(path for _, path in sorted(current.items()))
+    changed = {
+        path: sha256
+        for path, sha256 in hashes.items()
+        if ingested.get(os.path.basename(path), {}).get("sha256") != sha256
+    }
+    # Modified files are removed and added again
+    stale = [key for key in ingested if key not in current]
+    stale.extend(
+        key for key in map(os.path.basename, changed) if key in ingested
+    )
+    return changed, stale
+
+
+def _update_shard(shard_dir, embeddings, delete_ids, added):
+    """
+    Delete and add documents in one saved shard.
+
+    :param added: List of (Document, vector, docstore id) tuples.
+    :return: The updated FAISS store, or None if the shard is now empty.
+    """
+    db = None
+    if shard_dir.joinpath("index.faiss").exists():
+        db = FAISS.load_local(
+            shard_dir, embeddings, allow_dangerous_deserialization=True
+        )
+        present = set(db.index_to_docstore_id.values())
+        deleted = [doc_id for doc_id in delete_ids if doc_id in present]
+        if deleted:
+            db.delete(deleted)
+
+    if added:
+        text_embeddings = [(doc.page_content, vector) for doc, vector, _ in added]
+        metadatas = [doc.metadata for doc, _, _ in added]
+        ids = [doc_id for _, _, doc_id in added]
+        if db is None:
+            db = FAISS.from_embeddings(
+                text_embeddings, embeddings, metadatas=metadatas, ids=ids
+            )
+        else:
+            db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+    if db is None or db.index.ntotal == 0:
+        return None
+    return db
+
+
+def _swap_folders(folder_path, staging_path):
+    # Two renames, so the index folder is only missing for an instant and is never
+    # half-written
+    old_path = folder_path.with_name(folder_path.name + ".old")
+    shutil.rmtree(old_path, ignore_errors=True)
+    os.rename(folder_path, old_path)
+    os.rename(staging_path, folder_path)
+    shutil.rmtree(old_path)
+
+
+def update_sharded_faiss(json_paths, load_files, embeddings, doc_type, folder_path):
+    """
+    Bring the sharded FAISS index of one source up to date with its files,
+    embedding only files that are new or whose content changed.
+
+    Chunks of modified and deleted files are removed from their shards, chunks of
+    new and modified files are added, and only the affected shards are rewritten.
+    The update is written to a staging copy of the folder which then replaces it,
+    so an interrupted run leaves the previous index intact. Falls back to a full
+    build if the folder has no ingest manifest.
+
+    :param json_paths: Paths of all source files of this document type.
+    :param load_files: Function loading the chunked Documents of a list of files.
+    :return: Number of documents added and removed.
+    """
+    folder_path = Path(folder_path)
+    shard_manifest_path = folder_path.joinpath(SHARD_MANIFEST_FILE)
+    ingest_manifest_path = folder_path.joinpath(INGEST_MANIFEST_FILE)
+    if not (shard_manifest_path.exists() and ingest_manifest_path.exists()):
+        logger.info(f"No ingest manifest in {folder_path}, building {doc_type} in full")
+        hashes = file_hashes(json_paths)
+        docs = load_files(json_paths)
+        save_sharded_faiss(docs, embeddings, doc_type, folder_path, hashes=hashes)
+        return len(docs), 0
+
+    ingest = read_json(ingest_manifest_path)
+    changed, stale = changed_files(json_paths, ingest["files"])
+    if not changed and not stale:
+        logger.info(f"{doc_type} index is up to date")
+        return 0, 0
+
+    delete_ids = {}
+    for key in stale:
+        for name, ids in ingest["files"].pop(key)["ids"].items():
+            delete_ids.setdefault(name, set()).update(ids)
+
+    docs = load_files(list(changed))
+    vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+    ids = new_ids(len(docs))
+    added = {}
+    for doc, vector, doc_id in zip(docs, vectors, ids):
+        added.setdefault(shard_name(doc), []).append((doc, vector, doc_id))
+
+    staging_path = folder_path.with_name(folder_path.name + ".staging")
+    shutil.rmtree(staging_path, ignore_errors=True)
+    # Hard links make the copy cheap; every file that changes is rewritten, not
+    # modified in place, so the live folder is untouched
+    shutil.copytree(folder_path, staging_path, copy_function=os.link)
+
+    shard_manifest = read_json(shard_manifest_path)
+    entries = {entry["name"]: entry for entry in shard_manifest["shards"]}
+    for name in sorted(set(delete_ids) | set(added)):
+        shard_dir = staging_path.joinpath(SHARDS_DIR, name)
+        db = _update_shard(
+            shard_dir, embeddings, delete_ids.get(name, set()), added.get(name, [])
+        )
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        if db is None:
+            entries.pop(name, None)
+            logger.info(f"Removed empty {doc_type} shard {name}")
+            continue
+        entries[name] = save_shard(db, doc_type, shard_dir)
+        logger.info(
+            f"Updated {doc_type} shard {name}, now {entries[name]['documents']} documents"
+        )
+
+    shard_manifest["shards"] = [entries[name] for name in sorted(entries)]
+    write_json(staging_path.joinpath(SHARD_MANIFEST_FILE), shard_manifest)
+    record_files(ingest["files"], changed, docs, ids)
+    write_json(staging_path.joinpath(INGEST_MANIFEST_FILE), ingest)
+    _swap_folders(folder_path, staging_path)
+
+    removed = sum(len(ids) for ids in delete_ids.values())
+    logger.info(
+        f"Incremental {doc_type} update: {len(changed)} new or modified files, "
+        f"{len(docs)} documents added, {removed} removed"
+    )
+    return len(docs), removed
@@ -0,0 +1,66 @@
+import logging
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_INDEX_FILE = "index.keyword.npz"
+
+# Keeps ordinance numbers such as "34,462" or "R-23-158" together as one token.
+# Stored in the index so getanswer tokenizes queries the same way.
+TOKEN_PATTERN = r"\w+(?:[.,\-/]\w+)*"
+
+
+def tokenize(text, pattern=TOKEN_PATTERN):
+    return re.findall(pattern, text.lower())
+
+
+def build_keyword_index(texts):
+    """
+    Build an inverted index over chunk texts for BM25 scoring.
+
+    Document ids are positions in `texts`, which match the vector ids of a FAISS
+    index built from the same documents in the same order.
+
+    :return: Dictionary of arrays in the layout read by getanswer's `KeywordIndex`.
+    """
+    postings = {}
+    doc_lengths = np.zeros(len(texts), dtype=np.int32)
+    for doc_id, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        doc_lengths[doc_id] = sum(counts.values())
+        for term, count in counts.items():
+            postings.setdefault(term, []).append((doc_id, count))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+    doc_ids = np.empty(offsets[-1], dtype=np.int32)
+    term_freqs = np.empty(offsets[-1], dtype=np.int32)
+    for i, term in enumerate(terms):
+        doc_ids[offsets[i] : offsets[i + 1]], term_freqs[offsets[i] : offsets[i + 1]] = zip(
+            *postings[term]
+        )
+
+    return {
+        "terms": np.array(terms, dtype=str),
+        "offsets": offsets,
+        "doc_ids": doc_ids,
+        "term_freqs": term_freqs,
+        "doc_lengths": doc_lengths,
+        "token_pattern": np.array(TOKEN_PATTERN),
+    }
+
+
+def save_keyword_index(texts, folder_path):
+    index = build_keyword_index(texts)
+    path = Path(folder_path).joinpath(KEYWORD_INDEX_FILE)
+    np.savez(path, **index)
+    logger.info(
+        f"Keyword index with {len(index['terms'])} terms over {len(texts)} "
+        f"documents saved to {path}"
+    )
+    return path
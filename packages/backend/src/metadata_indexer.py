@@ -0,0 +1,99 @@
+import logging
+import os
+import re
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METADATA_INDEX_FILE = "index.metadata.npz"
+
+# Transcripts use 11/16/2023, minutes and agendas 6-7-2018
+PUBLISH_DATE_PATTERN = re.compile(r"^\s*(\d{1,2})[/-](\d{1,2})[/-](\d{4})\s*$")
+
+
+def parse_publish_date(value):
+    """Parse an M/D/YYYY or M-D-YYYY publish date, returning None if it isn't one."""
+    if not isinstance(value, str):
+        return None
+    match = PUBLISH_DATE_PATTERN.match(value)
+    if match is None:
+        return None
+    month, day, year = (int(part) for part in match.groups())
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def format_publish_date(value):
+    """Normalize a publish date to MM/DD/YYYY for citations."""
+    parsed = parse_publish_date(value)
+    if parsed is not None:
+        return parsed.strftime("%m/%d/%Y")
+    return "Invalid date format" if value else "date not available"
+
+
+def timestamp_seconds(timestamp):
+    """Start of an "H:MM:SS-H:MM:SS" or "MM:SS" video timestamp in seconds."""
+    if not isinstance(timestamp, str) or "not available" in timestamp:
+        return None
+    try:
+        parts = [int(part) for part in timestamp.split("-")[0].strip().split(":")]
+    except ValueError:
+        return None
+    if not 1 <= len(parts) <= 3:
+        return None
+    return sum(part * 60**i for i, part in enumerate(reversed(parts)))
+
+
+def add_citation_record(metadata):
+    """
+    Store the citation shown for a chunk, and its video offset in seconds, in its
+    metadata so getanswer doesn't have to rebuild it on every request.
+    """
+    metadata["citation"] = {
+        "Title": metadata.get("title", metadata.get("source", "")),
+        "Published": format_publish_date(metadata.get("publish_date")),
+        "URL": metadata.get("url", "url not available"),
+        "Video timestamp": metadata.get("timestamp", "timestamp not available"),
+        "Name": os.path.basename(metadata.get("source", "source not available")),
+        "Page Number": metadata.get("page_number"),
+    }
+    metadata["timestamp_seconds"] = timestamp_seconds(metadata.get("timestamp"))
+    return metadata
+
+
+def build_metadata_index(docs, source_type):
+    """
+    Build columnar per-vector metadata for documents indexed in this order.
+
+    :return: Dictionary of arrays in the layout read by getanswer's `MetadataIndex`.
+    """
+    publish_dates = np.array(
+        [
+            parse_publish_date(doc.metadata.get("publish_date")) or np.datetime64("NaT")
+            for doc in docs
+        ],
+        dtype="datetime64[D]",
+    )
+    titles = np.array([str(doc.metadata.get("title") or "") for doc in docs], dtype=str)
+    return {
+        "publish_dates": publish_dates,
+        "titles": titles,
+        "source_type": np.array(source_type),
+    }
+
+
+def save_metadata_index(docs, source_type, folder_path):
+    index = build_metadata_index(docs, source_type)
+    path = Path(folder_path).joinpath(METADATA_INDEX_FILE)
+    np.savez(path, **index)
+    dated = int((~np.isnat(index["publish_dates"])).sum())
+    logger.info(
+        f"Metadata index for {len(docs)} {source_type} documents ({dated} dated) "
+        f"saved to {path}"
+    )
+    return path
@@ -9,18 +9,40 @@ from langchain_community.vectorstores.faiss import FAISS
 from langchain_openai import OpenAI
 from pathlib import Path
 import shutil
-from langchain_experimental.text_splitter import SemanticChunker
-from langchain.docstore.document import Document
+from functools import lru_cache, partial
+
+from chunking import ChunkEmbeddings, ChunkingService
+from metadata_indexer import add_citation_record
+from embedding_cache import CachedEmbeddings
+from embedding_executor import ParallelEmbeddings
+from incremental import update_sharded_faiss
+from sharding import file_hashes, save_sharded_faiss
 
 
 logger = logging.getLogger(__name__)
 dir = Path(__file__).parent.absolute()
 
 
+@lru_cache(maxsize=None)
+def indexing_embeddings():
+    """
+    Embeddings for sentences and chunks. Texts embedded by an earlier run are read
+    from disk instead, the rest are embedded in concurrent batches. Rate limits
+    are retried by the batch pool.
+    """
+    return CachedEmbeddings(ParallelEmbeddings(OpenAIEmbeddings(max_retries=0)))
+
+
+@lru_cache(maxsize=None)
+def chunking_service():
+    return ChunkingService(indexing_embeddings())
+
+
 def create_embeddings():
     llm = OpenAI()
 
-    base_embeddings = OpenAIEmbeddings()
+    # Uses chunk vectors derived from sentence vectors when CHUNK_VECTORS=derive
+    base_embeddings = ChunkEmbeddings(indexing_embeddings(), chunking_service())
 
     general_prompt_template = """
     As an AI assistant, your role is to provide concise, balanced summaries from the transcripts of New Orleans City Council meetings in response to the user's query "{user_query}". Your response should not exceed one paragraph in length. If the available information from the transcripts is insufficient to accurately summarize the issue, respond with 'Insufficient information available.' If the user's query extends beyond the scope of information contained in the transcripts, state 'I don't know.'
@@ -59,30 +81,52 @@ def metadata_func_minutes_and_agendas(record: dict, metadata: dict) -> dict:
     return metadata
 
 
+def load_json_file(doc_path, metadata_func):
+    """Load the messages of one JSON file as Documents."""
+    loader = JSONLoader(
+        file_path=doc_path,
+        jq_schema=".messages[]",
+        content_key="page_content",
+        metadata_func=metadata_func,
+    )
+    return loader.load()
+
+
+def chunk_json_files(doc_paths, metadata_func):
+    """Split the messages of JSON files into semantic chunks, batched across files."""
+    docs = chunking_service().chunk_files(
+        doc_paths, partial(load_json_file, metadata_func=metadata_func)
+    )
+    for doc in docs:
+        logger.debug(f"Content: {doc.page_content}\nMetadata: {doc.metadata}\n")
+    return docs
+
+
+def add_citation_records(docs):
+    # Chunks of one message may share a metadata dict, process each dict once
+    for metadata in {id(doc.metadata): doc.metadata for doc in docs}.values():
+        add_citation_record(metadata)
+    return docs
+
+
+def load_source_files(doc_paths, metadata_func):
+    """Chunk JSON files into Documents ready to be indexed."""
+    return add_citation_records(chunk_json_files(doc_paths, metadata_func))
+
+
+def json_files(directory):
+    return [
+        os.path.join(directory, doc_file)
+        for doc_file in os.listdir(directory)
+        if doc_file.endswith(".json")
+    ]
+
+
 def create_db_from_minutes_and_agendas(doc_directory):
     logger.info("Creating database from minutes...")
-    all_docs = []
-    for doc_file in os.listdir(doc_directory):
-        if not doc_file.endswith(".json"):
-            continue
-        doc_path = os.path.join(doc_directory, doc_file)
-        loader = JSONLoader(
-            file_path=doc_path,
-            jq_schema=".messages[]",
-            content_key="page_content",
-            metadata_func=metadata_func_minutes_and_agendas,
-        )
-
-        data = loader.load()
-        text_splitter = SemanticChunker(OpenAIEmbeddings())
-        for doc in data:
-            chunks = text_splitter.split_text(doc.page_content)
-            for chunk in chunks:
-                new_doc = Document(page_content=chunk, metadata=doc.metadata)
-                print(
-                    f"Content: {new_doc.page_content}\nMetadata: {new_doc.metadata}\n"
-                )
-                all_docs.append(new_doc)
+    all_docs = chunk_json_files(
+        json_files(doc_directory), metadata_func_minutes_and_agendas
+    )
     logger.info("Finished database from minutes...")
     return all_docs
 
@@ -95,28 +139,7 @@ def metadata_news(record: dict, metadata: dict) -> dict:
 
 def create_db_from_news_transcripts(news_json_directory):
     logger.info("Creating database from CJ transcripts...")
-    all_docs = []
-    for doc_file in os.listdir(news_json_directory):
-        if not doc_file.endswith(".json"):
-            continue
-        doc_path = os.path.join(news_json_directory, doc_file)
-        loader = JSONLoader(
-            file_path=doc_path,
-            jq_schema=".messages[]",
-            content_key="page_content",
-            metadata_func=metadata_news,
-        )
-
-        data = loader.load()
-        text_splitter = SemanticChunker(OpenAIEmbeddings())
-        for doc in data:
-            chunks = text_splitter.split_text(doc.page_content)
-            for chunk in chunks:
-                new_doc = Document(page_content=chunk, metadata=doc.metadata)
-                print(
-                    f"Content: {new_doc.page_content}\nMetadata: {new_doc.metadata}\n"
-                )
-                all_docs.append(new_doc)
+    all_docs = chunk_json_files(json_files(news_json_directory), metadata_news)
     logger.info("Finished database from news transcripts...")
     return all_docs
 
@@ -132,28 +155,7 @@ def metadata_func(record: dict, metadata: dict) -> dict:
 
 def create_db_from_cj_transcripts(cj_json_directory):
     logger.info("Creating database from CJ transcripts...")
-    all_docs = []
-    for doc_file in os.listdir(cj_json_directory):
-        if not doc_file.endswith(".json"):
-            continue
-        doc_path = os.path.join(cj_json_directory, doc_file)
-        loader = JSONLoader(
-            file_path=doc_path,
-            jq_schema=".messages[]",
-            content_key="page_content",
-            metadata_func=metadata_func,
-        )
-
-        data = loader.load()
-        text_splitter = SemanticChunker(OpenAIEmbeddings())
-        for doc in data:
-            chunks = text_splitter.split_text(doc.page_content)
-            for chunk in chunks:
-                new_doc = Document(page_content=chunk, metadata=doc.metadata)
-                print(
-                    f"Content: {new_doc.page_content}\nMetadata: {new_doc.metadata}\n"
-                )
-                all_docs.append(new_doc)
+    all_docs = chunk_json_files(json_files(cj_json_directory), metadata_func)
 
     logger.info("Finished database from CJ transcripts...")
     return all_docs
@@ -161,60 +163,66 @@ def create_db_from_cj_transcripts(cj_json_directory):
 
 def create_db_from_fc_transcripts(fc_json_directory):
     logger.info("Creating database from FC transcripts...")
-    all_docs = []
-    for doc_file in os.listdir(fc_json_directory):
-        if not doc_file.endswith(".json"):
-            continue
-        doc_path = os.path.join(fc_json_directory, doc_file)
-        loader = JSONLoader(
-            file_path=doc_path,
-            jq_schema=".messages[]",
-            content_key="page_content",
-            metadata_func=metadata_func,
-        )
-
-        data = loader.load()
-        text_splitter = SemanticChunker(OpenAIEmbeddings())
-        for doc in data:
-            chunks = text_splitter.split_text(doc.page_content)
-            for chunk in chunks:
-                new_doc = Document(page_content=chunk, metadata=doc.metadata)
-                print(
-                    f"Content: {new_doc.page_content}\nMetadata: {new_doc.metadata}\n"
-                )
-                all_docs.append(new_doc)
+    all_docs = chunk_json_files(json_files(fc_json_directory), metadata_func)
     logger.info("Finished database from news transcripts...")
     return all_docs
 
 
 def create_db_from_public_comments(pc_json_directory):
     logger.info("Creating database from FC transcripts...")
-    all_docs = []
-    for doc_file in os.listdir(pc_json_directory):
-        if not doc_file.endswith(".json"):
-            continue
-        doc_path = os.path.join(pc_json_directory, doc_file)
-        loader = JSONLoader(
-            file_path=doc_path,
-            jq_schema=".messages[]",
-            content_key="page_content",
-            metadata_func=metadata_func,
-        )
-
-        data = loader.load()
-        text_splitter = SemanticChunker(OpenAIEmbeddings())
-        for doc in data:
-            chunks = text_splitter.split_text(doc.page_content)
-            for chunk in chunks:
-                new_doc = Document(page_content=chunk, metadata=doc.metadata)
-                print(
-                    f"Content: {new_doc.page_content}\nMetadata: {new_doc.metadata}\n"
-                )
-                all_docs.append(new_doc)
+    all_docs = chunk_json_files(json_files(pc_json_directory), metadata_func)
     logger.info("Finished database from Public Comments...")
     return all_docs
 
 
+def local_index_dir(doc_type):
+    return dir.joinpath("cache", f"faiss_index_in_depth_{doc_type}")
+
+
+def copy_to_cloud(local_save_dir, doc_type):
+    cloud_dir = dir.parent.parent.joinpath(
+        f"googlecloud/functions/getanswer/cache/faiss_index_in_depth_{doc_type}"
+    )
+    # Replace rather than merge so shards and files of an old layout don't linger
+    shutil.rmtree(cloud_dir, ignore_errors=True)
+    shutil.copytree(local_save_dir, cloud_dir)
+    logger.info(f"FAISS index for {doc_type} copied to Google Cloud directory: {cloud_dir}")
+    return cloud_dir
+
+
+def update_vector_dbs(
+    fc_json_directory,
+    cj_json_directory,
+    doc_directory,
+    pc_directory,
+    news_directory,
+    in_depth_embeddings,
+):
+    """
+    Incrementally update the saved indices, embedding only new or changed files.
+    Sources without an ingest manifest yet are built in full.
+    """
+    sources = {
+        "fc": (fc_json_directory, metadata_func),
+        "cj": (cj_json_directory, metadata_func),
+        "pdf": (doc_directory, metadata_func_minutes_and_agendas),
+        "pc": (pc_directory, metadata_func),
+        "news": (news_directory, metadata_news),
+    }
+    for doc_type, (directory, source_metadata_func) in sources.items():
+        local_save_dir = local_index_dir(doc_type)
+        added, removed = update_sharded_faiss(
+            json_files(directory),
+            partial(load_source_files, metadata_func=source_metadata_func),
+            in_depth_embeddings,
+            doc_type,
+            local_save_dir,
+        )
+        chunking_service().clear_chunk_vectors()
+        if added or removed:
+            copy_to_cloud(local_save_dir, doc_type)
+
+
 def create_vector_dbs(
     fc_json_directory,
     cj_json_directory,
@@ -223,6 +231,19 @@ def create_vector_dbs(
     news_directory,
     in_depth_embeddings,
 ):
+    # Hashed before the files are read, so the ingest manifest describes the
+    # content that was indexed, including files without any chunks
+    hashes = {
+        doc_type: file_hashes(json_files(directory))
+        for doc_type, directory in (
+            ("fc", fc_json_directory),
+            ("cj", cj_json_directory),
+            ("pdf", doc_directory),
+            ("pc", pc_directory),
+            ("news", news_directory),
+        )
+    }
+
     # Create databases from transcripts and documents
     fc_video_docs = create_db_from_fc_transcripts(fc_json_directory)
     cj_video_docs = create_db_from_cj_transcripts(cj_json_directory)
@@ -230,35 +251,50 @@ def create_vector_dbs(
     pc_docs = create_db_from_public_comments(pc_directory)
     news_docs = create_db_from_news_transcripts(news_directory)
 
+    # Embed the chunks of all sources in one pass, so requests are batched and
+    # run concurrently across sources rather than one source after another. The
+    # vectors are one float32 array, each batch stored in the embedding cache as
+    # it completes.
+    all_vectors = in_depth_embeddings.embed_documents(
+        [
+            doc.page_content
+            for docs in (fc_video_docs, cj_video_docs, pdf_docs, pc_docs, news_docs)
+            for doc in docs
+        ]
+    )
+    chunking_service().clear_chunk_vectors()
+    offset = 0
+
     # Function to create, save, and copy FAISS index
     def create_save_and_copy_faiss(docs, embeddings, doc_type):
-        # Create FAISS index
-        db = FAISS.from_documents(docs, embeddings)
-
-        cache_dir = dir.joinpath("cache")
-
-        # Save locally
-        local_save_dir = cache_dir.joinpath(f"faiss_index_in_depth_{doc_type}")
-        db.save_local(local_save_dir)
-        logger.info(f"Local FAISS index for {doc_type} saved to {local_save_dir}")
-
-        # Copy to Google Cloud directory
-        cloud_dir = dir.parent.parent.joinpath(
-            f"googlecloud/functions/getanswer/cache/faiss_index_in_depth_{doc_type}"
-        )
-        shutil.copytree(local_save_dir, cloud_dir, dirs_exist_ok=True)
-        logger.info(
-            f"FAISS index for {doc_type} copied to Google Cloud directory: {cloud_dir}"
+        nonlocal offset
+        add_citation_records(docs)
+        vectors = all_vectors[offset : offset + len(docs)]
+        offset += len(docs)
+
+        # Save locally as one shard per publish year, each with its own keyword and
+        # metadata indices
+        local_save_dir = local_index_dir(doc_type)
+        shards = save_sharded_faiss(
+            docs,
+            embeddings,
+            doc_type,
+            local_save_dir,
+            vectors=vectors,
+            hashes=hashes[doc_type],
         )
+        logger.info(f"Local FAISS shards for {doc_type} saved to {local_save_dir}")
 
-        return db
+        copy_to_cloud(local_save_dir, doc_type)
+        return shards
 
-    # Creating, saving, and copying FAISS indices for each document type
+    # Creating, saving, and copying FAISS indices for each document type, in the
+    # order they were embedded
     faiss_fc = create_save_and_copy_faiss(fc_video_docs, in_depth_embeddings, "fc")
     faiss_cj = create_save_and_copy_faiss(cj_video_docs, in_depth_embeddings, "cj")
     faiss_pdf = create_save_and_copy_faiss(pdf_docs, in_depth_embeddings, "pdf")
     faiss_pc = create_save_and_copy_faiss(pc_docs, in_depth_embeddings, "pc")
     faiss_news = create_save_and_copy_faiss(news_docs, in_depth_embeddings, "news")
 
-    # Return the FAISS indices
+    # Return the FAISS shards of each document type
     return faiss_fc, faiss_cj, faiss_pdf, faiss_pc, faiss_news
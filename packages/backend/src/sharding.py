@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from langchain_community.vectorstores.faiss import FAISS
+
+from keyword_indexer import save_keyword_index
+from metadata_indexer import parse_publish_date, save_metadata_index
+
+logger = logging.getLogger(__name__)
+
+# Read by getanswer's index registry
+SHARD_MANIFEST_FILE = "shards.json"
+SHARDS_DIR = "shards"
+UNDATED_SHARD = "undated"
+
+# Source file -> content hash and docstore ids per shard, used for incremental
+# updates. Not needed by getanswer.
+INGEST_MANIFEST_FILE = "ingest.json"
+
+
+def shard_name(doc):
+    """Shards are per publish year; documents without a date share one shard."""
+    published = parse_publish_date(doc.metadata.get("publish_date"))
+    return str(published.year) if published else UNDATED_SHARD
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_hashes(paths):
+    """Dictionary of path to sha256, taken before the files are read for indexing."""
+    return {path: file_sha256(path) for path in paths}
+
+
+def source_file_key(doc):
+    # Files are listed from one flat directory per source, so names are unique
+    return os.path.basename(doc.metadata.get("source", ""))
+
+
+def write_json(path, data):
+    # Written to a temporary file first so readers never see a partial file
+    path = Path(path)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def indexed_documents(db):
+    """Documents of a FAISS store in vector id order."""
+    return [
+        db.docstore.search(db.index_to_docstore_id[i]) for i in range(db.index.ntotal)
+    ]
+
+
+def shard_entry(name, docs):
+    dates = [parse_publish_date(doc.metadata.get("publish_date")) for doc in docs]
+    dates = [d for d in dates if d is not None]
+    return {
+        "name": name,
+        "path": f"{SHARDS_DIR}/{name}",
+        "documents": len(docs),
+        "start": min(dates).isoformat() if dates else None,
+        "end": max(dates).isoformat() if dates else None,
+    }
+
+
+def save_shard(db, doc_type, shard_dir):
+    """
+    Save one shard: FAISS index and docstore plus the keyword and metadata indices,
+    which are rebuilt from the docstore so they always match the vector ids.
+
+    :return: The shard's manifest entry.
+    """
+    docs = indexed_documents(db)
+    db.save_local(shard_dir)
+    save_keyword_index([doc.page_content for doc in docs], shard_dir)
+    save_metadata_index(docs, doc_type, shard_dir)
+    return shard_entry(Path(shard_dir).name, docs)
+
+
+def record_files(files, hashes, docs, ids):
+    """
+    Record indexed source files in the ingest manifest, with the docstore ids of
+    their documents. Files that yielded no documents are recorded too, so they are
+    skipped until they change.
+
+    :param hashes: Dictionary of path to sha256 of every file that was indexed.
+        Documents whose source is not among them are indexed but not recorded.
+    """
+    for path, sha256 in hashes.items():
+        files[os.path.basename(path)] = {"sha256": sha256, "ids": {}}
+    unknown = set()
+    for doc, doc_id in zip(docs, ids):
+        key = source_file_key(doc)
+        if key not in files:
+            unknown.add(key)
+            continue
+        files[key]["ids"].setdefault(shard_name(doc), []).append(doc_id)
+    if unknown:
+        logger.warning(
+            f"Documents from {len(unknown)} sources that were not hashed are missing "
+            f"from the ingest manifest and won't be updated incrementally: "
+            f"{sorted(unknown)}"
+        )
+    return files
+
+
+def new_ids(count):
+    return [str(uuid.uuid4()) for _ in range(count)]
+
+
+def save_sharded_faiss(
+    docs, embeddings, doc_type, folder_path, vectors=None, hashes=None
+):
+    """
+    Split documents into one FAISS index per publish year and describe the shards
+    in a manifest.
+
+    Every document is embedded once up front and each shard is built from its
+    share of the vectors.
+
+    :param vectors: Optional embeddings of the documents, if already computed.
+    :param hashes: `file_hashes` of the source files, taken before they were read.
+        Defaults to hashing the files the documents came from now, which misses
+        files without documents.
+
+    :return: Dictionary of shard name to FAISS store.
+    """
+    folder_path = Path(folder_path)
+    # Drop the previous layout, including a monolithic index.faiss
+    shutil.rmtree(folder_path, ignore_errors=True)
+    folder_path.mkdir(parents=True)
+
+    if vectors is None:
+        vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+    ids = new_ids(len(docs))
+
+    groups = {}
+    for i, doc in enumerate(docs):
+        groups.setdefault(shard_name(doc), []).append(i)
+
+    shards = {}
+    manifest = {"source": doc_type, "shards": []}
+    for name in sorted(groups):
+        rows = groups[name]
+        shards[name] = FAISS.from_embeddings(
+            [(docs[i].page_content, vectors[i]) for i in rows],
+            embeddings,
+            metadatas=[docs[i].metadata for i in rows],
+            ids=[ids[i] for i in rows],
+        )
+        entry = save_shard(
+            shards[name], doc_type, folder_path.joinpath(SHARDS_DIR, name)
+        )
+        manifest["shards"].append(entry)
+        logger.info(f"Saved {doc_type} shard {name} with {entry['documents']} documents")
+
+    write_json(folder_path.joinpath(SHARD_MANIFEST_FILE), manifest)
+    if hashes is None:
+        hashes = file_hashes({doc.metadata["source"] for doc in docs})
+    write_json(
+        folder_path.joinpath(INGEST_MANIFEST_FILE),
+        {"source": doc_type, "files": record_files({}, hashes, docs, ids)},
+    )
+    logger.info(f"Saved {len(shards)} {doc_type} shards to {folder_path}")
+    return shards
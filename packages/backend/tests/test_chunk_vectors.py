@@ -0,0 +1,100 @@
+import numpy as np
+
+from chunking import ChunkEmbeddings, ChunkingService, mean_vector
+from chunking_benchmark import synthetic_messages
+from embedding_benchmark import LocalFakeEmbeddings
+from embedding_executor import ParallelEmbeddings
+
+
+class CountingEmbeddings(ParallelEmbeddings):
+    def __init__(self):
+        super().__init__(LocalFakeEmbeddings(size=32, latency=0))
+        self.texts = []
+
+    def embed_documents(self, texts, on_batch=None):
+        self.texts.extend(texts)
+        return super().embed_documents(texts, on_batch)
+
+
+def all_chunks(service, texts):
+    return [chunk for chunks in service.split_texts(texts) for chunk in chunks]
+
+
+def test_mean_vector_is_weighted_and_unit_length():
+    vector = mean_vector(np.array([[1.0, 0.0], [0.0, 1.0]]), [3, 1])
+
+    assert vector.dtype == np.float32
+    np.testing.assert_allclose(vector, np.array([3, 1]) / np.sqrt(10), rtol=1e-6)
+
+
+def test_derived_vectors_replace_chunk_requests():
+    texts = synthetic_messages(6, 12)
+    embeddings = CountingEmbeddings()
+    service = ChunkingService(embeddings, derive_vectors=True)
+    chunks = all_chunks(service, texts)
+    embeddings.texts.clear()
+
+    vectors = ChunkEmbeddings(embeddings, service).embed_documents(chunks)
+
+    assert embeddings.texts == []
+    assert vectors.shape == (len(chunks), 32)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, rtol=1e-5)
+    # Each vector is handed out once; asking again embeds the chunk
+    ChunkEmbeddings(embeddings, service).embed_documents(chunks[:1])
+    assert embeddings.texts == chunks[:1]
+
+
+def test_derived_vector_is_the_mean_of_its_sentence_windows():
+    text = "The council met. It discussed drainage. Then it voted. The meeting ended."
+    embeddings = CountingEmbeddings()
+    service = ChunkingService(embeddings, derive_vectors=True)
+    (chunks,) = service.split_texts([text])
+    windows = service.combined_sentences(text)
+    sentences = service.splitter._get_single_sentences_list(text)
+    window_vectors = np.asarray(embeddings.embed_documents(windows))
+
+    start = 0
+    for chunk in chunks:
+        end = start + len(service.splitter._get_single_sentences_list(chunk))
+        expected = mean_vector(
+            window_vectors[start:end], [len(s) for s in sentences[start:end]]
+        )
+        derived = service.take_chunk_vector(chunk)
+        np.testing.assert_allclose(derived, expected, rtol=1e-5)
+        start = end
+
+
+def test_long_chunks_are_left_to_the_model():
+    texts = synthetic_messages(4, 12)
+    embeddings = CountingEmbeddings()
+    service = ChunkingService(embeddings, derive_vectors=True, derive_max_chars=200)
+    chunks = all_chunks(service, texts)
+    embeddings.texts.clear()
+
+    ChunkEmbeddings(embeddings, service).embed_documents(chunks)
+
+    assert embeddings.texts == [chunk for chunk in chunks if len(chunk) > 200]
+    assert embeddings.texts
+
+
+def test_vectors_are_embedded_without_derivation():
+    texts = synthetic_messages(2, 12)
+    embeddings = CountingEmbeddings()
+    service = ChunkingService(embeddings)
+    chunks = all_chunks(service, texts)
+    embeddings.texts.clear()
+
+    ChunkEmbeddings(embeddings, service).embed_documents(chunks)
+
+    assert embeddings.texts == chunks
+
+
+def test_unused_derived_vectors_can_be_cleared():
+    embeddings = CountingEmbeddings()
+    service = ChunkingService(embeddings, derive_vectors=True)
+    chunks = all_chunks(service, synthetic_messages(4, 12))
+
+    ChunkEmbeddings(embeddings, service).embed_documents(chunks[:2])
+
+    assert service.clear_chunk_vectors() == len(set(chunks[2:]))
+    assert service.chunk_vectors == {}
@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_experimental.text_splitter import SemanticChunker
+
+from chunking import ChunkingService
+from chunking_benchmark import synthetic_messages
+from embedding_benchmark import LocalFakeEmbeddings
+from embedding_cache import CachedEmbeddings
+from embedding_executor import ParallelEmbeddings
+
+
+class LoopBoundEmbeddings(LocalFakeEmbeddings):
+    """Fails like an async HTTP client used from a loop other than its first one."""
+
+    def __init__(self):
+        super().__init__(size=8, latency=0.001)
+        self.loops = set()
+
+    async def aembed_documents(self, texts):
+        loop = asyncio.get_running_loop()
+        if self.loops and loop not in self.loops:
+            raise RuntimeError("Event loop is closed")
+        self.loops.add(loop)
+        return await super().aembed_documents(texts)
+
+
+@pytest.fixture
+def texts():
+    return synthetic_messages(12, 15) + ["One sentence only.", "Two sentences. Here."]
+
+
+def test_chunks_match_semantic_chunker(tmp_path, texts):
+    fake = LocalFakeEmbeddings(size=32, latency=0)
+    expected = [SemanticChunker(fake).split_text(text) for text in texts]
+
+    service = ChunkingService(
+        CachedEmbeddings(ParallelEmbeddings(fake), tmp_path), batch_sentences=40
+    )
+
+    assert service.split_texts(texts) == expected
+    requests = fake.requests
+    # The second pass reads every sentence vector from the cache
+    assert service.split_texts(texts) == expected
+    assert fake.requests == requests
+
+
+def test_split_documents_keeps_metadata(texts):
+    fake = LocalFakeEmbeddings(size=32, latency=0)
+    service = ChunkingService(ParallelEmbeddings(fake))
+    docs = [
+        Document(page_content=text, metadata={"source": str(i)})
+        for i, text in enumerate(texts)
+    ]
+
+    chunks = service.split_documents(docs)
+
+    sources = {chunk.metadata["source"] for chunk in chunks}
+    assert sources == {str(i) for i in range(len(texts))}
+    assert len(chunks) == sum(map(len, service.split_texts(texts)))
+
+
+def test_embeddings_are_shared_across_worker_threads(texts):
+    base = LoopBoundEmbeddings()
+    embeddings = ParallelEmbeddings(base, batch_size=4, max_retries=0)
+    service = ChunkingService(embeddings, batch_sentences=20, max_workers=4)
+
+    service.split_texts(texts)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        vectors = list(executor.map(embeddings.embed_documents, [texts[:3]] * 8))
+
+    assert len(base.loops) == 1
+    assert all(isinstance(v, np.ndarray) and v.shape == (3, 8) for v in vectors)
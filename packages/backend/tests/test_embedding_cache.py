@@ -0,0 +1,90 @@
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import (
+    KEY_SIZE,
+    CachedEmbeddings,
+    EmbeddingStore,
+    embedding_key,
+)
+
+
+class CountingEmbeddings(Embeddings):
+    model = "test-model"
+
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0, 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def keys(*texts):
+    return [embedding_key("test-model", text) for text in texts]
+
+
+def test_store_round_trip_and_reopen(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    store.put_many(keys("a", "b", "a"), [[1, 2], [3, 4], [1, 2]])
+
+    assert len(store) == 2
+    reopened = EmbeddingStore(tmp_path)
+    found = reopened.get_many(keys("b", "c", "a"))
+    assert set(found) == set(keys("a", "b"))
+    np.testing.assert_array_equal(found[keys("b")[0]], [3, 4])
+
+
+def test_interrupted_append_is_truncated_on_load(tmp_path, caplog):
+    store = EmbeddingStore(tmp_path)
+    store.put_many(keys("a", "b"), [[1, 2], [3, 4]])
+    # A crash between writing vectors and keys leaves an extra vector row and
+    # half a key
+    with open(store.vectors_path, "ab") as f:
+        f.write(np.array([5, 6], dtype=np.float32).tobytes())
+    with open(store.keys_path, "ab") as f:
+        f.write(keys("c")[0][: KEY_SIZE // 2])
+
+    reopened = EmbeddingStore(tmp_path)
+
+    assert len(reopened) == 2
+    assert "truncating to 2" in caplog.text
+    assert reopened.keys_path.stat().st_size == 2 * KEY_SIZE
+    assert reopened.vectors_path.stat().st_size == 2 * 2 * 4
+    reopened.put_many(keys("c"), [[7, 8]])
+    np.testing.assert_array_equal(
+        EmbeddingStore(tmp_path).get_many(keys("c"))[keys("c")[0]], [7, 8]
+    )
+
+
+def test_cached_embeddings_only_embed_new_texts(tmp_path):
+    base = CountingEmbeddings()
+    cached = CachedEmbeddings(base, tmp_path)
+
+    first = cached.embed_documents(["budget", "cameras", "budget"])
+    second = CachedEmbeddings(base, tmp_path).embed_documents(["cameras", "zoning"])
+
+    assert base.texts == ["budget", "cameras", "zoning"]
+    np.testing.assert_array_equal(first, [[6, 1, 0.5], [7, 1, 0.5], [6, 1, 0.5]])
+    np.testing.assert_array_equal(second, [[7, 1, 0.5], [6, 1, 0.5]])
+
+
+def test_cache_is_per_model(tmp_path):
+    base = CountingEmbeddings()
+    CachedEmbeddings(base, tmp_path).embed_documents(["budget"])
+
+    CachedEmbeddings(base, tmp_path, model="other-model").embed_documents(["budget"])
+
+    assert base.texts == ["budget", "budget"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["other-model", "test-model"]
+
+
+def test_empty_store(tmp_path):
+    store = EmbeddingStore(tmp_path)
+
+    assert len(store) == 0
+    assert store.get_many(keys("a")) == {}
+    assert len(EmbeddingStore(tmp_path)) == 0
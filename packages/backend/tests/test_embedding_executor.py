@@ -0,0 +1,107 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings
+from embedding_executor import AdaptiveLimit, ParallelEmbeddings
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FakeEmbeddings(Embeddings):
+    """One vector per text; batches containing "fail" raise after a delay."""
+
+    model = "fake"
+
+    def __init__(self, rate_limited=0):
+        self.batches = []
+        self.rate_limited = rate_limited
+
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        self.batches.append(list(texts))
+        if self.rate_limited:
+            self.rate_limited -= 1
+            raise RateLimitError()
+        if "fail" in texts:
+            await asyncio.sleep(0.05)
+            raise ValueError("bad input")
+        return self.embed_documents(texts)
+
+
+def test_limit_halves_once_for_requests_rate_limited_together():
+    async def main():
+        limit = AdaptiveLimit(8)
+        tokens = [await limit.acquire() for _ in range(4)]
+        for token in tokens:
+            await limit.release(token, rate_limited=True)
+        after_window = limit.limit
+
+        # A request started after the decrease lowers it again
+        token = await limit.acquire()
+        await limit.release(token, rate_limited=True)
+        return after_window, limit.limit, limit.lowest
+
+    assert asyncio.run(main()) == (4, 2, 2)
+
+
+def test_limit_grows_after_a_limit_of_successes():
+    async def main():
+        limit = AdaptiveLimit(4)
+        await limit.release(await limit.acquire(), rate_limited=True)
+        for _ in range(2):
+            await limit.release(await limit.acquire())
+        return limit.limit
+
+    assert asyncio.run(main()) == 3
+
+
+def test_parallel_embeddings_keep_order_and_report_batches():
+    base = FakeEmbeddings()
+    embeddings = ParallelEmbeddings(base, batch_size=2, max_concurrency=3)
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    batches = []
+
+    vectors = embeddings.embed_documents(
+        texts, on_batch=lambda offset, batch: batches.append((offset, len(batch)))
+    )
+
+    assert vectors.dtype == np.float32
+    np.testing.assert_array_equal(vectors[:, 0], [1, 2, 3, 4, 5])
+    assert sorted(batches) == [(0, 2), (2, 2), (4, 1)]
+    assert embeddings.last_report["batches"] == 3
+
+
+def test_rate_limited_batch_is_retried():
+    base = FakeEmbeddings(rate_limited=1)
+    embeddings = ParallelEmbeddings(base, batch_size=2, retry_delay=0.001)
+
+    vectors = embeddings.embed_documents(["a", "bb"])
+
+    np.testing.assert_array_equal(vectors[:, 0], [1, 2])
+    assert embeddings.last_report["rate_limited"] == 1
+    assert len(base.batches) == 2
+
+
+def test_cache_keeps_batches_embedded_before_a_failure(tmp_path):
+    base = FakeEmbeddings()
+    embeddings = ParallelEmbeddings(base, batch_size=2, max_retries=0)
+    texts = ["a", "bb", "ccc", "dddd", "fail", "ffffff"]
+
+    with pytest.raises(ValueError):
+        CachedEmbeddings(embeddings, tmp_path).embed_documents(texts)
+    base.batches.clear()
+    vectors = CachedEmbeddings(embeddings, tmp_path).embed_documents(texts[:4])
+
+    assert base.batches == []
+    assert vectors.shape == (4, 2)
+    np.testing.assert_array_equal(vectors[:, 0], [1, 2, 3, 4])
@@ -0,0 +1,177 @@
+import json
+
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_core.documents import Document
+
+from incremental import changed_files, update_sharded_faiss
+from sharding import (
+    INGEST_MANIFEST_FILE,
+    SHARD_MANIFEST_FILE,
+    SHARDS_DIR,
+    file_sha256,
+    read_json,
+    record_files,
+)
+
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=16)
+
+
+def write_source(path, *messages):
+    path.write_text(
+        json.dumps(
+            {
+                "messages": [
+                    {"page_content": text, "publish_date": publish_date}
+                    for text, publish_date in messages
+                ]
+            }
+        )
+    )
+    return str(path)
+
+
+class LoadFiles:
+    """Load one Document per message, recording the files asked for."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, paths):
+        self.calls.append(sorted(paths))
+        docs = []
+        for path in paths:
+            with open(path) as f:
+                for message in json.load(f)["messages"]:
+                    metadata = {"source": path, "publish_date": message["publish_date"]}
+                    docs.append(
+                        Document(page_content=message["page_content"], metadata=metadata)
+                    )
+        return docs
+
+
+def indexed_texts(folder):
+    texts = []
+    for entry in read_json(folder.joinpath(SHARD_MANIFEST_FILE))["shards"]:
+        db = FAISS.load_local(
+            folder.joinpath(entry["path"]),
+            DeterministicFakeEmbedding(size=16),
+            allow_dangerous_deserialization=True,
+        )
+        texts.extend(doc.page_content for doc in db.docstore._dict.values())
+    return sorted(texts)
+
+
+def test_changed_files(tmp_path):
+    same = write_source(tmp_path.joinpath("same.json"), ("budget", "1/2/2021"))
+    edited = write_source(tmp_path.joinpath("edited.json"), ("cameras", "1/2/2022"))
+    new = write_source(tmp_path.joinpath("new.json"), ("drainage", "1/2/2023"))
+    ingested = {
+        "same.json": {"sha256": file_sha256(same), "ids": {}},
+        "edited.json": {"sha256": "outdated", "ids": {}},
+        "gone.json": {"sha256": "outdated", "ids": {}},
+    }
+
+    changed, stale = changed_files([same, edited, new], ingested)
+
+    assert changed == {edited: file_sha256(edited), new: file_sha256(new)}
+    assert sorted(stale) == ["edited.json", "gone.json"]
+
+
+def test_update_adds_modifies_and_removes_files(tmp_path, embeddings):
+    sources = tmp_path.joinpath("sources")
+    sources.mkdir()
+    folder = tmp_path.joinpath("index")
+    kept = write_source(sources.joinpath("kept.json"), ("budget hearing", "1/2/2021"))
+    edited = write_source(sources.joinpath("edited.json"), ("cameras", "3/4/2022"))
+    removed = write_source(sources.joinpath("removed.json"), ("drainage", "5/6/2022"))
+    load_files = LoadFiles()
+
+    assert update_sharded_faiss(
+        [kept, edited, removed], load_files, embeddings, "fc", folder
+    ) == (3, 0)
+
+    write_source(sources.joinpath("edited.json"), ("cameras approved", "3/4/2022"))
+    new = write_source(sources.joinpath("new.json"), ("zoning", "7/8/2023"))
+    added, deleted = update_sharded_faiss(
+        [kept, edited, new], load_files, embeddings, "fc", folder
+    )
+
+    assert (added, deleted) == (2, 2)
+    assert load_files.calls[-1] == sorted([edited, new])
+    assert indexed_texts(folder) == ["budget hearing", "cameras approved", "zoning"]
+    manifest = read_json(folder.joinpath(SHARD_MANIFEST_FILE))
+    assert [entry["name"] for entry in manifest["shards"]] == ["2021", "2022", "2023"]
+    assert not folder.with_name("index.staging").exists()
+
+    assert update_sharded_faiss(
+        [kept, edited, new], load_files, embeddings, "fc", folder
+    ) == (0, 0)
+
+
+def test_file_without_chunks_is_recorded_and_not_reloaded(tmp_path, embeddings):
+    folder = tmp_path.joinpath("index")
+    kept = write_source(tmp_path.joinpath("kept.json"), ("budget hearing", "1/2/2021"))
+    update_sharded_faiss([kept], LoadFiles(), embeddings, "fc", folder)
+    empty = write_source(tmp_path.joinpath("empty.json"))
+    load_files = LoadFiles()
+
+    update = update_sharded_faiss([kept, empty], load_files, embeddings, "fc", folder)
+    assert update == (0, 0)
+    ingest = read_json(folder.joinpath(INGEST_MANIFEST_FILE))
+    assert ingest["files"]["empty.json"] == {"sha256": file_sha256(empty), "ids": {}}
+
+    update = update_sharded_faiss([kept, empty], load_files, embeddings, "fc", folder)
+    assert update == (0, 0)
+    assert load_files.calls == [[empty]]
+
+
+def test_full_build_records_files_without_chunks(tmp_path, embeddings):
+    folder = tmp_path.joinpath("index")
+    kept = write_source(tmp_path.joinpath("kept.json"), ("budget hearing", "1/2/2021"))
+    empty = write_source(tmp_path.joinpath("empty.json"))
+
+    update_sharded_faiss([kept, empty], LoadFiles(), embeddings, "fc", folder)
+
+    files = read_json(folder.joinpath(INGEST_MANIFEST_FILE))["files"]
+    assert sorted(files) == ["empty.json", "kept.json"]
+    assert list(files["kept.json"]["ids"]) == ["2021"]
+    assert folder.joinpath(SHARDS_DIR, "2021", "index.faiss").exists()
+
+
+def test_manifest_keeps_the_hash_of_the_content_that_was_read(tmp_path, embeddings):
+    folder = tmp_path.joinpath("index")
+    path = write_source(tmp_path.joinpath("fc.json"), ("budget hearing", "1/2/2021"))
+    update_sharded_faiss([path], LoadFiles(), embeddings, "fc", folder)
+    write_source(tmp_path.joinpath("fc.json"), ("cameras", "1/2/2021"))
+    read_hash = file_sha256(path)
+
+    def load_then_edit(paths):
+        docs = LoadFiles()(paths)
+        # The file changes again after it was chunked
+        write_source(tmp_path.joinpath("fc.json"), ("drainage", "1/2/2021"))
+        return docs
+
+    update_sharded_faiss([path], load_then_edit, embeddings, "fc", folder)
+
+    files = read_json(folder.joinpath(INGEST_MANIFEST_FILE))["files"]
+    assert files["fc.json"]["sha256"] == read_hash
+    assert update_sharded_faiss([path], LoadFiles(), embeddings, "fc", folder) == (1, 1)
+
+
+def test_documents_from_unhashed_sources_are_skipped(caplog):
+    docs = [
+        Document(page_content="a", metadata={"source": "/data/fc/a.json"}),
+        Document(page_content="b", metadata={"source": "/data/other/b.json"}),
+        Document(page_content="c", metadata={}),
+    ]
+
+    files = record_files({}, {"/data/fc/a.json": "abc"}, docs, ["id-a", "id-b", "id-c"])
+
+    assert list(files) == ["a.json"]
+    assert sum(files["a.json"]["ids"].values(), []) == ["id-a"]
+    assert "b.json" in caplog.text
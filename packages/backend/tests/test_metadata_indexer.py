@@ -0,0 +1,90 @@
+from datetime import date
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from metadata_indexer import (
+    add_citation_record,
+    build_metadata_index,
+    format_publish_date,
+    parse_publish_date,
+    timestamp_seconds,
+)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("11/16/2023", "11/16/2023"),
+        ("6-7-2018", "06/07/2018"),
+        (" 6/7/2018 ", "06/07/2018"),
+        ("2/30/2018", "Invalid date format"),
+        ("June 7, 2018", "Invalid date format"),
+        (None, "date not available"),
+        ("", "date not available"),
+    ],
+)
+def test_format_publish_date(value, expected):
+    assert format_publish_date(value) == expected
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("1:02:03-1:05:00", 3723),
+        ("0:01:15 - 0:02:00", 75),
+        ("12:30", 750),
+        ("timestamp not available", None),
+        ("soon", None),
+        (None, None),
+    ],
+)
+def test_timestamp_seconds(value, expected):
+    assert timestamp_seconds(value) == expected
+
+
+def test_add_citation_record():
+    metadata = add_citation_record(
+        {
+            "title": "Council meeting",
+            "publish_date": "6-7-2018",
+            "url": "https://www.youtube.com/watch?v=abc",
+            "timestamp": "0:01:15-0:02:00",
+            "source": "/data/fc/meeting.json",
+        }
+    )
+
+    assert metadata["citation"] == {
+        "Title": "Council meeting",
+        "Published": "06/07/2018",
+        "URL": "https://www.youtube.com/watch?v=abc",
+        "Video timestamp": "0:01:15-0:02:00",
+        "Name": "meeting.json",
+        "Page Number": None,
+    }
+    assert metadata["timestamp_seconds"] == 75
+
+
+def test_add_citation_record_without_metadata():
+    metadata = add_citation_record({"source": "/data/pdf/minutes.pdf", "page_number": 3})
+
+    assert metadata["citation"]["Title"] == "/data/pdf/minutes.pdf"
+    assert metadata["citation"]["Published"] == "date not available"
+    assert metadata["citation"]["URL"] == "url not available"
+    assert metadata["citation"]["Page Number"] == 3
+    assert metadata["timestamp_seconds"] is None
+
+
+def test_build_metadata_index():
+    docs = [
+        Document(page_content="a", metadata={"publish_date": "11/16/2023", "title": "A"}),
+        Document(page_content="b", metadata={}),
+    ]
+
+    index = build_metadata_index(docs, "fc")
+
+    assert index["publish_dates"][0] == np.datetime64(date(2023, 11, 16))
+    assert np.isnat(index["publish_dates"][1])
+    assert index["titles"].tolist() == ["A", ""]
+    assert parse_publish_date("13/1/2023") is None
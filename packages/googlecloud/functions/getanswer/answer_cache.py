@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from embedding_cache import normalize_query
+from metadata_index import parse_date_range
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", "/tmp/sawt/answers.sqlite")
+
+# Rephrasings of a question land well above 0.95, different questions on the same
+# topic usually don't
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.97))
+ANSWER_CACHE_TTL_S = int(os.environ.get("ANSWER_CACHE_TTL_S", 24 * 3600))
+ANSWER_CACHE_SIZE = 5000
+
+# Years, ordinance and docket numbers, amounts
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,\-/]\d+)*")
+
+
+def query_specifics(query, today=None):
+    """
+    The numbers and publish date range a question names, as a string.
+
+    Embeddings barely move when only a year or an ordinance number changes, so
+    cached answers are only served to questions whose specifics match exactly.
+    """
+    date_range = parse_date_range(query, today)
+    return json.dumps(
+        {
+            "numbers": sorted(set(NUMBER_PATTERN.findall(query))),
+            "dates": [d.isoformat() for d in date_range] if date_range else None,
+        }
+    )
+
+
+class AnswerCache:
+    """
+    Semantic cache of final answers keyed on the similarity of the normalized
+    question's embedding, for questions naming the same numbers and dates.
+
+    Every entry records the index version it was generated against. Entries from
+    other versions are dropped on startup and never served, so rebuilding the
+    FAISS indices invalidates the cache.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        index_version,
+        path=ANSWER_CACHE_PATH,
+        threshold=ANSWER_CACHE_THRESHOLD,
+        ttl_s=ANSWER_CACHE_TTL_S,
+        max_entries=ANSWER_CACHE_SIZE,
+    ):
+        self.embeddings = embeddings
+        self.index_version = index_version
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = self._connect(path)
+        self.invalidate()
+
+    def _connect(self, path):
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, response_type TEXT, "
+                "index_version TEXT, query TEXT, vector BLOB, response TEXT, "
+                "created_at REAL, specifics TEXT)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(answers)")]
+            if "specifics" not in columns:
+                # Rows cached before specifics were recorded never match
+                conn.execute("ALTER TABLE answers ADD COLUMN specifics TEXT")
+            conn.commit()
+            return conn
+        except sqlite3.Error as e:
+            logger.error(f"Answer cache unavailable, answering every question: {e}")
+            return None
+
+    def _load(self):
+        rows = []
+        if self._conn is not None:
+            rows = self._conn.execute(
+                "SELECT id, response_type, vector, created_at, specifics FROM answers "
+                "WHERE index_version = ? ORDER BY id DESC LIMIT ?",
+                (self.index_version, self.max_entries),
+            ).fetchall()
+        self._ids = [row[0] for row in rows]
+        self._response_types = [row[1] for row in rows]
+        self._created_at = [row[3] for row in rows]
+        self._specifics = [row[4] for row in rows]
+        self._vectors = (
+            np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+            if rows
+            else None
+        )
+        logger.info(f"Loaded {len(rows)} cached answers for index {self.index_version}")
+
+    def invalidate(self, index_version=None):
+        """
+        Drop entries that are expired or were built against a different index
+        version. Passing `index_version` switches the cache to that version first,
+        e.g. after the indices have been reloaded.
+        """
+        with self._lock:
+            if index_version is not None:
+                self.index_version = index_version
+            if self._conn is not None:
+                self._conn.execute(
+                    "DELETE FROM answers WHERE index_version != ? OR created_at < ?",
+                    (self.index_version, time.time() - self.ttl_s),
+                )
+                self._conn.commit()
+            self._load()
+
+    def embed(self, query):
+        """
+        Unit length embedding of the normalized question, or None when the model
+        returns a zero vector that has no direction to compare.
+        """
+        vector = np.asarray(
+            self.embeddings.embed_query(normalize_query(query)), dtype=np.float32
+        )
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
+
+    def lookup(self, query, response_type, vector=None):
+        """
+        Return the cached response for the closest query above the threshold.
+
+        :param vector: Optional result of `embed(query)`, so callers can embed the
+            question alongside other work.
+        """
+        if self._conn is None:
+            return None
+        query = normalize_query(query)
+        specifics = query_specifics(query)
+        if vector is None:
+            vector = self.embed(query)
+        if vector is None:
+            return None
+        with self._lock:
+            if self._vectors is None:
+                return None
+            similarities = self._vectors @ vector
+            mask = np.array(self._response_types) == response_type
+            mask &= np.array(self._created_at) >= time.time() - self.ttl_s
+            mask &= np.array(self._specifics, dtype=object) == specifics
+            similarities[~mask] = -1
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            row = self._conn.execute(
+                "SELECT query, response FROM answers WHERE id = ?", (self._ids[best],)
+            ).fetchone()
+
+        if row is None:
+            return None
+        logger.info(
+            f"Answer cache hit (similarity {similarities[best]:.3f}) for cached query: {row[0]}"
+        )
+        return json.loads(row[1])
+
+    def store(self, query, response_type, final_response, vector=None):
+        if self._conn is None:
+            return
+        query = normalize_query(query)
+        specifics = query_specifics(query)
+        if vector is None:
+            vector = self.embed(query)
+        if vector is None:
+            return
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO answers (response_type, index_version, query, vector, "
+                "response, created_at, specifics) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    response_type,
+                    self.index_version,
+                    query,
+                    vector.tobytes(),
+                    json.dumps(final_response, default=str),
+                    time.time(),
+                    specifics,
+                ),
+            )
+            self._conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers "
+                "ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+            self._ids.insert(0, cursor.lastrowid)
+            self._response_types.insert(0, response_type)
+            self._created_at.insert(0, time.time())
+            self._specifics.insert(0, specifics)
+            self._vectors = (
+                vector[np.newaxis]
+                if self._vectors is None
+                else np.vstack([vector, self._vectors[: self.max_entries - 1]])
+            )
+            del self._ids[self.max_entries :]
+            del self._response_types[self.max_entries :]
+            del self._created_at[self.max_entries :]
+            del self._specifics[self.max_entries :]
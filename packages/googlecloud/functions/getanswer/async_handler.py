@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import httpx
+from supabase import AsyncClientOptions, acreate_client
+
+from cards import areplace_responses, awrite_card_result
+from coalesce import AsyncSingleFlight, flight_key
+from inquirer import aanswer_query
+from streaming import CoalescingWriter
+
+logger = logging.getLogger(__name__)
+
+# Questions answered at once by one instance; the rest wait for a slot
+MAX_CONCURRENT_ANSWERS = int(os.environ.get("MAX_CONCURRENT_ANSWERS", 16))
+SUPABASE_MAX_CONNECTIONS = 32
+
+
+class AsyncAnswerService:
+    """
+    Answers questions on a single asyncio event loop running in a background
+    thread.
+
+    Request threads hand their work to the loop with `run`, so retrieval, the LLM
+    call and the Supabase writes of many concurrent questions are multiplexed on
+    one loop and one pooled HTTP client instead of each holding a worker.
+    """
+
+    def __init__(
+        self,
+        supabase_url,
+        supabase_key,
+        dbs,
+        voting_roll_df,
+        answer_cache=None,
+        stream_responses=True,
+        max_concurrent=MAX_CONCURRENT_ANSWERS,
+    ):
+        self.dbs = dbs
+        self.voting_roll_df = voting_roll_df
+        self.answer_cache = answer_cache
+        self.stream_responses = stream_responses
+        self.max_concurrent = max_concurrent
+        self._flights = AsyncSingleFlight()
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="answer-loop", daemon=True
+        )
+        self._thread.start()
+        self.run(self._setup(supabase_url, supabase_key))
+
+    async def _setup(self, supabase_url, supabase_key):
+        # Created on the loop so they bind to it
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_MAX_CONNECTIONS,
+            )
+        )
+        self.supabase = await acreate_client(
+            supabase_url, supabase_key, AsyncClientOptions(httpx_client=self._http)
+        )
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the service loop and block until it finishes."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def close(self, timeout=None):
+        """
+        Close the pooled HTTP client and stop the loop thread. Call it once no
+        request thread is waiting on `run` anymore.
+        """
+        self.run(self._http.aclose(), timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self.loop.close()
+
+    async def answer(self, query, response_type, card_id, raise_errors=False):
+        async with self._semaphore:
+            start = time.time()
+
+            writer = None
+            if self.stream_responses:
+                # Flushes run on the writer's thread pool, hop back onto the loop
+                writer = CoalescingWriter(
+                    lambda text: self.run(areplace_responses(self.supabase, text, card_id))
+                )
+
+            final_response, _ = await self._flights.do(
+                flight_key(query, response_type),
+                lambda: aanswer_query(
+                    query,
+                    response_type,
+                    self.voting_roll_df,
+                    *self.dbs,
+                    answer_cache=self.answer_cache,
+                    on_token=writer.push if writer else None,
+                ),
+            )
+
+            if writer:
+                await asyncio.to_thread(writer.drain)
+
+            elapsed = int((time.time() - start) * 1000)
+            response_chunk = final_response.get("response")
+            await awrite_card_result(
+                self.supabase,
+                card_id,
+                response_chunk,
+                final_response.get("citations", []),
+                elapsed,
+                replace=writer is not None and bool(response_chunk),
+                raise_errors=raise_errors,
+            )
+            logger.info(f"Completed async getanswer in {elapsed} ms")
+            return final_response
@@ -0,0 +1,38 @@
+"""
+usage: 'python benchmarks/bench_chain_setup.py'
+
+Measures the per-request cost of setting up the response chains: building a new
+ChatOpenAI client, prompt template and chain on every call (the previous
+behaviour) versus fetching the process-wide chain from chains.get_chain.
+No requests are sent to OpenAI.
+
+"""
+import logging
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
+
+# Chain construction only checks that a key is present
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from api import RESPONSE_TYPE_DEPTH, RESPONSE_TYPE_GENERAL
+from chains import CHAIN_FACTORIES, get_chain
+
+logging.disable(logging.INFO)
+
+
+def main():
+    number = 200
+    print(f"{'chain':>10} {'rebuild (ms)':>14} {'get_chain (ms)':>16}")
+    for response_type in (RESPONSE_TYPE_DEPTH, RESPONSE_TYPE_GENERAL):
+        factory = CHAIN_FACTORIES[response_type]
+        rebuild = timeit.timeit(factory, number=number) / number
+        get_chain(response_type)
+        reuse = timeit.timeit(lambda: get_chain(response_type), number=number) / number
+        print(f"{response_type:>10} {rebuild * 1000:>14.3f} {reuse * 1000:>16.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+usage: 'python benchmarks/bench_ranking.py'
+
+Micro-benchmark of merging per-source retrieval results into the prompt ranking.
+Compares the previous approach (three sorts per source followed by a full sort of
+every candidate) with ranking.merge_and_rank on synthetic (document, score) lists.
+
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
+
+from ranking import merge_and_rank
+
+
+def legacy_sort_retrieved_documents(doc_list):
+    docs = sorted(doc_list, key=lambda x: x[1], reverse=True)
+    third = len(docs) // 3
+    highest_third = sorted(docs[:third], key=lambda x: x[1], reverse=True)
+    middle_third = sorted(docs[third : 2 * third], key=lambda x: x[1], reverse=True)
+    lowest_third = sorted(docs[2 * third :], key=lambda x: x[1], reverse=True)
+    return highest_third + lowest_third + middle_third
+
+
+def legacy_merge(retrieved_docs, max_docs=10):
+    all_docs = []
+    for docs in retrieved_docs.values():
+        all_docs.extend(legacy_sort_retrieved_documents(docs))
+    return sorted(all_docs, key=lambda x: x[1], reverse=False)[:max_docs]
+
+
+def make_candidates(sources, k, rng):
+    # FAISS returns each source's results sorted by distance
+    return {
+        f"source_{s}": [
+            (object(), float(score)) for score in np.sort(rng.gamma(2.0, 0.2, size=k))
+        ]
+        for s in range(sources)
+    }
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'sources x k':>14} {'legacy (us)':>12} {'merge_and_rank (us)':>20}")
+    for sources, k in [(5, 50), (5, 500), (5, 5000), (20, 5000)]:
+        retrieved_docs = make_candidates(sources, k, rng)
+        number = max(1, 20000 // (sources * k))
+        legacy = timeit.timeit(lambda: legacy_merge(retrieved_docs), number=number)
+        current = timeit.timeit(lambda: merge_and_rank(retrieved_docs), number=number)
+        print(
+            f"{f'{sources} x {k}':>14} {legacy / number * 1e6:>12.1f} "
+            f"{current / number * 1e6:>20.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import re
+
+import numpy as np
+
+# Same pattern as backend/src/keyword_indexer.py, which also stores it in each
+# keyword index: ordinance numbers such as "34,462" or "R-23-158" stay one token
+TOKEN_PATTERN = r"\w+(?:[.,\-/]\w+)*"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_token_regex = re.compile(TOKEN_PATTERN)
+
+
+def tokenize(text, regex=_token_regex):
+    return regex.findall(text.lower())
+
+
+def idf(num_docs, doc_freqs):
+    return np.log(1 + (num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+
+def length_norm(doc_lengths):
+    """Per-document part of the BM25 denominator."""
+    doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+    mean_length = max(doc_lengths.mean(), 1) if len(doc_lengths) else 1
+    return (BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / mean_length)).astype(
+        np.float32
+    )
+
+
+def term_weight(tf, norm):
+    """Saturated term frequency, multiplied by the term's idf to give its score."""
+    return tf * (BM25_K1 + 1) / (tf + norm)
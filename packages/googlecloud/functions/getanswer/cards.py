@@ -0,0 +1,91 @@
+import logging
+
+from helper import transform_citations
+
+logger = logging.getLogger(__name__)
+
+
+def card_response_params(card_id, response_chunk=None, citations=None, processing_time_ms=None):
+    """Arguments of the append_card_response and replace_card_response functions."""
+    return {
+        "p_card_id": card_id,
+        "p_response": {"response": response_chunk} if response_chunk else None,
+        "p_citations": transform_citations(citations) if citations is not None else None,
+        "p_processing_time_ms": processing_time_ms,
+    }
+
+
+def card_response_rpc(replace):
+    # Each is a single atomic statement in Postgres, see their migrations
+    return "replace_card_response" if replace else "append_card_response"
+
+
+def write_card_result(
+    supabase,
+    card_id,
+    response_chunk,
+    citations,
+    processing_time_ms,
+    replace=False,
+    raise_errors=False,
+):
+    """
+    Write the answer, citations and processing time to a card in one request.
+
+    :param replace: Overwrite the card's responses instead of appending, used when
+        partial answers have already been streamed into the card.
+    :param raise_errors: Re-raise write failures after logging them instead of
+        only logging them.
+    """
+    try:
+        supabase.rpc(
+            card_response_rpc(replace),
+            card_response_params(card_id, response_chunk, citations, processing_time_ms),
+        ).execute()
+        logger.info("Card result successfully written to Supabase")
+    except Exception as e:
+        logger.error(f"Failed to write card result to Supabase: {e}")
+        if raise_errors:
+            raise
+
+
+def replace_responses(supabase, response_text, card_id):
+    """Overwrite the card's responses with the text streamed so far."""
+    try:
+        supabase.rpc(
+            card_response_rpc(True), card_response_params(card_id, response_text)
+        ).execute()
+    except Exception as e:
+        logger.error(f"Failed to write streamed Supabase response: {e}")
+
+
+async def awrite_card_result(
+    supabase,
+    card_id,
+    response_chunk,
+    citations,
+    processing_time_ms,
+    replace=False,
+    raise_errors=False,
+):
+    """`write_card_result` for the async Supabase client."""
+    try:
+        await supabase.rpc(
+            card_response_rpc(replace),
+            card_response_params(card_id, response_chunk, citations, processing_time_ms),
+        ).execute()
+        logger.info("Card result successfully written to Supabase")
+    except Exception as e:
+        logger.error(f"Failed to write card result to Supabase: {e}")
+        if raise_errors:
+            raise
+
+
+async def areplace_responses(supabase, response_text, card_id):
+    """`replace_responses` for the async Supabase client."""
+    try:
+        await supabase.rpc(
+            card_response_rpc(True), card_response_params(card_id, response_text)
+        ).execute()
+    except Exception as e:
+        logger.error(f"Failed to write streamed Supabase response: {e}")
@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+
+import httpx
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_openai import ChatOpenAI
+
+from api import RESPONSE_TYPE_DEPTH, RESPONSE_TYPE_GENERAL
+from models import GENERAL_RESPONSE_LLM, INDEPTH_RESPONSE_LLM
+
+logger = logging.getLogger(__name__)
+
+INDEPTH_RESPONSE_PROMPT_TEMPLATE = """
+    You are an AI assistant tasked with analyzing New Orleans city council transcripts to answer specific questions. Your goal is to provide accurate, relevant, and concise responses based on the information contained in the provided documents. Follow these instructions carefully:
+    1. You will be given two inputs:
+    <question>{question}</question>
+    This is the specific question you need to answer based on the city council documents.
+
+    <docs>{docs}</docs>
+    These are the New Orleans city council documents you will analyze to answer the question.
+
+    2. Read and analyze the documents provided in the <docs> tags. Focus exclusively on finding information that is directly relevant to answering the question in the <question> tags.
+
+    3. When analyzing the documents, adhere to these guidelines:
+    a. Relevance criteria:
+        - Include only information that explicitly pertains to the question.
+        - Use indirectly relevant information only if it's necessary to clarify the context of the direct answer.
+        - Omit any information that is irrelevant or tangential to the question.
+
+    b. Summary guidelines (apply these only if they help answer the specific question):
+        - Extract key points, decisions, and actions from the city council meetings.
+        - Highlight any immediate shortcomings, mistakes, or negative actions by the city council.
+        - Elaborate on the implications and broader societal or community impacts of the identified issues.
+        - Investigate any underlying biases or assumptions present in the city council's discourse or actions.
+
+    c. Bias awareness:
+        - Be mindful that the documents were produced by the city council and may contain inherent biases toward its own behavior.
+
+    4. If the documents do not contain any relevant information in response to the <question> then return 'The documents do not provide sufficient information to respond to this query'. 
+
+    5. Format your response as follows:
+    - Deliver your answer in unformatted paragraph form.
+    - Do not use lists or bullet points.
+    - Do not mention document analysis methods or publication dates.
+
+    5. If your response includes technical or uncommon terms related to city council that may not be widely understood, provide definitions at the end of your response in this format:
+
+    Definitions:
+    Word: Definition
+    Word: Definition
+    Word: Definition
+
+    Ensure each definition is on a new line.
+
+    6. Remember to focus solely on answering the specific question provided, using only the information from the given documents.
+    """
+
+
+GENERAL_RESPONSE_PROMPT_TEMPLATE = """
+        As an AI assistant, your task is to provide a general response to the question "{question}", using the provided transcripts from New Orleans City Council meetings in "{docs}".
+
+        Guidelines for AI assistant: 
+        - Derive responses from factual information found within the transcripts. 
+        - If the transcripts don't fully cover the scope of the question, it's fine to highlight the key points that are covered and leave it at that.  
+        """
+
+# One keep-alive pool for every OpenAI call made by this process
+OPENAI_HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+OPENAI_HTTP_CLIENT = httpx.Client(limits=OPENAI_HTTP_LIMITS)
+# Async calls only run on AsyncAnswerService's long-lived loop, so its
+# connections stay bound to that one loop
+OPENAI_ASYNC_HTTP_CLIENT = httpx.AsyncClient(limits=OPENAI_HTTP_LIMITS)
+
+
+def create_llm(model_name):
+    return ChatOpenAI(
+        model_name=model_name,
+        http_client=OPENAI_HTTP_CLIENT,
+        http_async_client=OPENAI_ASYNC_HTTP_CLIENT,
+    )
+
+
+def create_indepth_response_chain():
+    llm = create_llm(INDEPTH_RESPONSE_LLM)
+    prompt_response = ChatPromptTemplate.from_template(INDEPTH_RESPONSE_PROMPT_TEMPLATE)
+    return prompt_response | llm | StrOutputParser()
+
+
+def create_general_response_chain():
+    # Only the legacy general responses use LLMChain, which newer langchain
+    # releases no longer ship
+    from langchain.chains import LLMChain
+
+    llm = create_llm(GENERAL_RESPONSE_LLM)
+    prompt = PromptTemplate(
+        input_variables=["question", "docs"],
+        template=GENERAL_RESPONSE_PROMPT_TEMPLATE,
+    )
+    return LLMChain(llm=llm, prompt=prompt)
+
+
+CHAIN_FACTORIES = {
+    RESPONSE_TYPE_DEPTH: create_indepth_response_chain,
+    RESPONSE_TYPE_GENERAL: create_general_response_chain,
+}
+
+_chains = {}
+_chains_lock = threading.Lock()
+
+
+def get_chain(response_type):
+    """
+    Return the chain for a response type, building it on first use.
+
+    Chains are stateless, so one instance per process is shared by every request,
+    along with the pooled sync and async HTTP clients of its model.
+    """
+    start = time.time()
+    chain = _chains.get(response_type)
+    if chain is None:
+        with _chains_lock:
+            chain = _chains.get(response_type)
+            if chain is None:
+                chain = _chains[response_type] = CHAIN_FACTORIES[response_type]()
+                logger.info(
+                    f"Built {response_type} chain in "
+                    f"{(time.time() - start) * 1000:.1f} ms"
+                )
+                return chain
+    logger.debug(
+        f"Reused {response_type} chain, setup took {(time.time() - start) * 1000:.3f} ms"
+    )
+    return chain
@@ -0,0 +1,59 @@
+import os
+import re
+from datetime import date
+
+# Same normalization as backend/src/metadata_indexer.py, which stores these
+# records in the chunk metadata. Used for indices built before it did, so keep
+# the two in step.
+
+# Transcripts use 11/16/2023, minutes and agendas 6-7-2018
+PUBLISH_DATE_PATTERN = re.compile(r"^\s*(\d{1,2})[/-](\d{1,2})[/-](\d{4})\s*$")
+
+
+def parse_publish_date(value):
+    """Parse an M/D/YYYY or M-D-YYYY publish date, returning None if it isn't one."""
+    if not isinstance(value, str):
+        return None
+    match = PUBLISH_DATE_PATTERN.match(value)
+    if match is None:
+        return None
+    month, day, year = (int(part) for part in match.groups())
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def format_publish_date(value):
+    """Normalize a publish date to MM/DD/YYYY for citations."""
+    parsed = parse_publish_date(value)
+    if parsed is not None:
+        return parsed.strftime("%m/%d/%Y")
+    return "Invalid date format" if value else "date not available"
+
+
+def timestamp_seconds(timestamp):
+    """Start of an "H:MM:SS-H:MM:SS" or "MM:SS" video timestamp in seconds."""
+    if not isinstance(timestamp, str) or "not available" in timestamp:
+        return None
+    try:
+        parts = [int(part) for part in timestamp.split("-")[0].strip().split(":")]
+    except ValueError:
+        return None
+    if not 1 <= len(parts) <= 3:
+        return None
+    return sum(part * 60**i for i, part in enumerate(reversed(parts)))
+
+
+def add_citation_record(metadata):
+    """Store the citation shown for a chunk, and its video offset in seconds, in its metadata."""
+    metadata["citation"] = {
+        "Title": metadata.get("title", metadata.get("source", "")),
+        "Published": format_publish_date(metadata.get("publish_date")),
+        "URL": metadata.get("url", "url not available"),
+        "Video timestamp": metadata.get("timestamp", "timestamp not available"),
+        "Name": os.path.basename(metadata.get("source", "source not available")),
+        "Page Number": metadata.get("page_number"),
+    }
+    metadata["timestamp_seconds"] = timestamp_seconds(metadata.get("timestamp"))
+    return metadata
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import threading
+
+from embedding_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def flight_key(query, response_type):
+    return (normalize_query(query), response_type)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls that share a key.
+
+    The first caller for a key runs the function; callers arriving while it is in
+    flight wait for and share its result (or exception) instead of repeating the
+    work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, leader) where leader is True for the caller that ran fn."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+
+        if not leader:
+            logger.info(f"Joined in-flight computation for {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.followers:
+                logger.info(f"Shared result for {key} with {call.followers} waiting requests")
+        return call.result, True
+
+
+class AsyncSingleFlight:
+    """Coroutine counterpart of `SingleFlight`; use from a single event loop."""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, coro_fn):
+        future = self._calls.get(key)
+        if future is not None:
+            logger.info(f"Joined in-flight computation for {key}")
+            return await asyncio.shield(future), False
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark the exception retrieved in case nobody joined
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._calls[key]
+        return result, True
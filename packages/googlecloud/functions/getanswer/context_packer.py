@@ -0,0 +1,109 @@
+import logging
+import os
+import re
+import threading
+
+import tiktoken
+
+from models import INDEPTH_RESPONSE_LLM
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 6000))
+
+# Chunks sharing this fraction of their word shingles are treated as duplicates
+DUPLICATE_OVERLAP = 0.8
+SHINGLE_SIZE = 8
+
+# Rough characters per token for English text, used when the tokenizer is unavailable
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    Load the tokenizer of the in-depth model once per process.
+
+    tiktoken downloads its vocabulary on first use, so a failure falls back to a
+    character based estimate instead of failing the request.
+    """
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                try:
+                    _encoding = tiktoken.encoding_for_model(INDEPTH_RESPONSE_LLM)
+                except KeyError:
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.error(f"Tokenizer unavailable, estimating token counts: {e}")
+                _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if not encoding:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        return {tuple(words)}
+    return {
+        tuple(words[i : i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def _is_duplicate(shingles, packed_shingles):
+    for other in packed_shingles:
+        overlap = len(shingles & other)
+        # Containment in either direction catches a chunk nested in a larger one
+        if overlap >= DUPLICATE_OVERLAP * min(len(shingles), len(other)):
+            return True
+    return False
+
+
+def pack_context(ranked_docs, token_budget=CONTEXT_TOKEN_BUDGET, max_docs=None):
+    """
+    Greedily fill a token budget with the highest scoring documents.
+
+    Documents are taken in the given order (best first). A document that would
+    overflow the budget is skipped so shorter ones further down can still fit, and
+    documents whose text largely overlaps one already packed are dropped.
+
+    :param ranked_docs: List of (Document, score) tuples, best first.
+    :return: Tuple of the packed (Document, score) tuples, best first, and the number of tokens they use.
+    """
+    packed = []
+    packed_shingles = []
+    tokens_used = 0
+    skipped_duplicates = 0
+
+    for doc, score in ranked_docs:
+        if max_docs is not None and len(packed) >= max_docs:
+            break
+
+        shingles = _shingles(doc.page_content)
+        if _is_duplicate(shingles, packed_shingles):
+            skipped_duplicates += 1
+            continue
+
+        # +1 for the blank line separating documents in the prompt
+        tokens = count_tokens(doc.page_content) + 1
+        if tokens_used + tokens > token_budget:
+            continue
+
+        packed.append((doc, score))
+        packed_shingles.append(shingles)
+        tokens_used += tokens
+
+    logger.info(
+        f"Packed {len(packed)} of {len(ranked_docs)} documents into {tokens_used}/"
+        f"{token_budget} context tokens, dropped {skipped_duplicates} duplicates"
+    )
+    return packed, tokens_used
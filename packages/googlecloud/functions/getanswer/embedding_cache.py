@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# /tmp is the only writable path on Cloud Functions and survives between requests
+# on a warm instance
+EMBEDDING_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH", "/tmp/sawt/query_embeddings.sqlite"
+)
+MEMORY_CACHE_SIZE = 1024
+DISK_CACHE_SIZE = 50000
+
+
+def normalize_query(text):
+    return " ".join(text.split()).casefold()
+
+
+def embedding_cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings object with a two-tier cache for query embeddings.
+
+    Lookups go through an in-process LRU first and then a SQLite table on disk.
+    Entries are keyed by a hash of the model name and the normalized query, so
+    questions that only differ in case or whitespace share an embedding. Document
+    embeddings are passed straight through.
+    """
+
+    def __init__(
+        self,
+        base_embeddings,
+        path=EMBEDDING_CACHE_PATH,
+        memory_size=MEMORY_CACHE_SIZE,
+        disk_size=DISK_CACHE_SIZE,
+    ):
+        self.base_embeddings = base_embeddings
+        self.model = getattr(
+            base_embeddings, "model", base_embeddings.__class__.__name__
+        )
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = self._connect(path)
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def _connect(self, path):
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT, vector BLOB, last_used REAL)"
+            )
+            conn.commit()
+            return conn
+        except sqlite3.Error as e:
+            logger.error(f"Query embedding disk cache unavailable, memory only: {e}")
+            return None
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        if self._conn is None:
+            return None
+        try:
+            row = self._conn.execute(
+                "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE query_embeddings SET last_used = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read query embedding from disk cache: {e}")
+            return None
+        return array("f", row[0]).tolist()
+
+    def _write_disk(self, key, vector):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+                (key, self.model, array("f", vector).tobytes(), time.time()),
+            )
+            # Evict least recently used rows once the table outgrows its budget
+            self._conn.execute(
+                "DELETE FROM query_embeddings WHERE key IN ("
+                "SELECT key FROM query_embeddings ORDER BY last_used DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.disk_size,),
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write query embedding to disk cache: {e}")
+
+    def _lookup(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return vector
+
+            vector = self._read_disk(key)
+            if vector is not None:
+                self._remember(key, vector)
+                self.hits_disk += 1
+                logger.info(f"Query embedding disk cache hit ({self.stats()})")
+            return vector
+
+    def _insert(self, key, vector):
+        with self._lock:
+            self.misses += 1
+            self._remember(key, vector)
+            self._write_disk(key, vector)
+        logger.info(f"Query embedding cache miss ({self.stats()})")
+
+    def embed_query(self, text):
+        key = embedding_cache_key(self.model, text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = self.base_embeddings.embed_query(text)
+            self._insert(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        key = embedding_cache_key(self.model, text)
+        # SQLite reads and writes, and waiting on the lock, would block the loop
+        vector = await asyncio.to_thread(self._lookup, key)
+        if vector is None:
+            vector = await self.base_embeddings.aembed_query(text)
+            await asyncio.to_thread(self._insert, key, vector)
+        return vector
+
+    def embed_documents(self, texts):
+        return self.base_embeddings.embed_documents(texts)
+
+    def stats(self):
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round((self.hits_memory + self.hits_disk) / lookups, 3)
+            if lookups
+            else None,
+        }
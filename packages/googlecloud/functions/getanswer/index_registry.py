@@ -0,0 +1,507 @@
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import pickle
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pandas as pd
+from langchain_community.vectorstores import FAISS
+
+import keyword_index
+import metadata_index
+from ranking import RRF_K
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ("fc", "cj", "pdf", "pc", "news")
+
+# Written by backend/src/sharding.py when a source is split into yearly shards
+SHARD_MANIFEST_FILE = "shards.json"
+
+# Separate from the retrieval pool, whose tasks wait on shard searches
+SHARD_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="shard-search")
+
+# Map the raw vectors instead of copying them onto the heap. IO_FLAG_MMAP_IFC
+# extends mmap support to flat indices on newer faiss builds.
+MMAP_IO_FLAGS = (
+    faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+)
+
+
+def file_size_mb(path):
+    return round(path.stat().st_size / 2**20, 1) if path.exists() else None
+
+
+def max_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LazyFAISS:
+    """
+    Stand-in for a FAISS vector store saved with `save_local`.
+
+    The index file is memory-mapped the first time the vectors are needed and the
+    docstore pickle is only loaded once the source is actually queried. Attribute
+    access is forwarded to the underlying langchain FAISS store, so callers can use
+    it exactly like the object returned by `FAISS.load_local`.
+    """
+
+    def __init__(self, name, folder_path, embeddings, index_name="index"):
+        self.name = name
+        self.folder_path = Path(folder_path)
+        self.embeddings = embeddings
+        self.index_name = index_name
+        self._index = None
+        self._store = None
+        self._lock = threading.Lock()
+        self._vector_ids = None
+        self._sidecars = {}
+        self.index_load_ms = None
+        self.docstore_load_ms = None
+
+    @property
+    def index_path(self):
+        return self.folder_path.joinpath(f"{self.index_name}.faiss")
+
+    @property
+    def docstore_path(self):
+        return self.folder_path.joinpath(f"{self.index_name}.pkl")
+
+    @property
+    def keyword_index_path(self):
+        return self.folder_path.joinpath(keyword_index.KEYWORD_INDEX_FILE)
+
+    @property
+    def metadata_index_path(self):
+        return self.folder_path.joinpath(metadata_index.METADATA_INDEX_FILE)
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    start = time.time()
+                    self._index = faiss.read_index(str(self.index_path), MMAP_IO_FLAGS)
+                    self.index_load_ms = int((time.time() - start) * 1000)
+                    logger.info(
+                        f"Memory-mapped {self.name} index ({self._index.ntotal} vectors) "
+                        f"in {self.index_load_ms} ms"
+                    )
+        return self._index
+
+    @property
+    def store(self):
+        if self._store is None:
+            index = self.index
+            with self._lock:
+                if self._store is None:
+                    start = time.time()
+                    with open(self.docstore_path, "rb") as f:
+                        docstore, index_to_docstore_id = pickle.load(f)
+                    self._store = FAISS(
+                        self.embeddings, index, docstore, index_to_docstore_id
+                    )
+                    self.docstore_load_ms = int((time.time() - start) * 1000)
+                    logger.info(
+                        f"Loaded {self.name} docstore in {self.docstore_load_ms} ms"
+                    )
+        return self._store
+
+    def _sidecar(self, path, load):
+        # Optional files built alongside the index; None when the index predates them
+        if path not in self._sidecars:
+            with self._lock:
+                if path not in self._sidecars:
+                    self._sidecars[path] = load(self.name, path) if path.exists() else None
+        return self._sidecars[path]
+
+    @property
+    def keyword_index(self):
+        """The BM25 keyword index built with this store, or None if there is none."""
+        return self._sidecar(self.keyword_index_path, keyword_index.timed_load)
+
+    @property
+    def metadata_index(self):
+        """Per-vector metadata built with this store, or None if there is none."""
+        return self._sidecar(self.metadata_index_path, metadata_index.timed_load)
+
+    @property
+    def files(self):
+        return [
+            self.index_path,
+            self.docstore_path,
+            self.keyword_index_path,
+            self.metadata_index_path,
+        ]
+
+    @property
+    def has_keyword_index(self):
+        return self.keyword_index is not None
+
+    @property
+    def has_dates(self):
+        return self.metadata_index is not None and self.metadata_index.has_dates
+
+    def ids_in_range(self, date_range):
+        """
+        Vector ids within the date range, or None to search the whole store when
+        there is no range, no dated documents to filter on, or no document in the
+        range, as when a number in the question was mistaken for a year.
+        """
+        if date_range is None or not self.has_dates:
+            return None
+        ids = self.metadata_index.ids_in_range(date_range)
+        if not len(ids):
+            logger.info(f"No {self.name} documents published {date_range}, searching all")
+            return None
+        return ids
+
+    def vector_search(self, query_vector, k, date_range=None):
+        """
+        Similarity search, restricted to documents published in the date range if
+        one is given.
+
+        :return: List of (Document, distance) tuples, nearest first.
+        """
+        ids = self.ids_in_range(date_range)
+        if ids is None:
+            return self.store.similarity_search_with_score_by_vector(query_vector, k=k)
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids))
+        distances, found = self.index.search(
+            np.asarray([query_vector], dtype=np.float32), k, params=params
+        )
+        keep = found[0] >= 0
+        return list(zip(self.documents(found[0][keep]), distances[0][keep].tolist()))
+
+    def keyword_search(self, query, k, date_range=None):
+        """
+        BM25 search of the keyword index, restricted like `vector_search`.
+
+        :return: List of (Document, BM25 score) tuples, best first.
+        """
+        ids, scores = self.keyword_index.search(query, k, self.ids_in_range(date_range))
+        return list(zip(self.documents(ids), scores.tolist()))
+
+    def documents(self, ids):
+        store = self.store
+        return [
+            store.docstore.search(store.index_to_docstore_id[int(i)]) for i in ids
+        ]
+
+    def vector_ids(self, docs):
+        """
+        Positions in the FAISS index of documents returned by this store, or -1 for
+        documents it didn't return.
+
+        The docstore hands out the stored Document objects themselves, so the
+        inverse of `index_to_docstore_id` is keyed by object identity and built
+        once per process.
+        """
+        if self._vector_ids is None:
+            store = self.store
+            with self._lock:
+                if self._vector_ids is None:
+                    self._vector_ids = {
+                        id(store.docstore.search(docstore_id)): i
+                        for i, docstore_id in store.index_to_docstore_id.items()
+                    }
+        return [self._vector_ids.get(id(doc), -1) for doc in docs]
+
+    def reconstruct(self, ids):
+        """Stored vectors for the given index positions as a float32 array."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return np.empty((0, self.index.d), dtype=np.float32)
+        return self.index.reconstruct_batch(ids)
+
+    def doc_vectors(self, docs):
+        """
+        Stored vectors of documents returned by this store.
+
+        :return: len(docs) x d float32 array, rows are NaN for documents from elsewhere.
+        """
+        ids = np.asarray(self.vector_ids(docs), dtype=np.int64)
+        vectors = np.full((len(docs), self.index.d), np.nan, dtype=np.float32)
+        found = ids >= 0
+        if found.any():
+            vectors[found] = self.reconstruct(ids[found])
+        return vectors
+
+    @property
+    def is_loaded(self):
+        return self._store is not None
+
+    def preload(self):
+        self.store
+
+    def __getattr__(self, attr):
+        # Only reached for attributes not defined on LazyFAISS itself
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.store, attr)
+
+    def stats(self):
+        return {
+            "source": self.name,
+            "index_mb": file_size_mb(self.index_path),
+            "docstore_mb": file_size_mb(self.docstore_path),
+            "keyword_mb": file_size_mb(self.keyword_index_path),
+            "metadata_mb": file_size_mb(self.metadata_index_path),
+            "index_mapped": self._index is not None,
+            "docstore_loaded": self._store is not None,
+            "index_load_ms": self.index_load_ms,
+            "docstore_load_ms": self.docstore_load_ms,
+        }
+
+
+class ShardedFAISS:
+    """
+    A source split into shards (one per publish year) listed in a manifest.
+
+    Each shard is a `LazyFAISS`. Searches run on the selected shards in parallel
+    and their best-first results are merged into one top k. With a date range,
+    shards whose publish dates lie entirely outside it are skipped without being
+    loaded.
+    """
+
+    def __init__(self, name, folder_path, embeddings, manifest):
+        self.name = name
+        self.folder_path = Path(folder_path)
+        self.embeddings = embeddings
+        self.manifest = manifest
+        self.shards = [
+            (
+                entry,
+                LazyFAISS(
+                    f"{name}/{entry['name']}",
+                    self.folder_path.joinpath(entry["path"]),
+                    embeddings,
+                ),
+            )
+            for entry in manifest["shards"]
+        ]
+        self._dated = any(entry.get("start") for entry, _ in self.shards)
+
+    @classmethod
+    def load(cls, name, folder_path, embeddings):
+        with open(Path(folder_path).joinpath(SHARD_MANIFEST_FILE)) as f:
+            return cls(name, folder_path, embeddings, json.load(f))
+
+    @property
+    def files(self):
+        files = [self.folder_path.joinpath(SHARD_MANIFEST_FILE)]
+        for _, shard in self.shards:
+            files.extend(shard.files)
+        return files
+
+    @property
+    def has_keyword_index(self):
+        return any(shard.has_keyword_index for _, shard in self.shards)
+
+    @property
+    def is_loaded(self):
+        return any(shard.is_loaded for _, shard in self.shards)
+
+    def preload(self):
+        for _, shard in self.shards:
+            shard.preload()
+
+    def shards_for(self, date_range):
+        """
+        Shards that can hold documents in the date range, with the date range to
+        search them with. Like `LazyFAISS.ids_in_range`, a range no shard covers
+        falls back to searching every shard in full.
+        """
+        if date_range is None or not self._dated:
+            return [shard for _, shard in self.shards], date_range
+        start, end = (d.isoformat() for d in date_range)
+        # Undated shards can't match a date filter
+        shards = [
+            shard
+            for entry, shard in self.shards
+            if entry.get("start") and entry["start"] <= end and entry["end"] >= start
+        ]
+        if not shards:
+            logger.info(f"No {self.name} shards cover {date_range}, searching all")
+            return [shard for _, shard in self.shards], None
+        return shards, date_range
+
+    def _search_shards(self, shards, search, *args):
+        futures = [SHARD_EXECUTOR.submit(search, shard, *args) for shard in shards]
+        return [future.result() for future in futures]
+
+    def vector_search(self, query_vector, k, date_range=None):
+        shards, date_range = self.shards_for(date_range)
+        results = self._search_shards(
+            shards, LazyFAISS.vector_search, query_vector, k, date_range
+        )
+        logger.info(f"Searched {len(shards)} of {len(self.shards)} {self.name} shards")
+        return list(
+            itertools.islice(heapq.merge(*results, key=lambda result: result[1]), k)
+        )
+
+    def keyword_search(self, query, k, date_range=None):
+        """
+        BM25 search of the selected shards. Each shard scores with its own term
+        statistics, so raw scores from different shards aren't comparable; the
+        results are merged by reciprocal rank within their shard instead.
+
+        :return: List of (Document, fused score) tuples, best first.
+        """
+        shards, date_range = self.shards_for(date_range)
+        shards = [shard for shard in shards if shard.has_keyword_index]
+        results = self._search_shards(
+            shards, LazyFAISS.keyword_search, query, k, date_range
+        )
+        fused = [
+            (doc, 1.0 / (RRF_K + rank + 1), score / shard_results[0][1])
+            for shard_results in results
+            for rank, (doc, score) in enumerate(shard_results)
+        ]
+        # Equal ranks are ordered by score relative to the shard's best match
+        fused.sort(key=lambda result: (-result[1], -result[2]))
+        return [(doc, rrf) for doc, rrf, _ in fused[:k]]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        return self.vector_search(embedding, k)
+
+    def similarity_search(self, query, k=4):
+        return [
+            doc for doc, _ in self.vector_search(self.embeddings.embed_query(query), k)
+        ]
+
+    def doc_vectors(self, docs):
+        vectors = None
+        # Documents can only come from shards that have been searched
+        for _, shard in self.shards:
+            if not shard.is_loaded:
+                continue
+            shard_vectors = shard.doc_vectors(docs)
+            if vectors is None:
+                vectors = shard_vectors
+            else:
+                found = ~np.isnan(shard_vectors).any(axis=1)
+                vectors[found] = shard_vectors[found]
+        if vectors is None:
+            return np.full((len(docs), 0), np.nan, dtype=np.float32)
+        return vectors
+
+    def stats(self):
+        shard_stats = [shard.stats() for _, shard in self.shards]
+
+        def total(key):
+            return round(sum(s[key] or 0 for s in shard_stats), 1)
+
+        return {
+            "source": f"{self.name} ({len(self.shards)} shards)",
+            "index_mb": total("index_mb"),
+            "docstore_mb": total("docstore_mb"),
+            "keyword_mb": total("keyword_mb"),
+            "metadata_mb": total("metadata_mb"),
+            "index_mapped": sum(s["index_mapped"] for s in shard_stats),
+            "docstore_loaded": sum(s["docstore_loaded"] for s in shard_stats),
+            "index_load_ms": total("index_load_ms"),
+            "docstore_load_ms": total("docstore_load_ms"),
+        }
+
+
+def open_store(name, folder_path, embeddings):
+    """A `ShardedFAISS` if the source was built in shards, otherwise a `LazyFAISS`."""
+    if Path(folder_path).joinpath(SHARD_MANIFEST_FILE).exists():
+        return ShardedFAISS.load(name, folder_path, embeddings)
+    return LazyFAISS(name, folder_path, embeddings)
+
+
+class LazyDataFrame:
+    """Defers `pd.read_csv` until the frame is first used."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._df = None
+        self._lock = threading.Lock()
+
+    @property
+    def df(self):
+        if self._df is None:
+            with self._lock:
+                if self._df is None:
+                    self._df = pd.read_csv(self.path)
+        return self._df
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.df, attr)
+
+    def __getitem__(self, key):
+        return self.df[key]
+
+    def __len__(self):
+        return len(self.df)
+
+
+class IndexRegistry:
+    """Lazily loaded in-depth FAISS indices keyed by source name."""
+
+    def __init__(self, cache_dir, embeddings, sources=SOURCES):
+        self.cache_dir = Path(cache_dir)
+        self.embeddings = embeddings
+        self.created_at = time.time()
+        self.stores = {
+            name: open_store(
+                name, self.cache_dir.joinpath(f"faiss_index_in_depth_{name}"), embeddings
+            )
+            for name in sources
+        }
+        self.voting_roll_df = LazyDataFrame(
+            self.cache_dir.joinpath("parsed_voting_rolls.csv")
+        )
+
+    def __getitem__(self, name):
+        return self.stores[name]
+
+    @property
+    def index_version(self):
+        """
+        Fingerprint of the index files on disk. Changes whenever the preprocessor
+        rebuilds and copies over any of the indices.
+        """
+        digest = hashlib.sha256()
+        for store in self.stores.values():
+            for path in store.files:
+                if path.exists():
+                    stat = path.stat()
+                    relative = path.relative_to(store.folder_path)
+                    digest.update(
+                        f"{store.name}/{relative}:{stat.st_size}:{stat.st_mtime_ns};".encode()
+                    )
+        return digest.hexdigest()[:16]
+
+    def preload(self, names=None):
+        """Eagerly load the given sources, e.g. to warm an instance."""
+        for name in names or self.stores:
+            self.stores[name].preload()
+
+    def report(self):
+        stats = [store.stats() for store in self.stores.values()]
+        for s in stats:
+            logger.info(
+                "{source}: index {index_mb} MB (mapped={index_mapped}, {index_load_ms} ms), "
+                "docstore {docstore_mb} MB (loaded={docstore_loaded}, "
+                "{docstore_load_ms} ms), keyword index {keyword_mb} MB, "
+                "metadata {metadata_mb} MB".format(**s)
+            )
+        logger.info(
+            f"Index registry ready {int((time.time() - self.created_at) * 1000)} ms "
+            f"after creation, max RSS {max_rss_mb():.0f} MB"
+        )
+        return stats
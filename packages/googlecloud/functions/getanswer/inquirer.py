@@ -1,95 +1,45 @@
+import asyncio
 import json
 import os
 import logging
 
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain_openai import ChatOpenAI
-from datetime import datetime
-
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableLambda, RunnableParallel
-
-from langchain.retrievers import ContextualCompressionRetriever
-
-
-from langchain.retrievers import ContextualCompressionRetriever
-from langchain.retrievers.document_compressors import (
-    DocumentCompressorPipeline,
-    EmbeddingsFilter,
-    LLMChainExtractor,
-    LLMChainFilter,
-)
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.document_transformers import EmbeddingsRedundantFilter
-from langchain_openai import OpenAIEmbeddings
-
-
-from helper import sort_retrieved_documents
+from chains import INDEPTH_RESPONSE_PROMPT_TEMPLATE, get_chain
+from citations import add_citation_record
+from context_packer import CONTEXT_TOKEN_BUDGET, count_tokens, pack_context
+from ranking import lost_in_the_middle, rank_candidates
+from metadata_index import parse_date_range
+from redundancy import drop_redundant
+from reranker import RERANK_SOURCE_K, is_enabled as reranker_enabled, rerank
+from retrieval import RETRIEVAL_EXECUTOR, aretrieve_from_sources, retrieve_from_sources
 from api import RESPONSE_TYPE_DEPTH, RESPONSE_TYPE_GENERAL
 
 logger = logging.getLogger(__name__)
 
 
-def convert_date_format(date_str):
-    """Convert date from 'M-D-YYYY' or 'MM-DD-YYYY' to 'MM/DD/YYYY' format."""
-    if not isinstance(date_str, str):
-        return "Invalid input: not a string"
-
-    if "/" in date_str:
-        return date_str
-
-    input_format = "%m-%d-%Y"
-
-    try:
-        date_obj = datetime.strptime(date_str, input_format)
-    except ValueError:
-        try:
-            input_format = "%-m-%-d-%Y"
-            date_obj = datetime.strptime(date_str, input_format)
-        except ValueError:
-            return "Invalid date format"
-
-    return date_obj.strftime("%m/%d/%Y")
-
-
-def timestamp_to_seconds(timestamp):
-    if "timestamp not available" in timestamp:
-        return None  # or another default value like -1 or 0
-
-    start_time = timestamp.split("-")[0]  # Split by '-' and take the first part
-    print(start_time)
-
-    time_parts = [int(i) for i in start_time.split(":")]
-
-    if len(time_parts) == 3:
-        h, m, s = time_parts
-    elif len(time_parts) == 2:
-        h, m = time_parts
-        s = 0
-    else:
-        raise ValueError("Invalid timestamp format: " + timestamp)
-
-    return h * 3600 + m * 60 + s
+def citation_record(doc):
+    """
+    Citation record of a chunk and the start of its video timestamp in seconds,
+    as stored in the chunk metadata by the preprocessor.
+    """
+    metadata = doc.metadata
+    if "citation" not in metadata:
+        # Indices built before the preprocessor stored the record
+        metadata = add_citation_record(dict(metadata))
+    return metadata["citation"], metadata.get("timestamp_seconds")
 
 
 def extract_document_metadata(docs):
-    generated_titles = [
-        doc.metadata.get("title", doc.metadata.get("source", "")) for doc in docs
-    ]
-    page_numbers = [doc.metadata.get("page_number") for doc in docs]
+    records = [citation_record(doc) for doc in docs]
+    citations = [citation for citation, _ in records]
+    generated_titles = [citation["Title"] for citation in citations]
+    page_numbers = [citation["Page Number"] for citation in citations]
     generated_sources = [
         doc.metadata.get("source", "source not available") for doc in docs
     ]
-    publish_dates = [
-        convert_date_format(doc.metadata.get("publish_date", "date not available"))
-        for doc in docs
-    ]
-    timestamps = [
-        doc.metadata.get("timestamp", "timestamp not available") for doc in docs
-    ]
-    urls = [doc.metadata.get("url", "url not available") for doc in docs]
+    publish_dates = [citation["Published"] for citation in citations]
+    timestamps = [citation["Video timestamp"] for citation in citations]
+    urls = [citation["URL"] for citation in citations]
+    timestamps_seconds = [seconds for _, seconds in records]
 
     return (
         generated_titles,
@@ -98,20 +48,10 @@ def extract_document_metadata(docs):
         publish_dates,
         timestamps,
         urls,
+        timestamps_seconds,
     )
 
 
-def timestamp_to_seconds(timestamp):
-    if "timestamp not available" in timestamp:
-        return None
-
-    time_parts = timestamp.split(":")
-    seconds = sum(
-        int(part) * 60**index for index, part in enumerate(reversed(time_parts))
-    )
-    return seconds
-
-
 def process_streamed_responses_llm(response_llm, docs):
     final_json_object = {"card_type": "in_depth", "response": "", "citations": []}
     unique_citations = set()
@@ -122,27 +62,19 @@ def process_streamed_responses_llm(response_llm, docs):
     # Update citations
     citations = []
     for doc in docs:
+        citation, _ = citation_record(doc)
         citation_signature = (
-            doc.metadata.get("title", doc.metadata.get("source", "")),
-            doc.metadata.get("url", "url not available"),
-            doc.metadata.get("timestamp", "timestamp not available"),
-            os.path.basename(doc.metadata.get("source", "source not available")),
-            doc.metadata.get("page_number"),
+            citation["Title"],
+            citation["URL"],
+            citation["Video timestamp"],
+            citation["Name"],
+            citation["Page Number"],
         )
 
         if citation_signature not in unique_citations:
             unique_citations.add(citation_signature)
-            citation = {
-                "Title": citation_signature[0],
-                "Published": convert_date_format(
-                    doc.metadata.get("publish_date", "date not available")
-                ),
-                "URL": citation_signature[1],
-                "Video timestamp": citation_signature[2],
-                "Name": citation_signature[3],
-                "Page Number": citation_signature[4],
-            }
-            citations.append(citation)
+            # Copied so the record stored in the docstore is never modified
+            citations.append(dict(citation))
 
     final_json_object["citations"].extend(citations)
 
@@ -158,6 +90,7 @@ def generate_response_section(
     publish_dates,
     timestamps,
     urls,
+    timestamps_seconds=(),
 ):
     section = {"response": response}
     section["source_title"] = generated_titles[i] if i < len(generated_titles) else None
@@ -172,7 +105,9 @@ def generate_response_section(
     section["source_url"] = urls[i] if i < len(urls) else None
 
     if section["source_url"] and section["source_timestamp"]:
-        time_in_seconds = timestamp_to_seconds(section["source_timestamp"])
+        time_in_seconds = (
+            timestamps_seconds[i] if i < len(timestamps_seconds) else None
+        )
         if time_in_seconds is not None:
             section["source_url"] += (
                 f"&t={time_in_seconds}s"
@@ -221,23 +156,44 @@ def transform_query_for_date(query):
     )
 
 
-def process_and_concat_documents(retrieved_docs, max_docs=10):
+def edit_query_for_retrieval(query):
+    return query + "If relevant, include source information that support and that do not support the query. Additionally, include perspectives from city council, civil society, and the public"
+
+
+def process_and_concat_documents(
+    retrieved_docs,
+    stores=None,
+    query=None,
+    max_docs=10,
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    max_candidates=None,
+):
     """
     Process and combine documents from multiple sources.
 
+    The best `max_candidates` documents across sources are packed into
+    `token_budget` tokens by fused score, at most `max_docs` of them, with
+    overlapping chunks dropped, and the packed set is reordered with
+    `lost_in_the_middle`. When the stores are given, near-duplicate candidates
+    are removed first using their stored vectors. When a reranker is configured
+    and the query is given, the candidates are reranked before packing.
+
     :param retrieved_docs: Dictionary with keys as source names and values as lists of (Document, score) tuples.
     :return: Tuple of combined string of all processed documents and list of original Document objects.
     """
     combined_docs_content = []
     original_documents = []
-    all_docs = []
 
-    for source, docs in retrieved_docs.items():
-        sorted_docs = sort_retrieved_documents(docs)
-        all_docs.extend(sorted_docs)
+    if max_candidates is None:
+        max_candidates = 80 if reranker_enabled() else 40
 
-    # Sort all documents by score and take the top max_docs
-    top_docs = sorted(all_docs, key=lambda x: x[1], reverse=False)[:max_docs]
+    candidates = rank_candidates(retrieved_docs, max_docs=max_candidates)
+    if stores is not None:
+        candidates = drop_redundant(candidates, retrieved_docs, stores)
+    if query is not None:
+        candidates = rerank(query, candidates)
+    packed, _ = pack_context(candidates, token_budget=token_budget, max_docs=max_docs)
+    top_docs = lost_in_the_middle(packed)
 
     for doc, score in top_docs:
         combined_docs_content.append(doc.page_content)
@@ -245,102 +201,121 @@ def process_and_concat_documents(retrieved_docs, max_docs=10):
 
     combined_content = "\n\n".join(combined_docs_content)
     return combined_content, original_documents
-def get_indepth_response_from_query(df, db_fc, db_cj, db_pdf, db_pc, db_news, query, k):
-    logger.info("Performing in-depth summary query...")
 
-    llm = ChatOpenAI(model_name="gpt-4o")
 
-    # New function to edit the query for document retrieval
-    def edit_query_for_retrieval(query):
-        return query + "If relevant, include source information that support and that do not support the query. Additionally, include perspectives from city council, civil society, and the public"
+def log_prompt_tokens(query, combined_docs_content):
+    prompt_tokens = (
+        count_tokens(INDEPTH_RESPONSE_PROMPT_TEMPLATE)
+        + count_tokens(query)
+        + count_tokens(combined_docs_content)
+    )
+    logger.info(f"In-depth prompt uses about {prompt_tokens} tokens in")
+    return prompt_tokens
 
-    retrievers = [db_fc, db_cj, db_pdf, db_pc, db_news]
-    retriever_names = ["fc", "cj"]
 
-    retrieval_chains = {
-        name: RunnableLambda(lambda q, db=db: db.similarity_search_with_score(edit_query_for_retrieval(q), k=50))
-        for name, db in zip(retriever_names, retrievers)
+def indepth_stores(db_fc, db_cj, db_pdf, db_pc, db_news):
+    return {
+        "fc": db_fc,
+        "cj": db_cj,
+        "pdf": db_pdf,
+        "pc": db_pc,
+        "news": db_news,
     }
-    retrievals = RunnableParallel(retrieval_chains)
-    retrieved_docs = retrievals.invoke(query)
 
-    combined_docs_content, original_documents = process_and_concat_documents(
-        retrieved_docs
-    )
 
-    template = """
-    You are an AI assistant tasked with analyzing New Orleans city council transcripts to answer specific questions. Your goal is to provide accurate, relevant, and concise responses based on the information contained in the provided documents. Follow these instructions carefully:
-    1. You will be given two inputs:
-    <question>{question}</question>
-    This is the specific question you need to answer based on the city council documents.
+def retrieval_k(stores):
+    # A reranker can afford to look at a deeper pull from every source
+    if reranker_enabled():
+        return {name: RERANK_SOURCE_K for name in stores}
+    return None
 
-    <docs>{docs}</docs>
-    These are the New Orleans city council documents you will analyze to answer the question.
 
-    2. Read and analyze the documents provided in the <docs> tags. Focus exclusively on finding information that is directly relevant to answering the question in the <question> tags.
+def query_date_range(query):
+    date_range = parse_date_range(query)
+    if date_range is not None:
+        logger.info(f"Restricting retrieval to documents published {date_range}")
+    return date_range
 
-    3. When analyzing the documents, adhere to these guidelines:
-    a. Relevance criteria:
-        - Include only information that explicitly pertains to the question.
-        - Use indirectly relevant information only if it's necessary to clarify the context of the direct answer.
-        - Omit any information that is irrelevant or tangential to the question.
 
-    b. Summary guidelines (apply these only if they help answer the specific question):
-        - Extract key points, decisions, and actions from the city council meetings.
-        - Highlight any immediate shortcomings, mistakes, or negative actions by the city council.
-        - Elaborate on the implications and broader societal or community impacts of the identified issues.
-        - Investigate any underlying biases or assumptions present in the city council's discourse or actions.
+def get_indepth_response_from_query(
+    df, db_fc, db_cj, db_pdf, db_pc, db_news, query, k, on_token=None, query_vector=None
+):
+    logger.info("Performing in-depth summary query...")
+    stores = indepth_stores(db_fc, db_cj, db_pdf, db_pc, db_news)
+
+    retrieved_docs, retrieval_metrics = retrieve_from_sources(
+        stores,
+        edit_query_for_retrieval(query),
+        k=retrieval_k(stores),
+        keyword_query=query,
+        date_range=query_date_range(query),
+        query_vector=query_vector,
+    )
 
-    c. Bias awareness:
-        - Be mindful that the documents were produced by the city council and may contain inherent biases toward its own behavior.
+    combined_docs_content, original_documents = process_and_concat_documents(
+        retrieved_docs, stores, query
+    )
+    log_prompt_tokens(query, combined_docs_content)
 
-    4. If the documents do not contain any relevant information in response to the <question> then return 'The documents do not provide sufficient information to respond to this query'. 
+    response_chain = get_chain(RESPONSE_TYPE_DEPTH)
 
-    5. Format your response as follows:
-    - Deliver your answer in unformatted paragraph form.
-    - Do not use lists or bullet points.
-    - Do not mention document analysis methods or publication dates.
+    chain_input = {"question": query, "docs": combined_docs_content}
+    if on_token is None:
+        responses_llm = response_chain.invoke(chain_input)
+    else:
+        chunks = []
+        for chunk in response_chain.stream(chain_input):
+            chunks.append(chunk)
+            on_token(chunk)
+        responses_llm = "".join(chunks)
+    print(responses_llm)
 
-    5. If your response includes technical or uncommon terms related to city council that may not be widely understood, provide definitions at the end of your response in this format:
+    return process_streamed_responses_llm(responses_llm, original_documents)
 
-    Definitions:
-    Word: Definition
-    Word: Definition
-    Word: Definition
 
-    Ensure each definition is on a new line.
+async def aget_indepth_response_from_query(
+    df, db_fc, db_cj, db_pdf, db_pc, db_news, query, k, on_token=None, query_vector=None
+):
+    logger.info("Performing async in-depth summary query...")
+    stores = indepth_stores(db_fc, db_cj, db_pdf, db_pc, db_news)
+
+    retrieved_docs, retrieval_metrics = await aretrieve_from_sources(
+        stores,
+        edit_query_for_retrieval(query),
+        k=retrieval_k(stores),
+        keyword_query=query,
+        date_range=query_date_range(query),
+        query_vector=query_vector,
+    )
 
-    6. Remember to focus solely on answering the specific question provided, using only the information from the given documents.
-    """
+    # Reranking is CPU bound, keep it off the event loop
+    combined_docs_content, original_documents = await asyncio.to_thread(
+        process_and_concat_documents, retrieved_docs, stores, query
+    )
+    log_prompt_tokens(query, combined_docs_content)
 
-    prompt_response = ChatPromptTemplate.from_template(template)
-    response_chain = prompt_response | llm | StrOutputParser()
+    response_chain = get_chain(RESPONSE_TYPE_DEPTH)
 
-    responses_llm = response_chain.invoke(
-        {"question": query, "docs": combined_docs_content}
-    )
-    print(responses_llm)
+    chain_input = {"question": query, "docs": combined_docs_content}
+    if on_token is None:
+        responses_llm = await response_chain.ainvoke(chain_input)
+    else:
+        chunks = []
+        async for chunk in response_chain.astream(chain_input):
+            chunks.append(chunk)
+            on_token(chunk)
+        responses_llm = "".join(chunks)
 
     return process_streamed_responses_llm(responses_llm, original_documents)
 
+
 def get_general_summary_response_from_query(db, query, k):
     logger.info("Performing general summary query...")
-    llm = ChatOpenAI(model_name="gpt-3.5-turbo-0613")
 
     docs = db.similarity_search(query, k=k)
 
     docs_page_content = " ".join([d.page_content for d in docs])
-    prompt = PromptTemplate(
-        input_variables=["question", "docs"],
-        template="""
-        As an AI assistant, your task is to provide a general response to the question "{question}", using the provided transcripts from New Orleans City Council meetings in "{docs}".
-
-        Guidelines for AI assistant: 
-        - Derive responses from factual information found within the transcripts. 
-        - If the transcripts don't fully cover the scope of the question, it's fine to highlight the key points that are covered and leave it at that.  
-        """,
-    )
-    chain_llm = LLMChain(llm=llm, prompt=prompt)
+    chain_llm = get_chain(RESPONSE_TYPE_GENERAL)
     responses_llm = chain_llm.run(question=query, docs=docs_page_content, temperature=0)
     response = {"response": responses_llm}
     card = {"card_type": RESPONSE_TYPE_GENERAL, "responses": [response]}
@@ -348,10 +323,31 @@ def get_general_summary_response_from_query(db, query, k):
     return card_json
 
 
-def route_question(df, db_fc, db_cj, db_pdf, db_pc, db_news, query, query_type, k=20):
+def route_question(
+    df,
+    db_fc,
+    db_cj,
+    db_pdf,
+    db_pc,
+    db_news,
+    query,
+    query_type,
+    k=20,
+    on_token=None,
+    query_vector=None,
+):
     if query_type == RESPONSE_TYPE_DEPTH:
         return get_indepth_response_from_query(
-            df, db_fc, db_cj, db_pdf, db_pc, db_news, query, k
+            df,
+            db_fc,
+            db_cj,
+            db_pdf,
+            db_pc,
+            db_news,
+            query,
+            k,
+            on_token=on_token,
+            query_vector=query_vector,
         )
     else:
         raise ValueError(
@@ -368,8 +364,116 @@ def answer_query(
     db_pdf: any,
     db_pc: any,
     db_news: any,
+    answer_cache: any = None,
+    on_token: any = None,
 ) -> str:
+    question_vector = query_vector = None
+    if answer_cache is not None:
+        # Keyed on the question itself: the retrieval instructions appended by
+        # edit_query_for_retrieval would pull every similarity up. Both are
+        # embedded at the same time so a miss doesn't wait on two round trips.
+        retrieval_embedding = RETRIEVAL_EXECUTOR.submit(
+            db_fc.embeddings.embed_query, edit_query_for_retrieval(query)
+        )
+        question_vector = answer_cache.embed(query)
+        cached_response = answer_cache.lookup(
+            query, response_type, vector=question_vector
+        )
+        if cached_response is not None:
+            return cached_response
+        query_vector = retrieval_embedding.result()
+
     final_response = route_question(
-        df, db_fc, db_cj, db_pdf, db_pc, db_news, query, response_type
+        df,
+        db_fc,
+        db_cj,
+        db_pdf,
+        db_pc,
+        db_news,
+        query,
+        response_type,
+        on_token=on_token,
+        query_vector=query_vector,
+    )
+
+    if answer_cache is not None and final_response.get("response"):
+        answer_cache.store(query, response_type, final_response, vector=question_vector)
+    return final_response
+
+
+async def aroute_question(
+    df,
+    db_fc,
+    db_cj,
+    db_pdf,
+    db_pc,
+    db_news,
+    query,
+    query_type,
+    k=20,
+    on_token=None,
+    query_vector=None,
+):
+    if query_type == RESPONSE_TYPE_DEPTH:
+        return await aget_indepth_response_from_query(
+            df,
+            db_fc,
+            db_cj,
+            db_pdf,
+            db_pc,
+            db_news,
+            query,
+            k,
+            on_token=on_token,
+            query_vector=query_vector,
+        )
+    else:
+        raise ValueError(
+            f"Invalid query_type. Expected {RESPONSE_TYPE_DEPTH}, got: {query_type}"
+        )
+
+
+async def aanswer_query(
+    query: str,
+    response_type: str,
+    df: any,
+    db_fc: any,
+    db_cj: any,
+    db_pdf: any,
+    db_pc: any,
+    db_news: any,
+    answer_cache: any = None,
+    on_token: any = None,
+) -> str:
+    question_vector = query_vector = None
+    if answer_cache is not None:
+        # Same as answer_query, the question and the retrieval query are embedded
+        # concurrently. Cache lookups touch SQLite, so keep them off the event loop.
+        question_vector, query_vector = await asyncio.gather(
+            asyncio.to_thread(answer_cache.embed, query),
+            db_fc.embeddings.aembed_query(edit_query_for_retrieval(query)),
+        )
+        cached_response = await asyncio.to_thread(
+            answer_cache.lookup, query, response_type, question_vector
+        )
+        if cached_response is not None:
+            return cached_response
+
+    final_response = await aroute_question(
+        df,
+        db_fc,
+        db_cj,
+        db_pdf,
+        db_pc,
+        db_news,
+        query,
+        response_type,
+        on_token=on_token,
+        query_vector=query_vector,
     )
-    return final_response
\ No newline at end of file
+
+    if answer_cache is not None and final_response.get("response"):
+        await asyncio.to_thread(
+            answer_cache.store, query, response_type, final_response, question_vector
+        )
+    return final_response
@@ -0,0 +1,155 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", "/tmp/sawt/jobs.sqlite")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_MAX_ATTEMPTS = 2
+
+JOB_QUEUED = "queued"
+JOB_PROCESSING = "processing"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Durable local queue of questions serviced by a pool of worker threads.
+
+    Jobs are stored in SQLite, so jobs that were queued or in progress when the
+    process stopped are picked up again on the next start. `handler` is called
+    with (card_id, query, response_type) and `on_status` with (card_id, status)
+    whenever a job changes state.
+    """
+
+    def __init__(
+        self,
+        handler,
+        on_status=None,
+        path=JOB_QUEUE_PATH,
+        workers=JOB_WORKERS,
+        max_attempts=JOB_MAX_ATTEMPTS,
+    ):
+        self.handler = handler
+        self.on_status = on_status
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        # One thread keeps status updates in order and off the request path
+        self._status_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="job-status"
+        )
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, card_id TEXT, query TEXT, "
+            "response_type TEXT, status TEXT, attempts INTEGER DEFAULT 0, "
+            "error TEXT, created_at REAL, updated_at REAL)"
+        )
+        # Anything left in progress belonged to a process that is gone
+        recovered = self._conn.execute(
+            "UPDATE jobs SET status = ? WHERE status = ?", (JOB_QUEUED, JOB_PROCESSING)
+        ).rowcount
+        self._conn.commit()
+        if recovered:
+            logger.info(f"Re-queued {recovered} interrupted jobs")
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def enqueue(self, card_id, query, response_type):
+        with self._available:
+            now = time.time()
+            job_id = self._conn.execute(
+                "INSERT INTO jobs (card_id, query, response_type, status, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (card_id, query, response_type, JOB_QUEUED, now, now),
+            ).lastrowid
+            self._conn.commit()
+            self._available.notify()
+        self._set_status(card_id, JOB_QUEUED)
+        logger.info(f"Queued job {job_id} for card {card_id}")
+        return job_id
+
+    def _claim(self):
+        with self._available:
+            row = self._conn.execute(
+                "SELECT id, card_id, query, response_type, attempts FROM jobs "
+                "WHERE status = ? ORDER BY id LIMIT 1",
+                (JOB_QUEUED,),
+            ).fetchone()
+            if row is None:
+                self._available.wait(timeout=5)
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ?",
+                (JOB_PROCESSING, time.time(), row[0]),
+            )
+            self._conn.commit()
+            return row
+
+    def _finish(self, job_id, status, error=None):
+        with self._available:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+            self._conn.commit()
+            if status == JOB_QUEUED:
+                self._available.notify()
+
+    def _set_status(self, card_id, status):
+        if self.on_status is not None:
+            self._status_executor.submit(self._report_status, card_id, status)
+
+    def _report_status(self, card_id, status):
+        try:
+            self.on_status(card_id, status)
+        except Exception as e:
+            logger.error(f"Failed to report status {status} for card {card_id}: {e}")
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                continue
+
+            job_id, card_id, query, response_type, attempts = job
+            self._set_status(card_id, JOB_PROCESSING)
+            start = time.time()
+            try:
+                self.handler(card_id, query, response_type)
+            except Exception as e:
+                logger.error(f"Job {job_id} for card {card_id} failed: {e}")
+                status = JOB_QUEUED if attempts + 1 < self.max_attempts else JOB_FAILED
+                self._finish(job_id, status, str(e))
+                if status == JOB_FAILED:
+                    self._set_status(card_id, JOB_FAILED)
+                continue
+
+            self._finish(job_id, JOB_DONE)
+            self._set_status(card_id, JOB_DONE)
+            logger.info(
+                f"Job {job_id} for card {card_id} done in "
+                f"{int((time.time() - start) * 1000)} ms"
+            )
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)",
+                (JOB_QUEUED, JOB_PROCESSING),
+            ).fetchone()[0]
@@ -0,0 +1,82 @@
+import logging
+import re
+import time
+
+import numpy as np
+
+from bm25 import idf, length_norm, term_weight, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Written next to index.faiss by backend/src/keyword_indexer.py
+KEYWORD_INDEX_FILE = "index.keyword.npz"
+
+
+class KeywordIndex:
+    """
+    BM25 over the inverted index the preprocessor builds alongside each FAISS
+    index. Document ids are FAISS vector ids.
+    """
+
+    def __init__(self, terms, offsets, doc_ids, term_freqs, doc_lengths, token_pattern):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs.astype(np.float32)
+        self.token_pattern = re.compile(token_pattern)
+        self.num_docs = len(doc_lengths)
+        # Computed once rather than per query
+        self.length_norm = length_norm(doc_lengths)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data["terms"],
+                data["offsets"],
+                data["doc_ids"],
+                data["term_freqs"],
+                data["doc_lengths"],
+                str(data["token_pattern"]),
+            )
+
+    def tokenize(self, text):
+        return tokenize(text, self.token_pattern)
+
+    def search(self, query, k, ids=None):
+        """
+        :param ids: Optional array of vector ids to restrict the search to.
+        :return: Tuple of arrays of the top k vector ids and their BM25 scores, best first.
+        """
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in set(self.tokenize(query)):
+            i = np.searchsorted(self.terms, term)
+            if i == len(self.terms) or self.terms[i] != term:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            postings = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            scores[postings] += idf(self.num_docs, end - start) * term_weight(
+                tf, self.length_norm[postings]
+            )
+
+        if ids is not None:
+            allowed = np.zeros(self.num_docs, dtype=bool)
+            allowed[ids] = True
+            scores[~allowed] = 0
+
+        matched = np.flatnonzero(scores)
+        if k < len(matched):
+            matched = matched[np.argpartition(-scores[matched], k)[:k]]
+        top = matched[np.argsort(-scores[matched], kind="stable")]
+        return top, scores[top]
+
+
+def timed_load(name, path):
+    start = time.time()
+    index = KeywordIndex.load(path)
+    logger.info(
+        f"Loaded {name} keyword index ({len(index.terms)} terms) in "
+        f"{int((time.time() - start) * 1000)} ms"
+    )
+    return index
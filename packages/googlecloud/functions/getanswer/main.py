@@ -6,17 +6,45 @@ import google.cloud.logging
 import functions_framework
 from supabase import create_client
 from dotenv import find_dotenv, load_dotenv
-from helper import parse_field, get_dbs
+from helper import parse_field, get_dbs, get_index_registry
+from answer_cache import ANSWER_CACHE_ENABLED, AnswerCache
+from cards import replace_responses, write_card_result
+from streaming import CoalescingWriter
+from async_handler import AsyncAnswerService
+from job_queue import JobQueue
+from coalesce import SingleFlight, flight_key
+from context_packer import get_encoding
+from reranker import get_scorer, is_enabled as reranker_enabled
 from inquirer import answer_query
 import os
 import json
+import uuid
+from functools import partial
 
 logging_client = google.cloud.logging.Client()
 logging_client.setup_logging()
 
 API_VERSION = "0.0.1"
 
-db_fc, db_cj, db_pdf, db_pc, db_news, voting_roll_df = get_dbs()
+# Write partial answers to the card while gpt-4o is still generating
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "true").lower() == "true"
+
+# Serve requests from a shared asyncio loop, see async_handler.py
+ASYNC_HANDLER = os.environ.get("ASYNC_HANDLER", "false").lower() == "true"
+
+# Acknowledge requests right away and answer them from a local job queue
+ENQUEUE_JOBS = os.environ.get("ENQUEUE_JOBS", "false").lower() == "true"
+
+index_registry = get_index_registry()
+db_fc, db_cj, db_pdf, db_pc, db_news, voting_roll_df = get_dbs(index_registry)
+answer_cache = None
+if ANSWER_CACHE_ENABLED:
+    answer_cache = AnswerCache(index_registry.embeddings, index_registry.index_version)
+# Load the tokenizer vocabulary and reranker model during cold start rather than
+# on the first question
+get_encoding()
+if reranker_enabled():
+    get_scorer()
 
 # Setup Supabase client
 load_dotenv(find_dotenv())
@@ -34,45 +62,94 @@ if not supabase_url or not supabase_key:
 
 supabase = create_client(supabase_url, supabase_key)
 
+answer_flights = SingleFlight()
+
+answer_service = None
+if ASYNC_HANDLER:
+    answer_service = AsyncAnswerService(
+        supabase_url,
+        supabase_key,
+        (db_fc, db_cj, db_pdf, db_pc, db_news),
+        voting_roll_df,
+        answer_cache=answer_cache,
+        stream_responses=STREAM_RESPONSES,
+    )
+
+
+def set_processing_status(card_id, status):
+    supabase.table("cards").update({"processing_status": status}).eq("id", card_id).execute()
 
-def update_responses(response_chunk, card_id):
-    try:
-        current_data = supabase.table("cards").select("responses").eq("id", card_id).execute()
-
-        if current_data.data and "responses" in current_data.data[0]:
-            updated_responses = current_data.data[0]["responses"]
-            updated_responses.append({"response": response_chunk})
-        else:
-            updated_responses = [{"response": response_chunk}]
-
-        supabase.table("cards").update({"responses": updated_responses}).eq("id", card_id).execute()
-        logging.info("Response data successfully updated in Supabase")
-    except Exception as e:
-        logging.error(f"Failed to update Supabase responses: {e}")
-
-
-def update_citations(citations, card_id, processing_time_ms):
-    transformed_citations = [
-        {
-            "source_title": cit["Title"],
-            "source_name": cit["Name"],
-            "source_publish_date": cit["Published"],
-            "source_url": cit["URL"],
-            "source_page_number": cit["Page Number"],
-            "source_timestamp": cit["Video timestamp"],  # Add this line
-        }
-        for cit in citations
-    ]
 
+def is_valid_card_id(card_id):
     try:
-        supabase.table("cards").update(
-            {
-                "citations": transformed_citations,
-                "processing_time_ms": processing_time_ms,
-            }
-        ).eq("id", card_id).execute()
-    except Exception as e:
-        logging.error(f"Failed to update Supabase citations: {e}")
+        uuid.UUID(str(card_id))
+        return True
+    except ValueError:
+        return False
+
+
+def answer_card(card_id, query, response_type, raise_errors=False):
+    """
+    Answer a question and write the result to its card. Returns the elapsed ms.
+
+    :param raise_errors: Raise when the result can't be written to the card, so the
+        job queue retries or fails the job instead of marking it done.
+    """
+    start = time.time()
+
+    if answer_service is not None:
+        answer_service.run(
+            answer_service.answer(query, response_type, card_id, raise_errors)
+        )
+        return int((time.time() - start) * 1000)
+
+    writer = None
+    if STREAM_RESPONSES:
+        # Streamed text replaces the card's responses on every flush, ending
+        # with the complete answer
+        writer = CoalescingWriter(lambda text: replace_responses(supabase, text, card_id))
+
+    # Identical questions in flight at the same time share one computation. Only
+    # the card that started it is streamed to, the others get the final answer.
+    final_response, _ = answer_flights.do(
+        flight_key(query, response_type),
+        lambda: answer_query(
+            query,
+            response_type,
+            voting_roll_df,
+            db_fc,
+            db_cj,
+            db_pdf,
+            db_pc,
+            db_news,
+            answer_cache=answer_cache,
+            on_token=writer.push if writer else None,
+        ),
+    )
+
+    if writer:
+        writer.drain()
+
+    elapsed = int((time.time() - start) * 1000)
+    response_chunk = final_response.get('response')
+    write_card_result(
+        supabase,
+        card_id,
+        response_chunk,
+        final_response.get('citations', []),
+        elapsed,
+        replace=writer is not None and bool(response_chunk),
+        raise_errors=raise_errors,
+    )
+    return elapsed
+
+
+# Created after answer_card is defined since its workers start right away
+job_queue = None
+if ENQUEUE_JOBS:
+    job_queue = JobQueue(
+        partial(answer_card, raise_errors=True), on_status=set_processing_status
+    )
 
 
 @functions_framework.http
@@ -103,7 +180,6 @@ def getanswer(request):
     headers = {"Access-Control-Allow-Origin": "*"}
 
     logging.info(f"getanswer {API_VERSION}")
-    start = time.time()
 
     # Parse args
     content_type = request.headers["Content-Type"]
@@ -119,17 +195,13 @@ def getanswer(request):
 
     logging.info("Request parsed")
 
-    final_response = answer_query(
-        query, response_type, voting_roll_df, db_fc, db_cj, db_pdf, db_pc, db_news
-    )
-
-    response_chunk = final_response.get('response')
-    if response_chunk:
-        update_responses(response_chunk, card_id)
-
-    elapsed = int((time.time() - start) * 1000)
-    update_citations(final_response.get('citations', []), card_id, elapsed)
+    if job_queue is not None:
+        if not is_valid_card_id(card_id):
+            return (f"Invalid card_id: {card_id}", 400, headers)
+        job_queue.enqueue(card_id, query, response_type)
+        return ("Answer queued", 202, headers)
 
-    logging.info(f"Completed getanswer in {elapsed} seconds")
+    elapsed = answer_card(card_id, query, response_type)
+    logging.info(f"Completed getanswer in {elapsed} ms")
 
     return ("Answer successfully submitted to Supabase", 200, headers)
@@ -0,0 +1,138 @@
+import calendar
+import logging
+import re
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Written next to index.faiss by backend/src/metadata_indexer.py
+METADATA_INDEX_FILE = "index.metadata.npz"
+
+MONTHS = {
+    name.lower(): number
+    for number, name in enumerate(calendar.month_name)
+    if name
+}
+MONTH_PATTERN = "|".join(MONTHS)
+
+# Four digit numbers outside this range, up to the current year, aren't years
+EARLIEST_YEAR = 1990
+# Words after a number that make it a count or an address rather than a year, as
+# in "the 1500 block of Canal St"
+NOT_YEAR_WORDS = (
+    "block|blocks|locations|cameras|people|residents|units|homes|households|"
+    "feet|acres|miles|dollars|officers|employees|students|calls|cases|times"
+)
+# Not part of an ordinance number such as "2023-0123" or followed by a noun
+YEAR_PATTERN = rf"(\d{{4}})(?![.,\-/]\d)(?!\s+(?:{NOT_YEAR_WORDS})\b)"
+
+
+class MetadataIndex:
+    """
+    Columnar per-vector metadata (publish date, title, source type) built by the
+    preprocessor alongside each FAISS index. Row i describes vector id i.
+    """
+
+    def __init__(self, publish_dates, titles, source_type):
+        self.publish_dates = publish_dates
+        self.titles = titles
+        self.source_type = source_type
+        self.has_dates = bool((~np.isnat(publish_dates)).any())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["publish_dates"], data["titles"], str(data["source_type"]))
+
+    def ids_in_range(self, date_range):
+        """Vector ids published within the inclusive (start, end) date range."""
+        start, end = (np.datetime64(d, "D") for d in date_range)
+        # NaT compares False, so undated documents are excluded
+        return np.flatnonzero(
+            (self.publish_dates >= start) & (self.publish_dates <= end)
+        ).astype(np.int64)
+
+
+def timed_load(name, path):
+    start = time.time()
+    index = MetadataIndex.load(path)
+    logger.info(
+        f"Loaded {name} metadata index ({len(index.titles)} rows) in "
+        f"{int((time.time() - start) * 1000)} ms"
+    )
+    return index
+
+
+def _month_range(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _search_years(pattern, text, today):
+    """
+    First match of pattern whose years are all plausible.
+
+    :return: Tuple of the match and its years, or (None, None).
+    """
+    for match in re.finditer(pattern, text):
+        years = [int(group) for group in match.groups() if group.isdigit()]
+        if all(EARLIEST_YEAR <= year <= today.year for year in years):
+            return match, years
+    return None, None
+
+
+def parse_date_range(query, today=None):
+    """
+    Find the publish date range a question is scoped to, if it names one.
+
+    Recognizes "last/this week|month|year", "<month> <year>", "in|during <year>",
+    "since <year>" and "between <year> and <year>". Only numbers from
+    EARLIEST_YEAR to the current year count as years, and not when a noun such
+    as "block" follows them.
+
+    :return: Inclusive (start, end) tuple of dates, or None.
+    """
+    today = today or date.today()
+    text = query.lower()
+
+    match = re.search(r"\b(last|past|this) (week|month|year)\b", text)
+    if match:
+        which, unit = match.groups()
+        if unit == "week":
+            days = today.weekday() if which == "this" else 7
+            return today - timedelta(days=days), today
+        if unit == "month":
+            if which == "this":
+                return _month_range(today.year, today.month)
+            if which == "past":
+                return today - timedelta(days=31), today
+            last = today.replace(day=1) - timedelta(days=1)
+            return _month_range(last.year, last.month)
+        if which == "this":
+            return date(today.year, 1, 1), today
+        if which == "past":
+            return today - timedelta(days=365), today
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+
+    match, years = _search_years(rf"\b({MONTH_PATTERN}),? {YEAR_PATTERN}\b", text, today)
+    if match:
+        return _month_range(years[0], MONTHS[match.group(1)])
+
+    match, years = _search_years(
+        rf"\bbetween {YEAR_PATTERN} and {YEAR_PATTERN}\b", text, today
+    )
+    if match:
+        first, last = sorted(years)
+        return date(first, 1, 1), date(last, 12, 31)
+
+    match, years = _search_years(rf"\bsince {YEAR_PATTERN}\b", text, today)
+    if match:
+        return date(years[0], 1, 1), today
+
+    match, years = _search_years(rf"\b(?:in|during) {YEAR_PATTERN}\b", text, today)
+    if match:
+        return date(years[0], 1, 1), date(years[0], 12, 31)
+
+    return None
@@ -0,0 +1,4 @@
+# OpenAI models used by the response chains. Kept apart from chains.py so
+# modules that only need the names, like the tokenizer, don't import langchain.
+INDEPTH_RESPONSE_LLM = "gpt-4o"
+GENERAL_RESPONSE_LLM = "gpt-3.5-turbo-0613"
@@ -0,0 +1,129 @@
+import numpy as np
+
+FUSION_DISTANCE = "distance"
+FUSION_RRF = "rrf"
+FUSION_ZSCORE = "zscore"
+
+# Smoothing constant from the original reciprocal rank fusion paper
+RRF_K = 60
+
+
+def lost_in_the_middle(ranked_docs):
+    """
+    Reorder documents ranked best first so the most relevant third leads, the
+    least relevant third follows and the middle third goes last, keeping the
+    weakest material away from the start of the prompt.
+    """
+    third = len(ranked_docs) // 3
+    return (
+        ranked_docs[:third]
+        + ranked_docs[2 * third :]
+        + ranked_docs[third : 2 * third]
+    )
+
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores in descending order."""
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def distance_matrix(retrieved_docs):
+    """Pack per-source distances into a sources x k array padded with NaN."""
+    doc_lists = list(retrieved_docs.values())
+    width = max(len(docs) for docs in doc_lists)
+    distances = np.full((len(doc_lists), width), np.nan, dtype=np.float32)
+    for row, docs in enumerate(doc_lists):
+        distances[row, : len(docs)] = [score for _, score in docs]
+    return distances
+
+
+def fuse_scores(distances, method=FUSION_RRF, rrf_k=RRF_K):
+    """
+    Turn raw per-source L2 distances into scores comparable across sources.
+
+    The indices are built independently, so their distance distributions differ
+    and raw distances favour whichever source happens to be densest. `rrf` scores
+    each candidate by its rank within its own source, `zscore` standardizes the
+    distances of each source, and `distance` keeps the raw (negated) distances.
+
+    :param distances: sources x k array of distances padded with NaN.
+    :return: Array of the same shape where higher is more relevant and padding is -inf.
+    """
+    missing = np.isnan(distances)
+    if method == FUSION_RRF:
+        # NaN sorts last, so padding never outranks a real candidate
+        ranks = np.argsort(np.argsort(distances, axis=1, kind="stable"), axis=1)
+        fused = 1.0 / (rrf_k + ranks + 1)
+    elif method == FUSION_ZSCORE:
+        with np.errstate(invalid="ignore"):
+            mean = np.nanmean(distances, axis=1, keepdims=True)
+            std = np.nanstd(distances, axis=1, keepdims=True)
+        std[~(std > 0)] = 1.0
+        fused = -(distances - mean) / std
+    elif method == FUSION_DISTANCE:
+        fused = -distances
+    else:
+        raise ValueError(f"Unknown fusion method: {method}")
+
+    fused = fused.astype(np.float32)
+    fused[missing] = -np.inf
+    return fused
+
+
+def rank_candidates(retrieved_docs, max_docs=10, fusion=FUSION_RRF):
+    """
+    Merge per-source results into one list ranked best first.
+
+    Per-source scores are fused in one batched pass. A document found by more than
+    one result list (e.g. by both the vector and the keyword search of a source)
+    is listed once with its fused scores summed, or their maximum for raw
+    distances. The top `max_docs` are then selected with a single partition.
+
+    :param retrieved_docs: Dictionary with keys as source names and values as lists of (Document, score) tuples.
+    :return: List of (Document, fused score) tuples, best first. Higher fused scores are more relevant.
+    """
+    retrieved_docs = {name: docs for name, docs in retrieved_docs.items() if docs}
+    if not retrieved_docs:
+        return []
+
+    distances = distance_matrix(retrieved_docs)
+    fused = fuse_scores(distances, fusion).ravel()
+    valid = np.flatnonzero(np.isfinite(fused))
+
+    width = distances.shape[1]
+    doc_lists = list(retrieved_docs.values())
+    docs = []
+    slots = {}
+    inverse = np.empty(len(valid), dtype=np.int64)
+    for n, i in enumerate(valid):
+        doc = doc_lists[i // width][i % width][0]
+        slot = slots.setdefault(id(doc), len(docs))
+        if slot == len(docs):
+            docs.append(doc)
+        inverse[n] = slot
+
+    if fusion == FUSION_DISTANCE:
+        totals = np.full(len(docs), -np.inf, dtype=np.float32)
+        np.maximum.at(totals, inverse, fused[valid])
+    else:
+        totals = np.zeros(len(docs), dtype=np.float32)
+        np.add.at(totals, inverse, fused[valid])
+
+    return [(docs[i], float(totals[i])) for i in top_k_indices(totals, max_docs)]
+
+
+def merge_and_rank(retrieved_docs, max_docs=10, fusion=FUSION_RRF):
+    """
+    Merge per-source results into one ranked list for the prompt.
+
+    Candidates are selected with `rank_candidates` and reordered with
+    `lost_in_the_middle`.
+
+    :param retrieved_docs: Dictionary with keys as source names and values as lists of (Document, score) tuples.
+    :return: List of (Document, fused score) tuples in prompt order. Higher fused scores are more relevant.
+    """
+    return lost_in_the_middle(rank_candidates(retrieved_docs, max_docs, fusion))
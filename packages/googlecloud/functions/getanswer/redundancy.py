@@ -0,0 +1,97 @@
+import logging
+import os
+
+import numpy as np
+
+from retrieval import base_source
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity above which two chunks are considered the same content
+REDUNDANCY_THRESHOLD = float(os.environ.get("REDUNDANCY_THRESHOLD", 0.95))
+
+
+def candidate_vectors(candidates, retrieved_docs, stores):
+    """
+    Look up the stored index vectors of ranked candidates.
+
+    :param candidates: List of (Document, score) tuples.
+    :param retrieved_docs: Dictionary of source name to the (Document, score) tuples the candidates came from.
+    :param stores: Dictionary of source name to `LazyFAISS` or `ShardedFAISS` store.
+    :return: len(candidates) x d float32 array, rows are NaN where no vector was found.
+    """
+    source_of = {
+        id(doc): base_source(name)
+        for name, docs in retrieved_docs.items()
+        for doc, _ in docs
+    }
+    rows_by_source = {}
+    for row, (doc, _) in enumerate(candidates):
+        name = source_of.get(id(doc))
+        if name in stores:
+            rows_by_source.setdefault(name, []).append(row)
+
+    vectors = None
+    for name, rows in rows_by_source.items():
+        source_vectors = stores[name].doc_vectors([candidates[row][0] for row in rows])
+        if not source_vectors.shape[1]:
+            continue
+        if vectors is None:
+            vectors = np.full(
+                (len(candidates), source_vectors.shape[1]), np.nan, dtype=np.float32
+            )
+        vectors[rows] = source_vectors
+
+    if vectors is None:
+        return np.full((len(candidates), 0), np.nan, dtype=np.float32)
+    return vectors
+
+
+def redundant_mask(vectors, threshold=REDUNDANCY_THRESHOLD):
+    """
+    Flag rows that nearly duplicate an earlier, kept row.
+
+    Rows are assumed ordered best first, so of each group of near-duplicates only
+    the highest ranked one survives. Rows without a vector are never flagged.
+
+    :param vectors: n x d array of vectors, NaN rows for unknown vectors.
+    :return: Boolean array, True for rows to drop.
+    """
+    n = len(vectors)
+    dropped = np.zeros(n, dtype=bool)
+    known = ~np.isnan(vectors).any(axis=1) if vectors.size else np.zeros(n, dtype=bool)
+    if known.sum() < 2:
+        return dropped
+
+    unit = np.zeros_like(vectors)
+    norms = np.linalg.norm(vectors[known], axis=1, keepdims=True)
+    unit[known] = vectors[known] / np.maximum(norms, 1e-12)
+    # Only pairs (i, j) with i ranked above j can cause j to be dropped
+    similar = np.triu(unit @ unit.T > threshold, k=1)
+    similar[~known] = False
+
+    # A chunk only counts as a duplicate of chunks that were themselves kept
+    for j in np.flatnonzero(similar.any(axis=0)):
+        if (similar[:, j] & ~dropped).any():
+            dropped[j] = True
+    return dropped
+
+
+def drop_redundant(candidates, retrieved_docs, stores, threshold=REDUNDANCY_THRESHOLD):
+    """
+    Remove near-duplicate candidates using the vectors stored in the indices.
+
+    :param candidates: List of (Document, score) tuples, best first.
+    :return: The candidates without near-duplicates, best first.
+    """
+    if len(candidates) < 2:
+        return candidates
+
+    vectors = candidate_vectors(candidates, retrieved_docs, stores)
+    dropped = redundant_mask(vectors, threshold)
+    kept = [candidate for candidate, drop in zip(candidates, dropped) if not drop]
+    logger.info(
+        f"Dropped {len(candidates) - len(kept)} of {len(candidates)} candidates as "
+        f"near-duplicates (cosine > {threshold})"
+    )
+    return kept
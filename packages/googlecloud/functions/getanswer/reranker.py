@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from bm25 import idf, length_norm, term_weight, tokenize
+from ranking import RRF_K
+
+logger = logging.getLogger(__name__)
+
+RERANKER_NONE = "none"
+RERANKER_BM25 = "bm25"
+RERANKER_CROSS_ENCODER = "cross-encoder"
+
+RERANKER = os.environ.get("RERANKER", RERANKER_NONE).lower()
+# Any sentence-transformers cross-encoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BUDGET_MS = int(os.environ.get("RERANK_BUDGET_MS", 300))
+RERANK_BATCH_SIZE = 16
+# Per-source retrieval depth when a reranker picks the final documents
+RERANK_SOURCE_K = 40
+
+
+class BM25Scorer:
+    """
+    Okapi BM25 over the candidate set itself.
+
+    Term statistics come from the candidates being reranked, which is enough to
+    favour chunks that share rare query terms with the question.
+    """
+
+    # Seconds one batch took to score last time, used to stop before the deadline
+    batch_seconds = 0.0
+
+    def prepare(self, query, texts):
+        """Precompute the per-request term statistics passed back to `score`."""
+        terms = sorted(set(tokenize(query)))
+        docs = [Counter(tokenize(text)) for text in texts]
+        tf = np.array(
+            [[doc[term] for term in terms] for doc in docs], dtype=np.float32
+        ).reshape(len(docs), len(terms))
+        term_idf = idf(len(docs), (tf > 0).sum(axis=0))
+        norm = length_norm([sum(doc.values()) for doc in docs])
+        return tf, term_idf, norm
+
+    def score(self, prepared, rows):
+        tf, term_idf, norm = prepared
+        return term_weight(tf[rows], norm[rows, None]) @ term_idf
+
+
+class CrossEncoderScorer:
+    """Scores (query, chunk) pairs with a small local sentence-transformers model."""
+
+    def __init__(self, model_name=RERANK_MODEL):
+        # Optional dependency, only needed when this reranker is selected
+        from sentence_transformers import CrossEncoder
+
+        start = time.time()
+        self.model = CrossEncoder(model_name, device="cpu")
+        # The first prediction is slow, so run it here and measure a full batch
+        warm_up_start = time.time()
+        self.score(("warm up", ["warm up"] * RERANK_BATCH_SIZE), range(RERANK_BATCH_SIZE))
+        self.batch_seconds = time.time() - warm_up_start
+        logger.info(
+            f"Loaded reranker {model_name} in {int((time.time() - start) * 1000)} ms, "
+            f"{int(self.batch_seconds * 1000)} ms per batch"
+        )
+
+    def prepare(self, query, texts):
+        return query, texts
+
+    def score(self, prepared, rows):
+        query, texts = prepared
+        pairs = [(query, texts[row]) for row in rows]
+        return np.asarray(
+            self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        )
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_scorer(kind=RERANKER):
+    """Build the configured scorer once per process, falling back to BM25."""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None:
+            if kind == RERANKER_CROSS_ENCODER:
+                try:
+                    _scorer = CrossEncoderScorer()
+                except Exception as e:
+                    logger.error(f"Cross-encoder unavailable, reranking with BM25: {e}")
+                    _scorer = BM25Scorer()
+            else:
+                _scorer = BM25Scorer()
+    return _scorer
+
+
+def is_enabled(kind=RERANKER):
+    return kind in (RERANKER_BM25, RERANKER_CROSS_ENCODER)
+
+
+def rerank(query, candidates, budget_ms=RERANK_BUDGET_MS, batch_size=RERANK_BATCH_SIZE):
+    """
+    Rerank candidates by (query, chunk) relevance within a latency budget.
+
+    Candidates are scored in batches; the reranker rank is then fused with the
+    original rank using reciprocal rank fusion, so a chunk needs support from both
+    the vector search and the reranker to move to the top. If the next batch
+    would not finish within the budget, judging by how long the last one took,
+    or scoring fails, the candidates are returned unchanged.
+
+    :param candidates: List of (Document, score) tuples, best first.
+    :return: List of (Document, score) tuples, best first.
+    """
+    if not is_enabled() or len(candidates) < 2:
+        return candidates
+
+    start = time.time()
+    deadline = start + budget_ms / 1000
+    texts = [doc.page_content for doc, _ in candidates]
+    try:
+        scorer = get_scorer()
+        prepared = scorer.prepare(query, texts)
+        scores = np.empty(len(texts), dtype=np.float32)
+        for batch_start in range(0, len(texts), batch_size):
+            if time.time() + scorer.batch_seconds > deadline:
+                logger.warning(
+                    f"Reranking would exceed {budget_ms} ms after {batch_start} of "
+                    f"{len(texts)} candidates, keeping retrieval order"
+                )
+                return candidates
+            rows = np.arange(batch_start, min(batch_start + batch_size, len(texts)))
+            batch_start_time = time.time()
+            scores[rows] = scorer.score(prepared, rows)
+            scorer.batch_seconds = time.time() - batch_start_time
+    except Exception as e:
+        logger.error(f"Reranking failed, keeping retrieval order: {e}")
+        return candidates
+
+    rerank_ranks = np.argsort(np.argsort(-scores, kind="stable"), kind="stable")
+    fused = 1.0 / (RRF_K + np.arange(len(candidates)) + 1) + 1.0 / (
+        RRF_K + rerank_ranks + 1
+    )
+    order = np.argsort(-fused, kind="stable")
+    logger.info(
+        f"Reranked {len(candidates)} candidates with {scorer.__class__.__name__} in "
+        f"{int((time.time() - start) * 1000)} ms"
+    )
+    return [(candidates[i][0], float(fused[i])) for i in order]
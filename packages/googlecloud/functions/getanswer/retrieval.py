@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Rank fusion keeps the merged top 10 relevant with a shallower pull per source
+DEFAULT_K = 20
+DEFAULT_TIMEOUT_S = 15
+
+# Per-source overrides; sources not listed use DEFAULT_K / DEFAULT_TIMEOUT_S
+SOURCE_K = {}
+SOURCE_TIMEOUT_S = {}
+
+# Shared across requests so concurrent questions don't each spin up threads
+RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="retrieval")
+
+# Keyword results are returned as their own list, keyed by the source name plus
+# this suffix, so rank fusion treats them like one more source
+KEYWORD_SUFFIX = ":keyword"
+
+
+def base_source(name):
+    """Source name of a result list, with the keyword suffix removed."""
+    return name.split(KEYWORD_SUFFIX)[0]
+
+
+def _timed_search(db, query_vector, k, date_range=None):
+    start = time.time()
+    if hasattr(db, "vector_search"):
+        docs = db.vector_search(query_vector, k, date_range)
+    else:
+        # Plain langchain store, no date filtering
+        docs = db.similarity_search_with_score_by_vector(query_vector, k=k)
+    return docs, int((time.time() - start) * 1000)
+
+
+def _timed_keyword_search(db, query, k, date_range=None):
+    start = time.time()
+    # Negated so that, like vector distances, lower is better
+    docs = [(doc, -score) for doc, score in db.keyword_search(query, k, date_range)]
+    return docs, int((time.time() - start) * 1000)
+
+
+def _searches(stores, query_vector, keyword_query, k, date_range):
+    """Map of result list name to (source name, search function, arguments)."""
+    searches = {}
+    for name, db in stores.items():
+        source_k = k.get(name, DEFAULT_K)
+        searches[name] = (name, _timed_search, (db, query_vector, source_k, date_range))
+        if keyword_query and getattr(db, "has_keyword_index", False):
+            searches[name + KEYWORD_SUFFIX] = (
+                name,
+                _timed_keyword_search,
+                (db, keyword_query, source_k, date_range),
+            )
+    return searches
+
+
+def retrieve_from_sources(
+    stores,
+    query,
+    k=None,
+    timeouts=None,
+    embeddings=None,
+    keyword_query=None,
+    date_range=None,
+    query_vector=None,
+):
+    """
+    Run a similarity search against every store concurrently.
+
+    The query is embedded once and the same vector is searched in every store, so
+    the embedding round trip doesn't scale with the number of sources. All stores
+    must therefore share an embedding model. Stores that were built with a keyword
+    index are also searched with BM25 for `keyword_query` in parallel.
+
+    :param stores: Dictionary of source name to FAISS store.
+    :param query: Query text used for retrieval.
+    :param k: Optional dictionary of source name to number of documents to fetch.
+    :param timeouts: Optional dictionary of source name to timeout in seconds.
+    :param embeddings: Embeddings used to embed the query. Defaults to those of the
+        first store.
+    :param keyword_query: Optional query text for the keyword indices.
+    :param date_range: Optional inclusive (start, end) tuple of dates. Stores with a
+        metadata index only search documents published in that range.
+    :param query_vector: Optional embedding of `query`, when the caller already has
+        it. The query is not embedded again.
+    :return: Tuple of a dictionary of result list name to lists of (Document, score)
+        tuples and a dictionary of result list name to retrieval metrics. Keyword
+        results are listed under the source name plus `KEYWORD_SUFFIX`; their scores
+        are negated BM25 scores, so lower is better for every list.
+    """
+    k = {**SOURCE_K, **(k or {})}
+    timeouts = {**SOURCE_TIMEOUT_S, **(timeouts or {})}
+
+    if embeddings is None:
+        embeddings = next(iter(stores.values())).embeddings
+
+    if query_vector is None:
+        embed_start = time.time()
+        query_vector = embeddings.embed_query(query)
+        logger.info(f"Embedded query in {int((time.time() - embed_start) * 1000)} ms")
+
+    start = time.time()
+    searches = _searches(stores, query_vector, keyword_query, k, date_range)
+    futures = {
+        name: RETRIEVAL_EXECUTOR.submit(search, *args)
+        for name, (_, search, args) in searches.items()
+    }
+
+    retrieved_docs = {}
+    metrics = {}
+    for name, future in futures.items():
+        # Searches share the same starting point, so wait only for what is left
+        # of each source's budget
+        source = searches[name][0]
+        remaining = timeouts.get(source, DEFAULT_TIMEOUT_S) - (time.time() - start)
+        try:
+            docs, latency_ms = future.result(timeout=max(remaining, 0))
+            metrics[name] = {"status": "ok", "latency_ms": latency_ms, "docs": len(docs)}
+        except FutureTimeoutError:
+            docs = []
+            metrics[name] = {"status": "timeout", "latency_ms": None, "docs": 0}
+            logger.warning(f"Retrieval from {name} timed out")
+        except Exception as e:
+            docs = []
+            metrics[name] = {"status": "error", "latency_ms": None, "docs": 0}
+            logger.error(f"Retrieval from {name} failed: {e}")
+        retrieved_docs[name] = docs
+
+    elapsed = int((time.time() - start) * 1000)
+    logger.info(f"Retrieved from {len(stores)} sources in {elapsed} ms: {metrics}")
+    return retrieved_docs, metrics
+
+
+async def aretrieve_from_sources(
+    stores,
+    query,
+    k=None,
+    timeouts=None,
+    embeddings=None,
+    keyword_query=None,
+    date_range=None,
+    query_vector=None,
+):
+    """
+    Async counterpart of `retrieve_from_sources` with the same parameters and
+    return value. The query is embedded without blocking the event loop and the
+    searches are dispatched to the shared retrieval thread pool.
+    """
+    k = {**SOURCE_K, **(k or {})}
+    timeouts = {**SOURCE_TIMEOUT_S, **(timeouts or {})}
+
+    if embeddings is None:
+        embeddings = next(iter(stores.values())).embeddings
+
+    if query_vector is None:
+        embed_start = time.time()
+        query_vector = await embeddings.aembed_query(query)
+        logger.info(f"Embedded query in {int((time.time() - embed_start) * 1000)} ms")
+
+    loop = asyncio.get_running_loop()
+
+    async def run(name, source, search, args):
+        search_future = loop.run_in_executor(RETRIEVAL_EXECUTOR, search, *args)
+        try:
+            docs, latency_ms = await asyncio.wait_for(
+                search_future, timeouts.get(source, DEFAULT_TIMEOUT_S)
+            )
+            return docs, {"status": "ok", "latency_ms": latency_ms, "docs": len(docs)}
+        except asyncio.TimeoutError:
+            logger.warning(f"Retrieval from {name} timed out")
+            return [], {"status": "timeout", "latency_ms": None, "docs": 0}
+        except Exception as e:
+            logger.error(f"Retrieval from {name} failed: {e}")
+            return [], {"status": "error", "latency_ms": None, "docs": 0}
+
+    start = time.time()
+    # Checking for keyword indices may load them from disk
+    searches = await asyncio.to_thread(
+        _searches, stores, query_vector, keyword_query, k, date_range
+    )
+    results = await asyncio.gather(
+        *(run(name, *search) for name, search in searches.items())
+    )
+
+    retrieved_docs = {name: docs for name, (docs, _) in zip(searches, results)}
+    metrics = {name: metric for name, (_, metric) in zip(searches, results)}
+
+    elapsed = int((time.time() - start) * 1000)
+    logger.info(f"Retrieved from {len(stores)} sources in {elapsed} ms: {metrics}")
+    return retrieved_docs, metrics
@@ -0,0 +1,74 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_MS = 750
+FLUSH_MAX_TOKENS = 40
+
+# Shared by all writers; each writer keeps at most one flush in flight, so
+# writes to a card never overtake each other
+FLUSH_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="flush")
+
+
+class CoalescingWriter:
+    """
+    Accumulates streamed tokens and periodically writes the text so far.
+
+    A flush is due once `interval_ms` have passed since the previous one or
+    `max_tokens` tokens have arrived. Flushes run in the background so consuming
+    the stream never waits on the network, and tokens that arrive while a flush
+    is in flight are coalesced into the next one.
+    """
+
+    def __init__(self, write, interval_ms=FLUSH_INTERVAL_MS, max_tokens=FLUSH_MAX_TOKENS):
+        self.write = write
+        self.interval_s = interval_ms / 1000
+        self.max_tokens = max_tokens
+        self._chunks = []
+        self._pending_tokens = 0
+        self._in_flight = None
+        self.created_at = time.time()
+        self._last_flush = self.created_at
+        self.first_flush_ms = None
+        self.flushes = 0
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    def _flush_due(self):
+        return (
+            self._pending_tokens >= self.max_tokens
+            or time.time() - self._last_flush >= self.interval_s
+        )
+
+    def push(self, token):
+        self._chunks.append(token)
+        self._pending_tokens += 1
+        if not self._flush_due():
+            return
+        if self._in_flight is not None and not self._in_flight.done():
+            return
+
+        self._in_flight = FLUSH_EXECUTOR.submit(self.write, self.text)
+        self._pending_tokens = 0
+        self._last_flush = time.time()
+        self.flushes += 1
+        if self.first_flush_ms is None:
+            self.first_flush_ms = int((self._last_flush - self.created_at) * 1000)
+
+    def drain(self):
+        """Wait for any in-flight flush to land."""
+        if self._in_flight is not None:
+            self._in_flight.result()
+        logger.info(
+            f"Streamed response in {self.flushes} partial writes, first visible "
+            f"after {self.first_flush_ms} ms"
+        )
+
+    def close(self, final_text=None):
+        """Wait for any in-flight flush, then write the complete text."""
+        self.drain()
+        self.write(final_text if final_text is not None else self.text)
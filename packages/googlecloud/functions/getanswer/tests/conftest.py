@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+# getanswer's modules import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+@pytest.fixture
+def embeddings():
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+
+    return DeterministicFakeEmbedding(size=16)
+
+
+@pytest.fixture
+def save_store(tmp_path, embeddings):
+    """Save a FAISS store of the given texts and metadatas, returning its folder."""
+    from langchain_community.vectorstores import FAISS
+
+    def save(name, texts, metadatas=None):
+        folder = tmp_path.joinpath(name)
+        FAISS.from_texts(texts, embeddings, metadatas=metadatas).save_local(folder)
+        return folder
+
+    return save
+
+
+@pytest.fixture
+def keyword_arrays():
+    """Build keyword index arrays in the layout backend/src/keyword_indexer.py saves."""
+    from collections import Counter
+
+    import numpy as np
+
+    from bm25 import TOKEN_PATTERN, tokenize
+
+    def build(texts):
+        postings = {}
+        for doc_id, text in enumerate(texts):
+            for term, count in Counter(tokenize(text)).items():
+                postings.setdefault(term, []).append((doc_id, count))
+        terms = sorted(postings)
+        entries = [entry for term in terms for entry in postings[term]]
+        return {
+            "terms": np.array(terms, dtype=str),
+            "offsets": np.cumsum([0] + [len(postings[term]) for term in terms]),
+            "doc_ids": np.array([doc_id for doc_id, _ in entries], dtype=np.int32),
+            "term_freqs": np.array([count for _, count in entries], dtype=np.int32),
+            "doc_lengths": np.array(
+                [len(tokenize(text)) for text in texts], dtype=np.int32
+            ),
+            "token_pattern": np.array(TOKEN_PATTERN),
+        }
+
+    return build
@@ -0,0 +1,99 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from answer_cache import AnswerCache, query_specifics
+
+RESPONSE = {"response": [{"response": "The council voted 5-2."}]}
+
+
+class LetterEmbeddings:
+    """Embeds the letters of a text only, so texts differing in digits match."""
+
+    def embed_query(self, text):
+        vector = np.zeros(26, dtype=np.float32)
+        for char in text.lower():
+            if "a" <= char <= "z":
+                vector[ord(char) - ord("a")] += 1
+        return vector.tolist()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnswerCache(LetterEmbeddings(), "v1", path=tmp_path.joinpath("answers.sqlite"))
+
+
+def test_serves_rephrasings_of_the_same_question(cache):
+    cache.store("What did the council decide on the budget?", "in_depth", RESPONSE)
+
+    assert cache.lookup("what did the  council decide on the BUDGET?", "in_depth") == RESPONSE
+    assert cache.lookup("What did the council decide on the budget?", "general") is None
+
+
+def test_questions_differing_in_year_or_number_do_not_share_answers(cache):
+    cache.store("Budget votes in 2022", "in_depth", RESPONSE)
+    cache.store("What is ordinance 34,123 about?", "in_depth", RESPONSE)
+
+    assert cache.lookup("Budget votes in 2023", "in_depth") is None
+    assert cache.lookup("What is ordinance 34,124 about?", "in_depth") is None
+    assert cache.lookup("Budget votes in 2022", "in_depth") == RESPONSE
+
+
+def test_entries_of_other_index_versions_are_dropped(tmp_path):
+    path = tmp_path.joinpath("answers.sqlite")
+    AnswerCache(LetterEmbeddings(), "v1", path=path).store("budget", "in_depth", RESPONSE)
+
+    assert AnswerCache(LetterEmbeddings(), "v1", path=path).lookup("budget", "in_depth")
+    assert AnswerCache(LetterEmbeddings(), "v2", path=path).lookup("budget", "in_depth") is None
+
+
+def test_specifics_include_relative_date_ranges():
+    assert query_specifics("votes last year", today=date(2024, 5, 1)) != query_specifics(
+        "votes last year", today=date(2025, 5, 1)
+    )
+    assert query_specifics("police budget") == query_specifics("fire budget")
+
+
+class ZeroEmbeddings:
+    def embed_query(self, text):
+        return [0.0] * 4
+
+
+class CountingEmbeddings(LetterEmbeddings):
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+def test_precomputed_vectors_are_not_embedded_again(tmp_path):
+    embeddings = CountingEmbeddings()
+    cache = AnswerCache(embeddings, "v1", path=tmp_path.joinpath("answers.sqlite"))
+
+    vector = cache.embed("budget votes")
+    assert cache.lookup("budget votes", "in_depth", vector=vector) is None
+    cache.store("budget votes", "in_depth", RESPONSE, vector=vector)
+
+    assert embeddings.calls == 1
+    assert cache.lookup("Budget  votes", "in_depth") == RESPONSE
+
+
+def test_zero_vectors_are_never_cached(tmp_path):
+    cache = AnswerCache(ZeroEmbeddings(), "v1", path=tmp_path.joinpath("answers.sqlite"))
+    cache.store("budget", "in_depth", RESPONSE)
+
+    assert cache.embed("budget") is None
+    assert cache.lookup("budget", "in_depth") is None
+
+
+def test_unavailable_database_disables_the_cache(tmp_path):
+    # A directory can't be opened as a database
+    path = tmp_path.joinpath("answers.sqlite")
+    path.mkdir()
+    cache = AnswerCache(LetterEmbeddings(), "v1", path=path)
+
+    cache.store("budget", "in_depth", RESPONSE)
+    assert cache.lookup("budget", "in_depth") is None
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import async_handler
+from async_handler import AsyncAnswerService
+
+RESPONSE = {"response": "The council voted 5-2.", "citations": []}
+
+
+class InFlight:
+    """Fake aanswer_query that records how many answers run at once."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.current = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    async def __call__(self, query, *args, **kwargs):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        await asyncio.sleep(self.delay)
+        with self.lock:
+            self.current -= 1
+        return RESPONSE
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    writes = []
+
+    async def write_card_result(supabase, card_id, *args, **kwargs):
+        writes.append(card_id)
+
+    monkeypatch.setattr(async_handler, "awrite_card_result", write_card_result)
+    return writes
+
+
+def create_service(max_concurrent=2):
+    return AsyncAnswerService(
+        "http://localhost:54321",
+        "test-key",
+        (None,) * 5,
+        None,
+        stream_responses=False,
+        max_concurrent=max_concurrent,
+    )
+
+
+def test_concurrent_answers_are_limited(monkeypatch, writes):
+    fake = InFlight()
+    monkeypatch.setattr(async_handler, "aanswer_query", fake)
+    service = create_service(max_concurrent=2)
+
+    # Distinct questions, so none of them share a flight
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(
+            pool.map(
+                lambda i: service.run(service.answer(f"q{i}", "in_depth", f"card-{i}")),
+                range(6),
+            )
+        )
+    service.close()
+
+    assert results == [RESPONSE] * 6
+    assert fake.peak == 2
+    assert sorted(writes) == [f"card-{i}" for i in range(6)]
+
+
+def test_errors_reach_the_request_thread(monkeypatch, writes):
+    async def fail(*args, **kwargs):
+        raise RuntimeError("retrieval failed")
+
+    monkeypatch.setattr(async_handler, "aanswer_query", fail)
+    service = create_service()
+
+    with pytest.raises(RuntimeError, match="retrieval failed"):
+        service.run(service.answer("budget", "in_depth", "card-1"))
+    # The failed answer released its slot
+    monkeypatch.setattr(async_handler, "aanswer_query", InFlight(delay=0))
+    assert service.run(service.answer("budget", "in_depth", "card-2"), timeout=5) == RESPONSE
+    service.close()
+
+    assert writes == ["card-2"]
+
+
+def test_close_stops_the_loop_and_client():
+    service = create_service()
+    service.close(timeout=5)
+
+    assert not service._thread.is_alive()
+    assert service.loop.is_closed()
+    assert service._http.is_closed
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from cards import areplace_responses, awrite_card_result, replace_responses, write_card_result
+
+CARD_ID = "3f2b8c1e-0000-4000-8000-000000000000"
+CITATIONS = [
+    {
+        "Title": "Budget hearing",
+        "Name": "fc",
+        "Published": "10/1/2024",
+        "URL": "https://example.org/video",
+        "Page Number": None,
+        "Video timestamp": "1:15",
+    }
+]
+
+
+class FakeRequest:
+    def __init__(self, calls, name, params, error):
+        self.calls = calls
+        self.call = (name, params)
+        self.error = error
+
+    def execute(self):
+        if self.error:
+            raise self.error
+        self.calls.append(self.call)
+
+
+class FakeSupabase:
+    """Records the RPCs that were executed."""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def rpc(self, name, params):
+        return FakeRequest(self.calls, name, params, self.error)
+
+
+class FakeAsyncRequest(FakeRequest):
+    async def execute(self):
+        return super().execute()
+
+
+class FakeAsyncSupabase(FakeSupabase):
+    def rpc(self, name, params):
+        return FakeAsyncRequest(self.calls, name, params, self.error)
+
+
+def test_final_answer_is_appended_when_nothing_was_streamed():
+    supabase = FakeSupabase()
+    write_card_result(supabase, CARD_ID, "The council voted 5-2.", CITATIONS, 1200)
+
+    [(name, params)] = supabase.calls
+    assert name == "append_card_response"
+    assert params["p_card_id"] == CARD_ID
+    assert params["p_response"] == {"response": "The council voted 5-2."}
+    assert params["p_citations"][0]["source_timestamp"] == "1:15"
+    assert params["p_processing_time_ms"] == 1200
+
+
+def test_final_answer_replaces_streamed_text():
+    supabase = FakeSupabase()
+    replace_responses(supabase, "The council", CARD_ID)
+    write_card_result(
+        supabase, CARD_ID, "The council voted 5-2.", CITATIONS, 1200, replace=True
+    )
+
+    assert [name for name, _ in supabase.calls] == ["replace_card_response"] * 2
+    streamed, final = [params for _, params in supabase.calls]
+    assert streamed["p_response"] == {"response": "The council"}
+    assert streamed["p_citations"] is None and streamed["p_processing_time_ms"] is None
+    assert final["p_response"] == {"response": "The council voted 5-2."}
+    assert final["p_processing_time_ms"] == 1200
+
+
+def test_write_failures_are_logged(caplog):
+    write_card_result(FakeSupabase(RuntimeError("offline")), CARD_ID, "a", [], 1)
+
+    assert "offline" in caplog.text
+
+
+def test_write_failures_can_be_raised():
+    with pytest.raises(RuntimeError, match="offline"):
+        write_card_result(
+            FakeSupabase(RuntimeError("offline")), CARD_ID, "a", [], 1, raise_errors=True
+        )
+    with pytest.raises(RuntimeError, match="offline"):
+        asyncio.run(
+            awrite_card_result(
+                FakeAsyncSupabase(RuntimeError("offline")),
+                CARD_ID,
+                "a",
+                [],
+                1,
+                raise_errors=True,
+            )
+        )
+
+
+def test_async_writes_use_the_same_functions():
+    supabase = FakeAsyncSupabase()
+
+    async def write():
+        await areplace_responses(supabase, "The council", CARD_ID)
+        await awrite_card_result(supabase, CARD_ID, "The council voted.", [], 900, replace=True)
+        await awrite_card_result(supabase, CARD_ID, "Another answer.", [], 900)
+
+    asyncio.run(write())
+    assert [name for name, _ in supabase.calls] == [
+        "replace_card_response",
+        "replace_card_response",
+        "append_card_response",
+    ]
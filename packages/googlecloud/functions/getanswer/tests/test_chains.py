@@ -0,0 +1,12 @@
+import chains
+
+
+def test_models_share_the_pooled_http_clients(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+
+    first = chains.create_llm(chains.INDEPTH_RESPONSE_LLM)
+    second = chains.create_llm(chains.GENERAL_RESPONSE_LLM)
+
+    for llm in (first, second):
+        assert llm.http_client is chains.OPENAI_HTTP_CLIENT
+        assert llm.http_async_client is chains.OPENAI_ASYNC_HTTP_CLIENT
@@ -0,0 +1,93 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+from langchain_core.documents import Document
+
+import inquirer
+
+BACKEND_METADATA_INDEXER = (
+    Path(__file__).parents[4].joinpath("backend", "src", "metadata_indexer.py")
+)
+
+
+def test_stored_citation_record_is_used_as_is():
+    citation = {"Title": "Council meeting", "Published": "11/16/2023"}
+    doc = Document(
+        page_content="text",
+        metadata={"citation": citation, "timestamp_seconds": 75, "timestamp": "bad"},
+    )
+
+    assert inquirer.citation_record(doc) == (citation, 75)
+
+
+def test_legacy_metadata_builds_the_same_record():
+    doc = Document(
+        page_content="text",
+        metadata={
+            "title": "Council meeting",
+            "publish_date": "6-7-2018",
+            "url": "https://www.youtube.com/watch?v=abc",
+            "timestamp": "1:02:03-1:05:00",
+            "source": "/data/fc/meeting.json",
+        },
+    )
+
+    citation, seconds = inquirer.citation_record(doc)
+
+    assert citation["Published"] == "06/07/2018"
+    assert citation["Name"] == "meeting.json"
+    assert seconds == 3723
+
+
+def test_response_section_links_to_the_stored_offset():
+    docs = [
+        Document(
+            page_content="text",
+            metadata={
+                "citation": {
+                    "Title": "Council meeting",
+                    "Page Number": None,
+                    "Published": "11/16/2023",
+                    "Video timestamp": "0:01:15-0:02:00",
+                    "URL": "https://www.youtube.com/watch?v=abc",
+                },
+                "timestamp_seconds": 75,
+                "source": "/data/fc/meeting.json",
+            },
+        )
+    ]
+
+    section, _ = inquirer.generate_response_section(
+        0, "answer", *inquirer.extract_document_metadata(docs)
+    )
+
+    assert section["source_url"] == "https://www.youtube.com/watch?v=abc&t=75s"
+
+
+@pytest.mark.parametrize(
+    "metadata",
+    [
+        {"title": "Council meeting", "publish_date": "6-7-2018", "timestamp": "12:05"},
+        {"source": "/data/pdf/minutes.pdf", "publish_date": "6-7-18", "page_number": 3},
+        {"publish_date": "11/16/2023 ", "timestamp": "timestamp not available"},
+        {"publish_date": "", "url": "https://example.org", "timestamp": "1:xx"},
+        {},
+    ],
+)
+def test_legacy_record_matches_the_preprocessor(metadata):
+    if not BACKEND_METADATA_INDEXER.exists():
+        pytest.skip("backend sources not available")
+    spec = importlib.util.spec_from_file_location(
+        "backend_metadata_indexer", BACKEND_METADATA_INDEXER
+    )
+    backend = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(backend)
+    stored = backend.add_citation_record(dict(metadata))
+
+    citation, seconds = inquirer.citation_record(
+        Document(page_content="text", metadata=metadata)
+    )
+
+    assert citation == stored["citation"]
+    assert seconds == stored["timestamp_seconds"]
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from coalesce import AsyncSingleFlight, SingleFlight, flight_key
+
+
+def test_flight_key_normalizes_the_query():
+    assert flight_key("  What is the Budget? ", "in_depth") == flight_key(
+        "what is the budget?", "in_depth"
+    )
+    assert flight_key("budget", "in_depth") != flight_key("budget", "summary")
+
+
+def test_concurrent_calls_share_one_computation():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "answer"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flight.do, "key", compute)
+        started.wait()
+        followers = [executor.submit(flight.do, "key", compute) for _ in range(3)]
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert calls == [1]
+    assert results == [("answer", True)] + [("answer", False)] * 3
+
+
+def test_followers_get_the_leader_error_and_the_key_is_released():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("model timed out")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "key", fail)
+        started.wait()
+        follower = executor.submit(flight.do, "key", fail)
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError):
+                future.result()
+
+    assert flight.do("key", lambda: "answer") == ("answer", True)
+
+
+def test_async_calls_share_one_computation():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", compute) for _ in range(3)))
+
+    assert asyncio.run(main()) == [("answer", True), ("answer", False), ("answer", False)]
+    assert calls == [1]
+
+
+def test_async_error_reaches_followers_and_cancelled_follower_leaves_leader():
+    flight = AsyncSingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.1)
+        raise RuntimeError("model timed out")
+
+    async def compute():
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def main():
+        results = await asyncio.gather(
+            flight.do("error", fail), flight.do("error", fail), return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        leader = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        return await leader
+
+    assert asyncio.run(main()) == ("answer", True)
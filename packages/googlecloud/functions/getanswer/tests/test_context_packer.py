@@ -0,0 +1,51 @@
+import pytest
+from langchain_core.documents import Document
+
+import context_packer
+from context_packer import pack_context
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # One token per word, independent of the tokenizer vocabulary being available
+    monkeypatch.setattr(context_packer, "count_tokens", lambda text: len(text.split()))
+
+
+def ranked(*texts):
+    return [(Document(page_content=text), 1.0 - i / 10) for i, text in enumerate(texts)]
+
+
+def contents(packed):
+    return [doc.page_content for doc, _ in packed]
+
+
+def test_packs_best_first_within_the_budget():
+    docs = ranked("one two three", "four five six seven", "eight nine")
+
+    packed, tokens = pack_context(docs, token_budget=8)
+
+    # The second document would overflow, the shorter third one still fits
+    assert contents(packed) == ["one two three", "eight nine"]
+    assert tokens == 7
+    assert [score for _, score in packed] == [1.0, 0.8]
+
+
+def test_stops_at_max_docs():
+    docs = ranked("alpha", "beta", "gamma")
+
+    packed, _ = pack_context(docs, token_budget=100, max_docs=2)
+
+    assert contents(packed) == ["alpha", "beta"]
+
+
+def test_drops_overlapping_chunks():
+    text = "the council approved the surveillance camera ordinance after a long public hearing"
+    docs = ranked(text, text + " on tuesday", "the drainage contract was deferred")
+
+    packed, _ = pack_context(docs, token_budget=100)
+
+    assert contents(packed) == [text, "the drainage contract was deferred"]
+
+
+def test_empty_input():
+    assert pack_context([], token_budget=100) == ([], 0)
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+
+from embedding_cache import CachedQueryEmbeddings, embedding_cache_key
+
+
+class CountingEmbeddings:
+    model = "test-model"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return [float(len(text)), 1.0]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def test_repeated_query_is_served_from_memory(tmp_path):
+    base = CountingEmbeddings()
+    cache = CachedQueryEmbeddings(base, path=tmp_path.joinpath("q.sqlite"))
+
+    first = cache.embed_query("Police budget")
+    second = cache.embed_query("  police   BUDGET ")
+
+    assert first == second
+    assert base.calls == ["Police budget"]
+    assert cache.stats()["hits_memory"] == 1
+
+
+def test_disk_cache_survives_a_new_instance(tmp_path):
+    path = tmp_path.joinpath("q.sqlite")
+    CachedQueryEmbeddings(CountingEmbeddings(), path=path).embed_query("budget")
+
+    base = CountingEmbeddings()
+    cache = CachedQueryEmbeddings(base, path=path)
+
+    assert cache.embed_query("budget") == [6.0, 1.0]
+    assert base.calls == []
+    assert cache.stats()["hits_disk"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    base = CountingEmbeddings()
+    cache = CachedQueryEmbeddings(
+        base, path=tmp_path.joinpath("q.sqlite"), memory_size=2, disk_size=2
+    )
+    for text in ("a", "b", "c"):
+        cache.embed_query(text)
+
+    assert embedding_cache_key(base.model, "a") not in cache._memory
+    rows = cache._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+    assert rows[0] == 2
+
+    cache.embed_query("a")
+    assert base.calls == ["a", "b", "c", "a"]
+
+
+def test_keys_depend_on_model():
+    assert embedding_cache_key("m1", "budget") != embedding_cache_key("m2", "budget")
+
+
+def test_async_lookup_uses_the_same_cache(tmp_path):
+    base = CountingEmbeddings()
+    cache = CachedQueryEmbeddings(base, path=tmp_path.joinpath("q.sqlite"))
+    cache.embed_query("budget")
+
+    assert asyncio.run(cache.aembed_query("budget")) == [6.0, 1.0]
+    assert base.calls == ["budget"]
+
+
+def test_async_lookup_does_not_block_the_event_loop(tmp_path):
+    cache = CachedQueryEmbeddings(CountingEmbeddings(), path=tmp_path.joinpath("q.sqlite"))
+    # Another thread holds the cache, e.g. in the middle of a disk write
+    cache._lock.acquire()
+    threading.Timer(0.3, cache._lock.release).start()
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        await cache.aembed_query("budget")
+        ticker.cancel()
+        return ticks
+
+    assert asyncio.run(main()) > 10
+
+
+def test_disk_errors_fall_back_to_the_base_model(tmp_path):
+    base = CountingEmbeddings()
+    cache = CachedQueryEmbeddings(base, path=tmp_path.joinpath("q.sqlite"))
+    cache._conn.execute("DROP TABLE query_embeddings")
+
+    assert cache.embed_query("budget") == [6.0, 1.0]
+    assert base.calls == ["budget"]
@@ -0,0 +1,54 @@
+from index_registry import IndexRegistry, LazyDataFrame, LazyFAISS
+
+TEXTS = ["council budget vote", "police cameras", "drainage repairs"]
+
+
+def test_lazy_faiss_loads_nothing_until_queried(save_store, embeddings):
+    store = LazyFAISS("fc", save_store("fc", TEXTS), embeddings)
+
+    assert store.stats()["index_mapped"] is False
+    assert not store.is_loaded
+
+    results = store.similarity_search("police cameras", k=1)
+
+    assert results[0].page_content == "police cameras"
+    assert store.is_loaded
+    assert store.stats()["index_mapped"] is True
+
+
+def test_lazy_faiss_matches_vector_search_of_loaded_store(save_store, embeddings):
+    store = LazyFAISS("fc", save_store("fc", TEXTS), embeddings)
+    query_vector = embeddings.embed_query("drainage repairs")
+
+    docs = store.vector_search(query_vector, k=2)
+
+    assert [doc.page_content for doc, _ in docs][0] == "drainage repairs"
+    assert docs[0][1] <= docs[1][1]
+
+
+def test_registry_opens_sources_lazily(tmp_path, save_store, embeddings):
+    save_store("faiss_index_in_depth_fc", TEXTS)
+    registry = IndexRegistry(tmp_path, embeddings, sources=("fc",))
+
+    assert not registry["fc"].is_loaded
+    registry.preload()
+    assert registry["fc"].is_loaded
+
+
+def test_index_version_changes_when_an_index_is_rebuilt(tmp_path, save_store, embeddings):
+    save_store("faiss_index_in_depth_fc", TEXTS)
+    before = IndexRegistry(tmp_path, embeddings, sources=("fc",)).index_version
+
+    save_store("faiss_index_in_depth_fc", TEXTS + ["new text"])
+
+    assert IndexRegistry(tmp_path, embeddings, sources=("fc",)).index_version != before
+
+
+def test_lazy_data_frame_reads_on_first_use(tmp_path):
+    path = tmp_path.joinpath("rolls.csv")
+    path.write_text("a,b\n1,2\n")
+    df = LazyDataFrame(path)
+
+    assert df._df is None
+    assert len(df) == 1
+    assert list(df["a"]) == [1]
@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+import time
+
+from job_queue import JOB_DONE, JOB_FAILED, JOB_PROCESSING, JOB_QUEUED, JobQueue
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class StatusLog:
+    def __init__(self):
+        self.statuses = []
+        self.lock = threading.Lock()
+
+    def __call__(self, card_id, status):
+        with self.lock:
+            self.statuses.append((card_id, status))
+
+    def of(self, card_id):
+        with self.lock:
+            return [status for card, status in self.statuses if card == card_id]
+
+
+def test_job_runs_and_reports_status(tmp_path):
+    handled = []
+    statuses = StatusLog()
+    queue = JobQueue(
+        lambda *args: handled.append(args),
+        on_status=statuses,
+        path=tmp_path.joinpath("jobs.sqlite"),
+        workers=1,
+    )
+
+    queue.enqueue("card-1", "budget", "in_depth")
+
+    wait_for(lambda: statuses.of("card-1")[-1:] == [JOB_DONE])
+    assert handled == [("card-1", "budget", "in_depth")]
+    assert statuses.of("card-1") == [JOB_QUEUED, JOB_PROCESSING, JOB_DONE]
+    assert queue.pending() == 0
+
+
+def test_failed_job_is_retried(tmp_path):
+    attempts = []
+
+    def handler(card_id, query, response_type):
+        attempts.append(card_id)
+        if len(attempts) == 1:
+            raise RuntimeError("model timed out")
+
+    statuses = StatusLog()
+    queue = JobQueue(
+        handler, on_status=statuses, path=tmp_path.joinpath("jobs.sqlite"), workers=1
+    )
+
+    queue.enqueue("card-1", "budget", "in_depth")
+
+    wait_for(lambda: JOB_DONE in statuses.of("card-1"))
+    assert attempts == ["card-1", "card-1"]
+    assert JOB_FAILED not in statuses.of("card-1")
+
+
+def test_job_fails_after_max_attempts(tmp_path):
+    attempts = []
+
+    def handler(card_id, query, response_type):
+        attempts.append(card_id)
+        raise RuntimeError("model timed out")
+
+    path = tmp_path.joinpath("jobs.sqlite")
+    statuses = StatusLog()
+    queue = JobQueue(handler, on_status=statuses, path=path, workers=2, max_attempts=3)
+
+    queue.enqueue("card-1", "budget", "in_depth")
+
+    wait_for(lambda: JOB_FAILED in statuses.of("card-1"))
+    assert len(attempts) == 3
+    row = sqlite3.connect(path).execute("SELECT status, attempts, error FROM jobs").fetchone()
+    assert row == (JOB_FAILED, 3, "model timed out")
+    assert queue.pending() == 0
+
+
+def test_interrupted_jobs_are_picked_up_on_start(tmp_path):
+    path = tmp_path.joinpath("jobs.sqlite")
+    # A previous process that stopped with one job claimed and one waiting
+    JobQueue(lambda *args: None, path=path, workers=0)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO jobs (card_id, query, response_type, status, created_at, "
+        "updated_at) VALUES (?, 'budget', 'in_depth', ?, 0, 0)",
+        [("card-1", JOB_PROCESSING), ("card-2", JOB_QUEUED)],
+    )
+    conn.commit()
+
+    handled = []
+    queue = JobQueue(lambda card_id, *args: handled.append(card_id), path=path, workers=1)
+
+    wait_for(lambda: queue.pending() == 0)
+    assert handled == ["card-1", "card-2"]
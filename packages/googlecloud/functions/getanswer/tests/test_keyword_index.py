@@ -0,0 +1,64 @@
+import numpy as np
+
+from bm25 import tokenize
+from keyword_index import KeywordIndex
+from reranker import BM25Scorer
+
+TEXTS = [
+    "the council adopted ordinance R-23-158 on surveillance cameras",
+    "the council deferred the drainage contract",
+    "public comment on the council budget and the drainage contract",
+    "motion 34,462 on street lights passed",
+]
+
+
+def load(keyword_arrays, tmp_path, texts=TEXTS):
+    path = tmp_path.joinpath("index.keyword.npz")
+    np.savez(path, **keyword_arrays(texts))
+    return KeywordIndex.load(path)
+
+
+def test_ordinance_numbers_are_single_tokens():
+    assert tokenize("Ordinance R-23-158 and motion 34,462.") == [
+        "ordinance",
+        "r-23-158",
+        "and",
+        "motion",
+        "34,462",
+    ]
+
+
+def test_search_ranks_by_bm25(keyword_arrays, tmp_path):
+    index = load(keyword_arrays, tmp_path)
+
+    ids, scores = index.search("drainage contract", k=5)
+
+    # The shorter of the two matching chunks ranks first
+    assert ids.tolist() == [1, 2]
+    assert scores[0] > scores[1] > 0
+
+
+def test_search_matches_ordinance_numbers(keyword_arrays, tmp_path):
+    index = load(keyword_arrays, tmp_path)
+
+    assert index.search("R-23-158", k=5)[0].tolist() == [0]
+    assert index.search("34,462", k=5)[0].tolist() == [3]
+    assert index.search("zoning", k=5)[0].tolist() == []
+
+
+def test_search_keeps_top_k_and_allowed_ids(keyword_arrays, tmp_path):
+    index = load(keyword_arrays, tmp_path)
+
+    assert index.search("council", k=2)[0].tolist() == [1, 0]
+    assert index.search("council", k=5, ids=np.array([2]))[0].tolist() == [2]
+
+
+def test_reranker_scores_like_the_keyword_index(keyword_arrays, tmp_path):
+    index = load(keyword_arrays, tmp_path)
+    query = "council drainage R-23-158"
+
+    ids, scores = index.search(query, k=len(TEXTS))
+    scorer = BM25Scorer()
+    rerank_scores = scorer.score(scorer.prepare(query, TEXTS), np.arange(len(TEXTS)))
+
+    np.testing.assert_allclose(rerank_scores[ids], scores, rtol=1e-5)
@@ -0,0 +1,96 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from index_registry import LazyFAISS
+from metadata_index import METADATA_INDEX_FILE, MetadataIndex, parse_date_range
+
+TODAY = date(2024, 5, 15)
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("What passed last year?", (date(2023, 1, 1), date(2023, 12, 31))),
+        ("Votes this month", (date(2024, 5, 1), date(2024, 5, 31))),
+        ("Budget hearing in March 2022", (date(2022, 3, 1), date(2022, 3, 31))),
+        ("Budget hearing in march, 2022", (date(2022, 3, 1), date(2022, 3, 31))),
+        ("Drainage contracts between 2021 and 2019", (date(2019, 1, 1), date(2021, 12, 31))),
+        ("Police overtime since 2020", (date(2020, 1, 1), TODAY)),
+        ("What did the council do during 2018?", (date(2018, 1, 1), date(2018, 12, 31))),
+        ("How did the vote go in 2023", (date(2023, 1, 1), date(2023, 12, 31))),
+    ],
+)
+def test_parses_date_ranges(query, expected):
+    assert parse_date_range(query, today=TODAY) == expected
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "Crime in 1500 block of Canal St",
+        "Were cameras used in 2000 locations?",
+        "How many officers were hired in 2023 blocks of the city",
+        "Votes on ordinance in 2023-0123",
+        "Plans for the city in 2050",
+        "Contracts between 1200 and 1300 Poydras",
+        "Zoning rules",
+    ],
+)
+def test_ignores_numbers_that_are_not_years(query):
+    assert parse_date_range(query, today=TODAY) is None
+
+
+def test_skips_a_false_positive_to_find_a_later_year():
+    assert parse_date_range("Crime in 1500 block of Canal St in 2021", today=TODAY) == (
+        date(2021, 1, 1),
+        date(2021, 12, 31),
+    )
+
+
+def save_metadata(folder, publish_dates):
+    np.savez(
+        folder.joinpath(METADATA_INDEX_FILE),
+        publish_dates=np.array(publish_dates, dtype="datetime64[D]"),
+        titles=np.array([f"doc {i}" for i in range(len(publish_dates))]),
+        source_type=np.array("fc"),
+    )
+
+
+def test_ids_in_range_excludes_undated_documents(tmp_path):
+    save_metadata(tmp_path, ["2021-03-01", "NaT", "2022-07-04", "2021-12-31"])
+    index = MetadataIndex.load(tmp_path.joinpath(METADATA_INDEX_FILE))
+
+    ids = index.ids_in_range((date(2021, 1, 1), date(2021, 12, 31)))
+
+    assert ids.tolist() == [0, 3]
+
+
+def test_search_is_restricted_to_the_date_range(save_store, embeddings):
+    texts = ["budget 2021", "budget 2022", "budget 2023"]
+    folder = save_store("fc", texts)
+    save_metadata(folder, ["2021-06-01", "2022-06-01", "2023-06-01"])
+    store = LazyFAISS("fc", folder, embeddings)
+    query_vector = embeddings.embed_query("budget")
+
+    in_range = store.vector_search(
+        query_vector, k=3, date_range=(date(2022, 1, 1), date(2022, 12, 31))
+    )
+
+    assert [doc.page_content for doc, _ in in_range] == ["budget 2022"]
+
+
+def test_empty_date_range_falls_back_to_an_unfiltered_search(save_store, embeddings):
+    texts = ["budget 2021", "budget 2022", "budget 2023"]
+    folder = save_store("fc", texts)
+    save_metadata(folder, ["2021-06-01", "2022-06-01", "2023-06-01"])
+    store = LazyFAISS("fc", folder, embeddings)
+
+    results = store.vector_search(
+        embeddings.embed_query("budget"),
+        k=3,
+        date_range=(date(2010, 1, 1), date(2010, 12, 31)),
+    )
+
+    assert sorted(doc.page_content for doc, _ in results) == texts
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from ranking import (
+    FUSION_DISTANCE,
+    FUSION_RRF,
+    FUSION_ZSCORE,
+    RRF_K,
+    fuse_scores,
+    lost_in_the_middle,
+    merge_and_rank,
+    rank_candidates,
+    top_k_indices,
+)
+
+
+def results(name, distances):
+    return [(Document(page_content=f"{name} {i}"), d) for i, d in enumerate(distances)]
+
+
+def test_lost_in_the_middle_moves_the_middle_third_last():
+    assert lost_in_the_middle(list(range(9))) == [0, 1, 2, 6, 7, 8, 3, 4, 5]
+    assert lost_in_the_middle([0, 1]) == [0, 1]
+
+
+def test_top_k_indices_are_sorted_best_first():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+
+    assert top_k_indices(scores, 2).tolist() == [1, 3]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 0]
+
+
+def test_merge_and_rank_by_distance_keeps_the_nearest_documents():
+    retrieved = {
+        "fc": results("fc", [0.1, 0.4, 0.7]),
+        "cj": results("cj", [0.2, 0.5]),
+        "pdf": [],
+    }
+
+    ranked = merge_and_rank(retrieved, max_docs=3, fusion=FUSION_DISTANCE)
+
+    # Best first is fc 0, cj 0, fc 1, then the middle one moves last
+    assert [doc.page_content for doc, _ in ranked] == ["fc 0", "fc 1", "cj 0"]
+
+
+def test_merge_and_rank_of_nothing_is_empty():
+    assert merge_and_rank({"fc": [], "cj": []}) == []
+
+
+def test_rrf_scores_each_source_by_rank_only():
+    distances = np.array([[0.1, 0.2, np.nan], [10.0, 20.0, 30.0]], dtype=np.float32)
+
+    fused = fuse_scores(distances, FUSION_RRF)
+
+    assert fused[0, 0] == fused[1, 0] == np.float32(1 / (RRF_K + 1))
+    assert fused[0, 2] == -np.inf
+
+
+def test_zscore_standardizes_each_source():
+    distances = np.array([[1.0, 2.0, 3.0], [100.0, 200.0, 300.0]], dtype=np.float32)
+
+    fused = fuse_scores(distances, FUSION_ZSCORE)
+
+    np.testing.assert_allclose(fused[0], fused[1], rtol=1e-5)
+    assert fused[0, 0] > fused[0, 2]
+
+
+def test_rank_candidates_does_not_let_a_dense_source_dominate():
+    retrieved = {
+        "fc": results("fc", [0.01, 0.02, 0.03]),
+        "cj": results("cj", [0.5, 0.6, 0.7]),
+    }
+
+    by_distance = rank_candidates(retrieved, max_docs=2, fusion=FUSION_DISTANCE)
+    by_rank = rank_candidates(retrieved, max_docs=2, fusion=FUSION_RRF)
+
+    assert [doc.page_content for doc, _ in by_distance] == ["fc 0", "fc 1"]
+    assert sorted(doc.page_content for doc, _ in by_rank) == ["cj 0", "fc 0"]
+
+
+def test_unknown_fusion_method_is_rejected():
+    with pytest.raises(ValueError):
+        fuse_scores(np.zeros((1, 1), dtype=np.float32), "bogus")
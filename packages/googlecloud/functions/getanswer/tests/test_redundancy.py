@@ -0,0 +1,45 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from index_registry import LazyFAISS
+from redundancy import drop_redundant, redundant_mask
+
+
+def test_later_near_duplicate_is_dropped():
+    vectors = np.array([[1.0, 0.0], [0.0, 1.0], [0.99, 0.01]], dtype=np.float32)
+
+    assert redundant_mask(vectors, threshold=0.95).tolist() == [False, False, True]
+
+
+def test_duplicates_only_count_against_kept_rows():
+    # b duplicates a and c duplicates b but not a: once b is dropped, c stays
+    vectors = np.array([[1.0, 0.0], [0.97, 0.25], [0.88, 0.48]], dtype=np.float32)
+
+    assert redundant_mask(vectors, threshold=0.95).tolist() == [False, True, False]
+
+
+def test_rows_without_vectors_are_kept():
+    vectors = np.array([[1.0, 0.0], [np.nan, np.nan], [1.0, 0.0]], dtype=np.float32)
+
+    assert redundant_mask(vectors).tolist() == [False, False, True]
+    assert redundant_mask(np.full((3, 0), np.nan, dtype=np.float32)).tolist() == [
+        False
+    ] * 3
+
+
+def test_drop_redundant_uses_stored_vectors(save_store, embeddings):
+    texts = ["council budget hearing", "council budget hearing", "drainage contract"]
+    store = LazyFAISS("fc", save_store("fc", texts), embeddings)
+    results = store.vector_search(embeddings.embed_query("budget"), k=3)
+    # A document from elsewhere has no stored vector and is always kept
+    outside = (Document(page_content="council budget hearing"), 0.0)
+
+    kept = drop_redundant(results + [outside], {"fc": results, "cj": [outside]}, {"fc": store})
+
+    assert sorted(doc.page_content for doc, _ in kept) == [
+        "council budget hearing",
+        "council budget hearing",
+        "drainage contract",
+    ]
+    assert outside in kept
+    assert len(kept) == 3
@@ -0,0 +1,97 @@
+import time
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import reranker
+from reranker import BM25Scorer, rerank
+
+
+class SlowScorer:
+    batch_seconds = 0.0
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.batches = 0
+
+    def prepare(self, query, texts):
+        return texts
+
+    def score(self, prepared, rows):
+        self.batches += 1
+        time.sleep(self.seconds)
+        return np.zeros(len(rows), dtype=np.float32)
+
+
+@pytest.fixture
+def use_scorer(monkeypatch):
+    def use(scorer):
+        monkeypatch.setattr(reranker, "is_enabled", lambda: True)
+        monkeypatch.setattr(reranker, "_scorer", scorer)
+        return scorer
+
+    return use
+
+
+def candidates(*texts):
+    return [(Document(page_content=text), 1.0) for text in texts]
+
+
+def test_bm25_favours_rare_query_terms():
+    texts = [
+        "the council met on tuesday",
+        "the council discussed the drainage contract",
+        "the council met again",
+    ]
+    scorer = BM25Scorer()
+
+    scores = scorer.score(scorer.prepare("drainage council", texts), np.arange(3))
+
+    assert np.argmax(scores) == 1
+
+
+def test_rerank_fuses_scores_with_the_retrieval_rank(use_scorer):
+    use_scorer(BM25Scorer())
+    docs = candidates(
+        "the council met on tuesday",
+        "minutes of the meeting",
+        "surveillance cameras ordinance approved",
+    )
+
+    reranked = rerank("surveillance cameras", docs, budget_ms=1000)
+
+    # Fused with the retrieval rank, the match passes the second chunk while the
+    # first keeps its lead
+    assert [doc.page_content for doc, _ in reranked] == [
+        "the council met on tuesday",
+        "surveillance cameras ordinance approved",
+        "minutes of the meeting",
+    ]
+
+
+def test_batch_that_would_overrun_the_budget_is_not_started(use_scorer):
+    scorer = use_scorer(SlowScorer(0.06))
+    docs = candidates("a", "b", "c", "d")
+
+    # The first batch takes 60 ms, a second would end past the 100 ms budget
+    assert rerank("query", docs, budget_ms=100, batch_size=1) is docs
+    assert scorer.batches == 1
+    assert scorer.batch_seconds >= 0.06
+
+
+def test_measured_batch_time_carries_over_to_the_next_request(use_scorer):
+    scorer = use_scorer(SlowScorer(0.0))
+    scorer.batch_seconds = 0.5
+
+    docs = candidates("a", "b")
+    assert rerank("query", docs, budget_ms=300) is docs
+    assert scorer.batches == 0
+
+
+def test_scoring_error_keeps_retrieval_order(use_scorer):
+    scorer = use_scorer(SlowScorer(0.0))
+    scorer.score = lambda prepared, rows: 1 / 0
+    docs = candidates("a", "b")
+
+    assert rerank("query", docs) is docs
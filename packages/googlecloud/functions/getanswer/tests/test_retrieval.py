@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+from langchain_core.documents import Document
+
+import retrieval
+from retrieval import aretrieve_from_sources, retrieve_from_sources
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [1.0, 0.0]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+class FakeStore:
+    """Plain langchain-like store returning fixed results after a delay."""
+
+    def __init__(self, name, delay=0.0, error=None, embeddings=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.embeddings = embeddings or FakeEmbeddings()
+        self.vectors = []
+        self.threads = set()
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        self.vectors.append(embedding)
+        self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [(Document(page_content=f"{self.name} {i}"), float(i)) for i in range(k)]
+
+
+def test_searches_all_sources_concurrently():
+    stores = {name: FakeStore(name, delay=0.2) for name in ("fc", "cj", "pdf", "pc", "news")}
+
+    start = time.time()
+    retrieved, metrics = retrieve_from_sources(stores, "budget", k={"fc": 3})
+
+    # Five 200 ms searches in sequence would take a second
+    assert time.time() - start < 0.6
+    assert set(retrieved) == set(stores)
+    assert len(retrieved["fc"]) == 3
+    assert len(retrieved["cj"]) == retrieval.DEFAULT_K
+    assert all(metric["status"] == "ok" for metric in metrics.values())
+
+
+def test_timeouts_and_errors_only_drop_their_source():
+    stores = {
+        "fc": FakeStore("fc"),
+        "cj": FakeStore("cj", delay=1.0),
+        "pdf": FakeStore("pdf", error=RuntimeError("broken index")),
+    }
+
+    retrieved, metrics = retrieve_from_sources(stores, "budget", timeouts={"cj": 0.1})
+
+    assert retrieved["fc"]
+    assert retrieved["cj"] == [] and metrics["cj"]["status"] == "timeout"
+    assert retrieved["pdf"] == [] and metrics["pdf"]["status"] == "error"
+
+
+def test_query_is_embedded_once_for_all_sources():
+    embeddings = FakeEmbeddings()
+    stores = {name: FakeStore(name) for name in ("fc", "cj", "pdf")}
+
+    retrieve_from_sources(stores, "budget", embeddings=embeddings)
+
+    assert embeddings.queries == ["budget"]
+    assert all(store.vectors == [[1.0, 0.0]] for store in stores.values())
+    assert all(store.embeddings.queries == [] for store in stores.values())
+
+
+def test_defaults_to_the_embeddings_of_the_first_store():
+    stores = {name: FakeStore(name) for name in ("fc", "cj")}
+
+    retrieve_from_sources(stores, "budget")
+
+    assert stores["fc"].embeddings.queries == ["budget"]
+    assert stores["cj"].embeddings.queries == []
+
+
+def test_async_retrieval_matches_the_sync_contract():
+    embeddings = FakeEmbeddings()
+    stores = {
+        "fc": FakeStore("fc", delay=0.2),
+        "cj": FakeStore("cj", delay=0.2),
+        "pdf": FakeStore("pdf", delay=1.0),
+    }
+
+    start = time.time()
+    retrieved, metrics = asyncio.run(
+        aretrieve_from_sources(
+            stores, "budget", k={"fc": 2}, timeouts={"pdf": 0.3}, embeddings=embeddings
+        )
+    )
+
+    assert time.time() - start < 0.8
+    assert embeddings.queries == ["budget"]
+    assert len(retrieved["fc"]) == 2
+    assert metrics["cj"]["status"] == "ok"
+    assert retrieved["pdf"] == [] and metrics["pdf"]["status"] == "timeout"
+
+
+def test_precomputed_query_vector_is_not_embedded_again():
+    embeddings = FakeEmbeddings()
+    stores = {name: FakeStore(name) for name in ("fc", "cj")}
+
+    retrieve_from_sources(stores, "budget", embeddings=embeddings, query_vector=[0.0, 1.0])
+
+    assert embeddings.queries == []
+    assert all(store.vectors == [[0.0, 1.0]] for store in stores.values())
@@ -0,0 +1,97 @@
+import json
+from datetime import date
+
+import numpy as np
+import pytest
+
+from index_registry import SHARD_MANIFEST_FILE, ShardedFAISS, open_store
+from keyword_index import KEYWORD_INDEX_FILE
+
+SHARDS = {
+    # "drainage" is in every 2021 chunk, so it scores low there
+    "2021": [
+        "drainage contract approved",
+        "drainage pumps repaired",
+        "drainage fees discussed",
+        "drainage budget hearing",
+    ],
+    # and in two of six 2022 chunks, so it scores high there
+    "2022": [
+        "drainage contract deferred",
+        "drainage pumps inspected",
+        "street lights installed",
+        "police overtime report",
+        "zoning variance granted",
+        "budget hearing held",
+    ],
+}
+
+
+@pytest.fixture
+def sharded_store(tmp_path, save_store, keyword_arrays, embeddings):
+    folder = tmp_path.joinpath("fc")
+    entries = []
+    for name, texts in SHARDS.items():
+        shard_dir = save_store(f"fc/shards/{name}", texts)
+        np.savez(shard_dir.joinpath(KEYWORD_INDEX_FILE), **keyword_arrays(texts))
+        entries.append(
+            {
+                "name": name,
+                "path": f"shards/{name}",
+                "documents": len(texts),
+                "start": f"{name}-01-01",
+                "end": f"{name}-12-31",
+            }
+        )
+    folder.joinpath(SHARD_MANIFEST_FILE).write_text(json.dumps({"shards": entries}))
+    return open_store("fc", folder, embeddings)
+
+
+def loaded_shards(store):
+    return [entry["name"] for entry, shard in store.shards if shard.is_loaded]
+
+
+def test_open_store_reads_the_manifest(sharded_store):
+    assert isinstance(sharded_store, ShardedFAISS)
+    assert loaded_shards(sharded_store) == []
+
+
+def test_vector_search_merges_shards_nearest_first(sharded_store, embeddings):
+    results = sharded_store.vector_search(embeddings.embed_query("drainage"), k=10)
+
+    distances = [distance for _, distance in results]
+    assert len(results) == 10
+    assert distances == sorted(distances)
+
+
+def test_date_range_skips_other_shards(sharded_store, embeddings):
+    results = sharded_store.vector_search(
+        embeddings.embed_query("drainage"),
+        k=8,
+        date_range=(date(2022, 3, 1), date(2022, 4, 1)),
+    )
+
+    assert sorted(doc.page_content for doc, _ in results) == sorted(SHARDS["2022"])
+    assert loaded_shards(sharded_store) == ["2022"]
+
+
+def test_date_range_no_shard_covers_searches_all(sharded_store, embeddings):
+    results = sharded_store.vector_search(
+        embeddings.embed_query("drainage"),
+        k=10,
+        date_range=(date(2015, 1, 1), date(2015, 12, 31)),
+    )
+
+    assert len(results) == 10
+
+
+def test_keyword_search_merges_by_rank_within_shard(sharded_store):
+    results = sharded_store.keyword_search("drainage", k=2)
+
+    # By raw BM25 both 2022 matches would outrank every 2021 one; by rank within
+    # their shard, each shard's best match comes first
+    texts = [doc.page_content for doc, _ in results]
+    assert len([text for text in texts if text in SHARDS["2021"]]) == 1
+    assert len([text for text in texts if text in SHARDS["2022"]]) == 1
+    assert results[0][1] == results[1][1]
+    assert sharded_store.keyword_search("drainage", k=10)[-1][1] < results[0][1]
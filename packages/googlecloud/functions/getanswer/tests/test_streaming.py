@@ -0,0 +1,59 @@
+import threading
+import time
+
+from streaming import CoalescingWriter
+
+
+class RecordingWrite:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.texts = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, text):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.texts.append(text)
+            self.active -= 1
+
+
+def test_flushes_after_max_tokens_and_writes_the_final_text():
+    write = RecordingWrite()
+    writer = CoalescingWriter(write, interval_ms=60000, max_tokens=3)
+
+    for token in ["The ", "council ", "voted ", "yes", "."]:
+        writer.push(token)
+    writer.close()
+
+    assert write.texts == ["The council voted ", "The council voted yes."]
+    assert writer.flushes == 1
+
+
+def test_tokens_arriving_during_a_flush_are_coalesced():
+    write = RecordingWrite(delay=0.2)
+    writer = CoalescingWriter(write, interval_ms=0, max_tokens=1)
+
+    for i in range(20):
+        writer.push(f"{i} ")
+    writer.close("final")
+
+    # One flush was in flight while the other tokens arrived
+    assert writer.flushes == 1
+    assert write.max_active == 1
+    assert write.texts[-1] == "final"
+
+
+def test_drain_waits_for_the_last_flush_without_writing_again():
+    write = RecordingWrite(delay=0.1)
+    writer = CoalescingWriter(write, interval_ms=0, max_tokens=1)
+    writer.push("partial")
+
+    writer.drain()
+
+    # The caller writes the final result itself, together with the citations
+    assert write.texts == ["partial"]
@@ -1,4 +1,4 @@
-import { ECardStatus, ECardType, ICard } from "@/lib/api";
+import { ECardStatus, ECardType, EProcessingStatus, ICard } from "@/lib/api";
 import { APP_NAME } from "@/lib/copy";
 import { ABOUT_BETA_PATH, API_NEW_CARD_PATH } from "@/lib/paths";
 import { TABLES } from "@/lib/supabase/db";
@@ -31,6 +31,18 @@ function YouTubeThumbnail({ url }: { url: string }) {
   );
 }
 
+function isAnswered(card: ICard) {
+  // Queued questions report their progress. Otherwise the function only
+  // returns once the answer has been written to the card.
+  if (card.processing_status) {
+    return (
+      card.processing_status === EProcessingStatus.DONE ||
+      card.processing_status === EProcessingStatus.FAILED
+    );
+  }
+  return !!card.responses?.length;
+}
+
 export default function NewQuery() {
   const apiEndpoint = process.env.NEXT_PUBLIC_TGI_API_ENDPOINT!;
   const [query, setQuery] = useState("");
@@ -133,7 +145,7 @@ export default function NewQuery() {
           return;
         }
 
-        if (data && data.responses) {
+        if (data && isAnswered(data)) {
           setCard(data);
           addMyCard(data);
           clearInterval(interval);
@@ -12,6 +12,14 @@ export enum ECardStatus {
   ARCHIVED = "archived",
 }
 
+// Progress of a question answered from the getanswer job queue
+export enum EProcessingStatus {
+  QUEUED = "queued",
+  PROCESSING = "processing",
+  DONE = "done",
+  FAILED = "failed",
+}
+
 export type ICard = {
   id?: string;
   card_type: ECardType;
@@ -25,6 +33,7 @@ export type ICard = {
   // Only used client-side, because there aren't userIds for ownership
   is_mine?: boolean;
   processing_time_ms?: number;
+  processing_status?: EProcessingStatus | null;
 };
 
 export type IResponse = {
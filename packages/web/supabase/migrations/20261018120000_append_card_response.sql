@@ -0,0 +1,22 @@
+-- Append a response to a card and optionally set its citations and processing
+-- time in a single statement, so writers don't need to read the row first and
+-- concurrent appends can't overwrite each other.
+create or replace function "public"."append_card_response"(
+    "p_card_id" uuid,
+    "p_response" jsonb default null,
+    "p_citations" jsonb default null,
+    "p_processing_time_ms" integer default null
+)
+returns void
+language sql
+as $$
+    update "public"."cards"
+    set
+        "responses" = case
+            when p_response is null then "responses"
+            else "responses" || jsonb_build_array(p_response)
+        end,
+        "citations" = coalesce(p_citations, "citations"),
+        "processing_time_ms" = coalesce(p_processing_time_ms, "processing_time_ms")
+    where "id" = p_card_id;
+$$;
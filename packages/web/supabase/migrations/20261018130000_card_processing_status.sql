@@ -0,0 +1,3 @@
+-- Progress of the getanswer job for a card: queued, processing, done or failed.
+-- Kept apart from "status", which controls the card's visibility.
+alter table "public"."cards" add column "processing_status" text;
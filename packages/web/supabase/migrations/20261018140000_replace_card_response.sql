@@ -0,0 +1,22 @@
+-- Replace a card's responses with a single response and optionally set its
+-- citations and processing time in a single statement. Used while an answer is
+-- streamed into the card, where every write carries the full text so far.
+create or replace function "public"."replace_card_response"(
+    "p_card_id" uuid,
+    "p_response" jsonb default null,
+    "p_citations" jsonb default null,
+    "p_processing_time_ms" integer default null
+)
+returns void
+language sql
+as $$
+    update "public"."cards"
+    set
+        "responses" = case
+            when p_response is null then "responses"
+            else jsonb_build_array(p_response)
+        end,
+        "citations" = coalesce(p_citations, "citations"),
+        "processing_time_ms" = coalesce(p_processing_time_ms, "processing_time_ms")
+    where "id" = p_card_id;
+$$;